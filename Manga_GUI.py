@@ -1,41 +1,56 @@
-import os
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 import threading
+import queue
+import time
 import sys
-import zipfile
-import py7zr
-import re
-import shutil
+from Manga_profile import StageProfiler
+from Manga_worker import ProgressReporter, pack_worker, unpack_worker
 
-def natural_sort_key(s):
-    """
-    Sort strings with embedded numbers in natural order.
-    E.g. ["img1.jpg", "img10.jpg", "img2.jpg"] -> ["img1.jpg", "img2.jpg", "img10.jpg"]
-    """
-    return [int(c) if c.isdigit() else c for c in re.split(r'(\d+)', s)]
+# How often the GUI drains queued log output and progress events
+POLL_INTERVAL_MS = 100
+# Oldest log lines are dropped beyond this, so the Text widget stays responsive
+MAX_LOG_LINES = 5000
 
 class RedirectText:
-    """Class to redirect stdout to a tkinter Text widget"""
+    """Class to redirect stdout to a tkinter Text widget.
+
+    Writes from any thread are queued; the GUI flushes them in one insert per timer tick
+    instead of scheduling a callback for every print.
+    """
     def __init__(self, text_widget):
         self.text_widget = text_widget
-        self.buffer = ""
+        self.queue = queue.Queue()
 
     def write(self, string):
-        self.buffer += string
-        # Update the text widget in the main thread
-        self.text_widget.after(0, self.update_widget)
+        self.queue.put(string)
 
     def update_widget(self):
+        chunks = []
+        try:
+            while True:
+                chunks.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not chunks:
+            return
         self.text_widget.configure(state=tk.NORMAL)
-        self.text_widget.insert(tk.END, self.buffer)
+        self.text_widget.insert(tk.END, ''.join(chunks))
+        lines = int(self.text_widget.index('end-1c').split('.')[0])
+        if lines > MAX_LOG_LINES:
+            self.text_widget.delete('1.0', f'{lines - MAX_LOG_LINES + 1}.0')
         self.text_widget.see(tk.END)
         self.text_widget.configure(state=tk.DISABLED)
-        self.buffer = ""
 
     def flush(self):
         pass
 
+def _format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
 class MangaUtilityApp:
     def __init__(self, root):
         self.root = root
@@ -104,6 +119,34 @@ class MangaUtilityApp:
         # Unpack button
         ttk.Button(unpack_frame, text="Unpack Manga", command=self.unpack_manga).grid(column=0, row=4, sticky=tk.W, pady=10)
         
+        # === SETTINGS ===
+        settings_frame = ttk.Frame(main_frame)
+        settings_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(settings_frame, text="Memory cap in MB (optional):").pack(side=tk.LEFT)
+        self.memory_cap = tk.StringVar()
+        ttk.Entry(settings_frame, width=8, textvariable=self.memory_cap).pack(side=tk.LEFT, padx=(5, 0))
+        self.profile_stages = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Profile stages", variable=self.profile_stages).pack(side=tk.LEFT, padx=(15, 0))
+        self.optimize_pages = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Optimize pages (lossless)",
+                        variable=self.optimize_pages).pack(side=tk.LEFT, padx=(15, 0))
+        
+        # === PROGRESS ===
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.pack(fill=tk.X, pady=(5, 0))
+        
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate')
+        self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cancel_button = ttk.Button(progress_frame, text="Cancel", command=self.cancel_operation, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=(10, 0))
+        
+        self.progress_text = tk.StringVar(value="Idle")
+        ttk.Label(main_frame, textvariable=self.progress_text).pack(fill=tk.X)
+        
+        self.progress = None
+        self.worker = None
+        self._progress_state = None
+        
         # === OUTPUT LOG ===
         log_frame = ttk.LabelFrame(main_frame, text="Log", padding="10 10 10 10")
         log_frame.pack(fill=tk.BOTH, expand=True, pady=10)
@@ -122,6 +165,9 @@ class MangaUtilityApp:
         self.stdout_redirect = RedirectText(self.log_text)
         sys.stdout = self.stdout_redirect
         
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(POLL_INTERVAL_MS, self._poll)
+        
         print("Welcome to Manga Packer/Unpacker! Please select an operation.")
 
     def browse_pack_source(self):
@@ -153,6 +199,87 @@ class MangaUtilityApp:
         if directory:
             self.unpack_output_dir.set(directory)
     
+    def _poll(self):
+        """Flush queued log output and progress events, then re-arm the timer."""
+        self.stdout_redirect.update_widget()
+        if self.progress is not None:
+            try:
+                while True:
+                    self._handle_event(self.progress.events.get_nowait())
+            except queue.Empty:
+                pass
+        self._update_progress_text()
+        self.root.after(POLL_INTERVAL_MS, self._poll)
+    
+    def _handle_event(self, event):
+        state = self._progress_state
+        if event[0] == 'start':
+            state.update(total=event[1], start=time.perf_counter())
+            self.progress_bar.configure(maximum=max(event[1], 1), value=0)
+        elif event[0] == 'advance':
+            state['done'] += event[1]
+            state['bytes'] += event[2]
+            self.progress_bar.configure(value=state['done'])
+        elif event[0] == 'finish':
+            state.update(status=event[1], end=time.perf_counter())
+            self.cancel_button.configure(state=tk.DISABLED)
+    
+    def _update_progress_text(self):
+        state = self._progress_state
+        if state is None or state['start'] is None:
+            return
+        elapsed = (state['end'] or time.perf_counter()) - state['start']
+        pages_per_s = state['done'] / elapsed if elapsed > 0 else 0.0
+        mb_per_s = state['bytes'] / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+        text = f"{state['done']}/{state['total']} pages, {pages_per_s:.1f} pages/s, {mb_per_s:.1f} MB/s"
+        if state['status']:
+            text = f"{state['status'].capitalize()}: {text}, {_format_eta(elapsed)} elapsed"
+        elif pages_per_s > 0:
+            text += f", ETA {_format_eta((state['total'] - state['done']) / pages_per_s)}"
+        self.progress_text.set(text)
+    
+    def _start_worker(self, target, args):
+        """Run target(*args, progress) on a daemon thread; one operation at a time."""
+        if self.worker is not None and self.worker.is_alive():
+            messagebox.showerror("Error", "Another operation is still running.")
+            return
+        self.progress = ProgressReporter()
+        self._progress_state = {'total': 0, 'done': 0, 'bytes': 0, 'start': None, 'end': None, 'status': None}
+        self.progress_bar.configure(value=0)
+        self.progress_text.set("Starting...")
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.worker = threading.Thread(target=target, args=args + (self.progress,))
+        self.worker.daemon = True
+        self.worker.start()
+    
+    def _get_memory_cap(self):
+        """Memory cap in bytes, None if empty, or False after showing an error."""
+        value = self.memory_cap.get().strip()
+        if not value:
+            return None
+        if not value.isdigit() or int(value) == 0:
+            messagebox.showerror("Error", "The memory cap must be a whole number of MB.")
+            return False
+        return int(value) * 1024 * 1024
+    
+    def _get_profiler(self):
+        """StageProfiler with tracing if "Profile stages" is ticked, otherwise None."""
+        return StageProfiler(trace=True) if self.profile_stages.get() else None
+    
+    def cancel_operation(self):
+        if self.worker is not None and self.worker.is_alive():
+            print("Cancelling...")
+            self.progress.cancel()
+            self.cancel_button.configure(state=tk.DISABLED)
+    
+    def on_close(self):
+        # Give a running job the chance to remove its half-written archive
+        if self.worker is not None and self.worker.is_alive():
+            self.progress.cancel()
+            self.worker.join(timeout=5)
+        sys.stdout = sys.__stdout__
+        self.root.destroy()
+    
     def pack_manga(self):
         source_dir = self.pack_source_dir.get()
         output_file = self.pack_output_file.get()
@@ -162,75 +289,13 @@ class MangaUtilityApp:
             messagebox.showerror("Error", "Please select a source directory.")
             return
             
+        max_memory = self._get_memory_cap()
+        if max_memory is False:
+            return
+        
         # Start packing in a separate thread to avoid freezing the GUI
-        thread = threading.Thread(target=self._pack_thread, args=(source_dir, output_file, format_type))
-        thread.daemon = True
-        thread.start()
-    
-    def _pack_thread(self, source_dir, output_file, format_type):
-        try:
-            print(f"Packing manga from {source_dir}...")
-            
-            # Validate input directory
-            if not os.path.isdir(source_dir):
-                print(f"Error: '{source_dir}' is not a valid directory")
-                return
-            
-            # Get all JPG files
-            jpg_files = [f for f in os.listdir(source_dir) if f.lower().endswith(('.jpg', '.jpeg'))]
-            
-            if not jpg_files:
-                print(f"Error: No JPG images found in '{source_dir}'")
-                return
-            
-            # Sort files naturally
-            jpg_files.sort(key=natural_sort_key)
-            
-            # Determine output filename if not provided
-            if not output_file:
-                output_file = os.path.basename(os.path.normpath(source_dir))
-                
-                # Add extension if not present
-                if format_type == "cb7" and not output_file.lower().endswith('.cb7'):
-                    output_file += '.cb7'
-                elif format_type == "cbz" and not output_file.lower().endswith('.cbz'):
-                    output_file += '.cbz'
-            
-            if format_type == "cb7":
-                # Pack as CB7 with LZMA2 Ultra
-                print("Using 7z LZMA2 Ultra compression")
-                
-                # Create file paths dictionary
-                files_to_archive = {}
-                for jpg_file in jpg_files:
-                    file_path = os.path.join(source_dir, jpg_file)
-                    files_to_archive[os.path.basename(jpg_file)] = file_path
-                
-                # Create CB7 file with optimal settings
-                optimal_filters = [
-                    {
-                        'id': py7zr.FILTER_LZMA2,
-                        'preset': 9,
-                        'dict_size': 32 * 1024 * 1024  # 32MB is usually sufficient for manga
-                    }
-                ]
-                
-                with py7zr.SevenZipFile(output_file, 'w', filters=optimal_filters) as archive:
-                    archive.writeall(files_to_archive)
-                
-            else:
-                # Pack as CBZ with standard ZIP compression
-                print("Using standard ZIP compression")
-                
-                with zipfile.ZipFile(output_file, 'w', compression=zipfile.ZIP_DEFLATED) as zipf:
-                    for jpg_file in jpg_files:
-                        file_path = os.path.join(source_dir, jpg_file)
-                        zipf.write(file_path, arcname=os.path.basename(file_path))
-            
-            print(f"Successfully created '{output_file}' with {len(jpg_files)} images")
-            
-        except Exception as e:
-            print(f"Error packing manga: {str(e)}")
+        self._start_worker(pack_worker, (source_dir, output_file, format_type, max_memory, self._get_profiler(),
+                                        self.optimize_pages.get()))
     
     def unpack_manga(self):
         source_file = self.unpack_source_file.get()
@@ -240,120 +305,12 @@ class MangaUtilityApp:
             messagebox.showerror("Error", "Please select a source CBZ/CB7 file.")
             return
         
+        max_memory = self._get_memory_cap()
+        if max_memory is False:
+            return
+        
         # Start unpacking in a separate thread to avoid freezing the GUI
-        thread = threading.Thread(target=self._unpack_thread, args=(source_file, output_dir))
-        thread.daemon = True
-        thread.start()
-    
-    def _unpack_thread(self, source_file, output_dir):
-        try:
-            print(f"Unpacking manga from {source_file}...")
-            
-            # Validate input file
-            if not os.path.isfile(source_file):
-                print(f"Error: '{source_file}' is not a valid file")
-                return
-            
-            # Check if file is a CBZ or CB7
-            if source_file.lower().endswith('.cbz'):
-                archive_type = 'cbz'
-            elif source_file.lower().endswith('.cb7'):
-                archive_type = 'cb7'
-            else:
-                print(f"Error: '{source_file}' is not a CBZ or CB7 file")
-                return
-            
-            # Determine output directory if not provided
-            if not output_dir:
-                output_dir = os.path.splitext(source_file)[0]
-            
-            # Create output directory if it doesn't exist
-            os.makedirs(output_dir, exist_ok=True)
-            
-            if archive_type == 'cbz':
-                print(f"Extracting CBZ archive: {source_file}")
-                with zipfile.ZipFile(source_file, 'r') as zipf:
-                    # Get list of image files
-                    image_files = [f for f in zipf.namelist() 
-                                   if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))]
-                    
-                    # Check if there are directories in the archive
-                    directories = set()
-                    for path in image_files:
-                        if '/' in path or '\\' in path:
-                            dir_path = os.path.dirname(path)
-                            directories.add(dir_path)
-                    
-                    # Report directory structure if found
-                    if directories:
-                        print(f"Found {len(directories)} directories in the archive:")
-                        for dir_path in sorted(directories):
-                            print(f" - {dir_path}")
-                        print("All files will be extracted to the root output directory.")
-                    
-                    # Sort images naturally (considering filenames only, not paths)
-                    image_files.sort(key=lambda x: natural_sort_key(os.path.basename(x)))
-                    print(f"Found {len(image_files)} images to extract")
-                    
-                    # Extract each file - flatten directory structure
-                    for image in image_files:
-                        # Get just the filename without any directory structure
-                        image_filename = os.path.basename(image)
-                        
-                        # Extract the file data
-                        source = zipf.open(image)
-                        target_path = os.path.join(output_dir, image_filename)
-                        
-                        # Write the file to the output directory
-                        with open(target_path, "wb") as target:
-                            shutil.copyfileobj(source, target)
-                        
-                        source.close()
-                    
-                    print(f"Extracted {len(image_files)} images to '{output_dir}'")
-            
-            elif archive_type == 'cb7':
-                print(f"Extracting CB7 archive: {source_file}")
-                with py7zr.SevenZipFile(source_file, 'r') as archive:
-                    # Get list of all files in archive
-                    all_files = archive.getnames()
-                    
-                    # Filter for image files
-                    image_files = [f for f in all_files 
-                                  if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))]
-                    
-                    # Extract only images and flatten directory structure
-                    for image in image_files:
-                        # Extract to a temporary location
-                        archive.extract(path=output_dir, targets=[image])
-                        
-                        # Move from potential nested directory to root output dir
-                        source_path = os.path.join(output_dir, image)
-                        target_path = os.path.join(output_dir, os.path.basename(image))
-                        
-                        # If the file is in a subdirectory, move it to the root
-                        if os.path.dirname(image) and os.path.exists(source_path):
-                            shutil.move(source_path, target_path)
-                    
-                    # Clean up any empty directories created during extraction
-                    for root, dirs, files in os.walk(output_dir, topdown=False):
-                        for dir in dirs:
-                            dir_path = os.path.join(root, dir)
-                            if not os.listdir(dir_path):  # Check if directory is empty
-                                os.rmdir(dir_path)
-                    
-                    # Re-count files after flattening
-                    image_files = [f for f in os.listdir(output_dir) 
-                                  if os.path.isfile(os.path.join(output_dir, f)) and 
-                                  f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))]
-            
-            print(f"Successfully extracted all images to '{output_dir}'")
-            
-        except Exception as e:
-            print(f"Error unpacking manga: {str(e)}")
-            # Print more detailed error for debugging
-            import traceback
-            print(traceback.format_exc())
+        self._start_worker(unpack_worker, (source_file, output_dir, max_memory, self._get_profiler()))
 
 def main():
     root = tk.Tk()
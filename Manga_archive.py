@@ -0,0 +1,118 @@
+import os
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from Manga_profile import NO_PROFILER
+from Manga_scan import IMAGE_EXTENSIONS, is_page, natural_sort_key
+
+# Archive helpers that need only the standard library: format detection, page naming
+# and CBZ extraction. Manga_extract adds the CB7 side, which imports py7zr; ZIP-only
+# commands use this module so they never pay for loading it.
+
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+def is_image_file(name):
+    """Return True if the archive member or file name looks like a manga page."""
+    return is_page(name, IMAGE_EXTENSIONS)
+
+def archive_type_from_path(input_file):
+    """Return 'cbz' or 'cb7' based on the file extension, or None if unknown."""
+    if input_file.lower().endswith('.cbz'):
+        return 'cbz'
+    if input_file.lower().endswith('.cb7'):
+        return 'cb7'
+    return None
+
+def detect_archive_type(input_file):
+    """
+    Return 'cbz' for a ZIP container or 'cb7' for a 7z container, judged by the magic
+    bytes (Manga_packer.py writes 7z data into .cbz files). Falls back to the extension.
+    """
+    with open(input_file, 'rb') as f:
+        head = f.read(6)
+    if head[:4] in (b'PK\x03\x04', b'PK\x05\x06'):
+        return 'cbz'
+    if head == b'7z\xbc\xaf\x27\x1c':
+        return 'cb7'
+    return archive_type_from_path(input_file)
+
+def flatten_page_names(members):
+    """
+    Map image members to their flattened file names, in natural page order.
+    Directory structure inside the archive is dropped, so "ch1/001.jpg" becomes "001.jpg".
+    """
+    pages = [m for m in members if is_image_file(m)]
+    pages.sort(key=lambda x: natural_sort_key(os.path.basename(x.replace('\\', '/'))))
+    return [(m, os.path.basename(m.replace('\\', '/'))) for m in pages]
+
+def member_target_path(output_dir, member):
+    """Path a ZIP member extracts to under output_dir, without absolute or '..' parts."""
+    parts = [part for part in member.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    return os.path.join(output_dir, *parts)
+
+def extract_cbz_members(input_file, jobs, workers=None, progress_callback=None, profiler=None):
+    """
+    Extract members of a ZIP-based CBZ to the given paths on several threads at once.
+
+    zlib releases the GIL while inflating, so members are decompressed and written in
+    parallel, each thread reading through its own ZipFile handle. When several members
+    map to the same path the last one in jobs wins, as when extracting one by one.
+
+    Args:
+        input_file: Path to the CBZ file
+        jobs: List of (member name, target path) tuples, in natural order
+        workers: Number of threads (optional, defaults to the CPU count)
+        progress_callback: Called as progress_callback(done, total, filename) on the
+            calling thread as members finish. An exception raised from it cancels the
+            members not started yet.
+        profiler: StageProfiler timing the 'inflate' and 'write' stages (optional)
+
+    Returns:
+        Number of members written
+    """
+    last = {os.path.normcase(os.path.abspath(target)): i for i, (_, target) in enumerate(jobs)}
+    jobs = [job for i, job in enumerate(jobs) if last[os.path.normcase(os.path.abspath(job[1]))] == i]
+    profiler = profiler or NO_PROFILER
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def extract(member, target_path):
+        zipf = getattr(local, 'zipf', None)
+        if zipf is None:
+            zipf = local.zipf = zipfile.ZipFile(input_file, 'r')
+            with handles_lock:
+                handles.append(zipf)
+        parent = os.path.dirname(target_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with zipf.open(member) as source, open(target_path, 'wb') as target:
+            while True:
+                with profiler.stage('inflate') as span:
+                    chunk = source.read(_COPY_BUFFER_SIZE)
+                    span.nbytes = len(chunk)
+                if not chunk:
+                    break
+                with profiler.stage('write', len(chunk)):
+                    target.write(chunk)
+        return target_path
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    done = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(extract, member, target_path) for member, target_path in jobs]
+            try:
+                for future in as_completed(futures):
+                    target_path = future.result()
+                    done += 1
+                    if progress_callback:
+                        progress_callback(done, len(jobs), os.path.basename(target_path))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        for zipf in handles:
+            zipf.close()
+    return done
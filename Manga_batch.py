@@ -0,0 +1,299 @@
+import os
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from Manga_packer import pack_manga_to_7z
+from Manga_packer_cb7_ultra import pack_manga_to_cb7
+from Manga_dedup import PageIndex, drop_boilerplate, hash_pages
+from Manga_journal import DEFAULT_JOURNAL_NAME, JobJournal, input_signature, remove_stale_temp_files
+from Manga_incremental import list_pages, pack_manga_to_zip, pack_incremental
+from Manga_memory import lzma2_encoder_memory
+from Manga_pipeline import DEFAULT_BUFFER_SIZE
+from Manga_scan import find_leaf_dirs
+from Manga_tune import DEFAULT_CACHE_FILE, DEFAULT_TOLERANCE, add_tune_arguments, tune_volume
+
+PACKERS = {
+    'cbz': pack_manga_to_7z,
+    'cb7': pack_manga_to_cb7,
+    'zip': pack_manga_to_zip,
+}
+
+EXTENSIONS = {
+    'cbz': '.cbz',
+    'cb7': '.cb7',
+    'zip': '.cbz',
+}
+
+# LZMA2 preset 9 uses a 64MB dictionary, and the encoder needs roughly ten times that
+COMPRESSOR_MEMORY = lzma2_encoder_memory(64 * 1024 * 1024)
+# A zlib deflate stream needs a few hundred KB
+ZIP_COMPRESSOR_MEMORY = 1024 * 1024
+
+def find_chapter_dirs(library_root):
+    """
+    Find every leaf directory under library_root that contains JPG images.
+
+    Returns:
+        List of (directory, total image bytes) tuples in natural order
+    """
+    return find_leaf_dirs(library_root)
+
+def default_memory_budget():
+    """Half of the physical memory in bytes, or None if it cannot be determined."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def estimate_job_memory(input_bytes, format_type='cbz'):
+    """Rough upper bound of the memory one packing job of format_type keeps in flight."""
+    # Pages are streamed through the writer's read-ahead buffer, never held all at once
+    compressor = ZIP_COMPRESSOR_MEMORY if format_type == 'zip' else COMPRESSOR_MEMORY
+    return compressor + min(input_bytes, DEFAULT_BUFFER_SIZE)
+
+def output_path(chapter_dir, library_root, output_root, format_type):
+    """Archive path of a chapter: mirrored under output_root, or next to the chapter directory."""
+    if output_root:
+        relative = os.path.relpath(chapter_dir, library_root)
+        if relative == os.curdir:
+            relative = os.path.basename(os.path.normpath(library_root))
+        base = os.path.join(output_root, relative)
+    else:
+        base = os.path.normpath(chapter_dir)
+    return base + EXTENSIONS[format_type]
+
+def pack_chapter(chapter_dir, output_file, format_type, incremental=False, hash_content=False,
+                 drop_hashes=None, dedup=False, index_pages=False, settings=None):
+    """Worker entry point: pack one chapter directory and report its statistics."""
+    start = time.perf_counter()
+    parent = os.path.dirname(output_file)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    if incremental:
+        status = pack_incremental(chapter_dir, output_file, format_type, hash_content, drop_hashes, dedup, settings)
+        ok = status != 'failed'
+    else:
+        options = {'pages': drop_boilerplate(chapter_dir, drop_hashes) if drop_hashes else None}
+        if format_type != 'zip':
+            options['dedup'] = dedup
+        if settings is not None:
+            options['settings'] = settings
+        ok = PACKERS[format_type](chapter_dir, output_file, **options)
+        status = 'packed' if ok else 'failed'
+    result = {
+        'ok': bool(ok),
+        'status': status,
+        'bytes_out': os.path.getsize(output_file) if ok and os.path.isfile(output_file) else 0,
+        'seconds': time.perf_counter() - start,
+    }
+    if index_pages:
+        # Pages were just read for packing, so hashing them mostly hits the page cache
+        result['pages'] = hash_pages(chapter_dir, list_pages(chapter_dir))
+    return result
+
+def pack_library(library_root, output_root=None, format_type='cbz', workers=None, max_memory=None,
+                 incremental=False, hash_content=False, page_index=None, drop_boilerplate=False, dedup=False,
+                 tune=None, max_seconds=None, tolerance=DEFAULT_TOLERANCE, tune_cache=DEFAULT_CACHE_FILE,
+                 journal=None, resume=False):
+    """
+    Pack every chapter directory under library_root in parallel.
+
+    Args:
+        library_root: Root directory of the manga library
+        output_root: Directory to mirror the library into (optional, archives are
+            written next to each chapter directory by default)
+        format_type: 'cbz' (7z-compressed CBZ), 'cb7' or 'zip' (standard CBZ)
+        workers: Number of worker processes (optional, defaults to the CPU count)
+        max_memory: In-flight memory budget in bytes (optional, defaults to half
+            of physical memory). At least one job always runs.
+        incremental: Skip chapters whose archive manifest still matches, and update
+            standard CBZs member by member (see Manga_incremental)
+        hash_content: With incremental, compare page hashes when mtimes differ
+        page_index: Manga_dedup database to record the page hashes of every chapter in
+            (optional)
+        drop_boilerplate: Leave out the pages marked as boilerplate in page_index
+        dedup: Store identical pages next to each other in 7z formats
+        tune: With 'cb7', pick compression settings per series for this Manga_tune
+            target, 'ratio' or 'fast' (optional)
+        max_seconds, tolerance: See Manga_tune.choose_settings
+        tune_cache: JSON file caching the tuned settings per series
+        journal: Append-only file recording every finished and failed chapter (optional,
+            see Manga_journal). Archives are always written to a temporary file and
+            renamed into place, so an interrupted run leaves no truncated archives.
+        resume: Skip chapters the journal lists as done whose pages and archive are
+            unchanged since; the journal defaults to DEFAULT_JOURNAL_NAME in the output
+            root (or the library root)
+
+    Returns:
+        Summary dictionary with archive counts, byte totals and wall time
+    """
+    if format_type not in PACKERS:
+        raise ValueError(f"Unknown format '{format_type}'")
+    if tune and format_type != 'cb7':
+        raise ValueError("Tuning is only supported for the cb7 format")
+    if not os.path.isdir(library_root):
+        raise ValueError(f"'{library_root}' is not a valid directory")
+
+    workers = workers or os.cpu_count() or 1
+    if max_memory is None:
+        max_memory = default_memory_budget()
+
+    if resume and not journal:
+        journal = os.path.join(output_root or library_root, DEFAULT_JOURNAL_NAME)
+
+    start = time.perf_counter()
+    chapters = find_chapter_dirs(library_root)
+    summary = {
+        'chapters': len(chapters),
+        'archives': 0,
+        'skipped': 0,
+        'resumed': 0,
+        'failed': [],
+        'bytes_in': 0,
+        'bytes_out': 0,
+        'wall_seconds': 0.0,
+    }
+
+    index = None
+    log = None
+    try:
+        index = PageIndex(page_index) if page_index else None
+        drop_hashes = index.boilerplate_hashes() if index is not None and drop_boilerplate else None
+
+        pending = []
+        if journal:
+            log = JobJournal(journal)
+        for chapter_dir, input_bytes in chapters:
+            output_file = output_path(chapter_dir, library_root, output_root, format_type)
+            signature = input_signature(chapter_dir) if log is not None else None
+            if resume and log.is_done(os.path.abspath(chapter_dir), os.path.abspath(output_file), signature):
+                summary['resumed'] += 1
+                continue
+            if resume:
+                # Left over from the interrupted run
+                remove_stale_temp_files(output_file)
+            pending.append((chapter_dir, input_bytes, output_file, signature))
+        if summary['resumed']:
+            print(f"Resuming '{journal}': {summary['resumed']} chapters already done")
+        print(f"Found {len(chapters)} chapter directories, packing {len(pending)} with {workers} workers")
+
+        pending.reverse()
+        in_flight = {}
+        in_flight_memory = 0
+        done = summary['resumed']
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while pending or in_flight:
+                # Submit while there are free workers and room in the memory budget
+                while pending and len(in_flight) < workers:
+                    chapter_dir, input_bytes, output_file, signature = pending[-1]
+                    needed = estimate_job_memory(input_bytes, format_type)
+                    if in_flight and max_memory is not None and in_flight_memory + needed > max_memory:
+                        break
+                    pending.pop()
+                    # Tuned here rather than in the workers, so each series runs its trials
+                    # once and only this process writes the cache
+                    settings = None
+                    if tune:
+                        try:
+                            settings = tune_volume(chapter_dir, tune, max_seconds, tolerance, tune_cache)
+                        except (ValueError, OSError) as e:
+                            # The packer reports the chapter itself; it just gets the default settings
+                            print(f"Warning: could not tune '{chapter_dir}', using the default settings: {str(e)}")
+                    future = executor.submit(pack_chapter, chapter_dir, output_file, format_type,
+                                             incremental, hash_content, drop_hashes, dedup, index is not None,
+                                             settings)
+                    in_flight[future] = (chapter_dir, input_bytes, needed, output_file, signature)
+                    in_flight_memory += needed
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chapter_dir, input_bytes, needed, output_file, signature = in_flight.pop(future)
+                    in_flight_memory -= needed
+                    done += 1
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'ok': False, 'bytes_out': 0, 'error': str(e)}
+
+                    if index is not None and 'pages' in result:
+                        index.record(chapter_dir, result['pages'])
+                    if log is not None:
+                        item, output = os.path.abspath(chapter_dir), os.path.abspath(output_file)
+                        if result['ok'] and os.path.isfile(output):
+                            log.record_done(item, output, signature, format=format_type,
+                                            bytes_in=input_bytes, bytes_out=result['bytes_out'])
+                        else:
+                            log.record(item, 'failed', output=output, error=result.get('error', ''))
+                    if result.get('status') == 'skipped':
+                        summary['skipped'] += 1
+                    elif result['ok']:
+                        summary['archives'] += 1
+                        summary['bytes_in'] += input_bytes
+                        summary['bytes_out'] += result['bytes_out']
+                        print(f"[{done}/{len(chapters)}] Packed '{chapter_dir}'")
+                    else:
+                        summary['failed'].append(chapter_dir)
+                        print(f"[{done}/{len(chapters)}] Failed '{chapter_dir}' {result.get('error', '')}".rstrip())
+    finally:
+        if index is not None:
+            index.close()
+        if log is not None:
+            log.close()
+
+    summary['wall_seconds'] = time.perf_counter() - start
+    return summary
+
+def print_summary(summary):
+    mb_in = summary['bytes_in'] / (1024 * 1024)
+    mb_out = summary['bytes_out'] / (1024 * 1024)
+    ratio = summary['bytes_out'] / summary['bytes_in'] if summary['bytes_in'] else 0.0
+    speed = mb_in / summary['wall_seconds'] if summary['wall_seconds'] else 0.0
+    print(f"Archives created: {summary['archives']} of {summary['chapters']}")
+    if summary['skipped']:
+        print(f"Up to date: {summary['skipped']}")
+    if summary.get('resumed'):
+        print(f"Already done in the journal: {summary['resumed']}")
+    if summary['failed']:
+        print(f"Failed: {len(summary['failed'])}")
+        for chapter_dir in summary['failed']:
+            print(f" - {chapter_dir}")
+    print(f"Input: {mb_in:.1f} MB, output: {mb_out:.1f} MB (ratio {ratio:.3f})")
+    print(f"Wall time: {summary['wall_seconds']:.1f}s ({speed:.1f} MB/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack every chapter directory of a manga library in parallel.')
+    parser.add_argument('-i', '--input', required=True, help='Library root directory')
+    parser.add_argument('-o', '--output', help='Output root directory (optional, defaults to next to each chapter)')
+    parser.add_argument('-f', '--format', choices=sorted(PACKERS), default='cbz', help='Archive format (default: cbz)')
+    parser.add_argument('-j', '--workers', type=int, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--max-memory', type=int, help='In-flight memory budget in MB (default: half of RAM)')
+    parser.add_argument('--incremental', action='store_true', help='Skip chapters that did not change since the last run')
+    parser.add_argument('--hash', action='store_true', help='With --incremental, compare page contents when mtimes differ')
+    parser.add_argument('--index', metavar='DB', help='Record page hashes in this Manga_dedup index (optional)')
+    parser.add_argument('--drop-boilerplate', action='store_true',
+                        help='Leave out pages marked as boilerplate in the --index database')
+    parser.add_argument('--dedup', action='store_true', help='Store identical pages next to each other (cbz/cb7)')
+    add_tune_arguments(parser)
+    parser.add_argument('--journal', metavar='FILE',
+                        help='Record finished and failed chapters in this append-only journal (optional)')
+    parser.add_argument('--resume', action='store_true',
+                        help=f'Skip chapters the journal lists as done (default journal: {DEFAULT_JOURNAL_NAME} '
+                             'in the output or library root)')
+    args = parser.parse_args()
+    if args.drop_boilerplate and not args.index:
+        parser.error('--drop-boilerplate needs --index')
+
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+    try:
+        summary = pack_library(args.input, args.output, args.format, args.workers, max_memory,
+                               args.incremental, args.hash, args.index, args.drop_boilerplate, args.dedup,
+                               args.tune, args.max_seconds, args.tolerance / 100, args.tune_cache,
+                               args.journal, args.resume)
+    except Exception as e:
+        print(f"Error packing library: {str(e)}")
+        return
+    print_summary(summary)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from Manga_memory import peak_rss_bytes
+
+CASES = [
+    'pack_7z_cbz',
+    'pack_cb7',
+    'gui_pack_cbz',
+    'gui_pack_cb7',
+    'unpack_cbz',
+    'unpack_cb7',
+    'gui_unpack_cbz',
+    'gui_unpack_cb7',
+]
+
+# Relative drop in MB/s or growth in CPU time / peak RSS that counts as a regression
+DEFAULT_THRESHOLD = 0.10
+# Absolute growth in compression ratio that counts as a regression
+RATIO_TOLERANCE = 0.005
+
+def _jpeg_like_page(rng, size):
+    """High-entropy page, like the entropy-coded data of a JPEG scan."""
+    return b'\xff\xd8\xff\xe0' + rng.randbytes(size - 6) + b'\xff\xd9'
+
+def _png_like_page(rng, size):
+    """Low-entropy page, like raw line art: white rows broken by short runs of ink."""
+    width = 1024
+    rows = []
+    for _ in range(16):
+        row = bytearray(b'\xff' * width)
+        for _ in range(rng.randint(0, 12)):
+            start = rng.randrange(width)
+            length = rng.randint(1, 40)
+            row[start:start + length] = bytes([rng.randrange(256)]) * len(row[start:start + length])
+        rows.append(bytes(row))
+    data = bytearray(b'\x89PNG\r\n\x1a\n')
+    while len(data) < size:
+        data += rng.choice(rows)
+    return bytes(data[:size])
+
+def generate_corpus(root, volumes=4, seed=1234):
+    """
+    Generate a synthetic manga library under root, fully offline and reproducible.
+
+    Volumes alternate between JPEG-like and PNG-like pages, with varied page counts
+    and sizes. Every page is named .jpg, since the packers only pick up JPG files;
+    the content type is visible to magic-byte checks.
+
+    Returns:
+        List of volume directories
+    """
+    rng = random.Random(seed)
+    volume_dirs = []
+    for v in range(volumes):
+        volume_dir = os.path.join(root, f'volume_{v + 1:02d}')
+        os.makedirs(volume_dir, exist_ok=True)
+        make_page = _png_like_page if v % 2 else _jpeg_like_page
+        for p in range(rng.randint(12, 40)):
+            size = rng.randint(80, 600) * 1024
+            with open(os.path.join(volume_dir, f'page_{p + 1}.jpg'), 'wb') as f:
+                f.write(make_page(rng, size))
+        volume_dirs.append(volume_dir)
+    return volume_dirs
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+def _run_case(case, volume_dirs, archive_dir, work_dir):
+    """Run one benchmark case over every volume and return (bytes in, bytes out)."""
+    from Manga_packer import pack_manga_to_7z
+    from Manga_packer_cb7_ultra import pack_manga_to_cb7
+    from Manga_unpacker import unpack_manga_archive
+    from Manga_worker import pack_worker, unpack_worker
+
+    bytes_in = bytes_out = 0
+    for volume_dir in volume_dirs:
+        name = os.path.basename(volume_dir)
+        if 'unpack' in case:
+            archive = os.path.join(archive_dir, name + ('.cb7' if case.endswith('cb7') else '.cbz'))
+            output_dir = os.path.join(work_dir, case, name)
+            if case.startswith('gui_'):
+                unpack_worker(archive, output_dir)
+            else:
+                unpack_manga_archive(archive, output_dir)
+            if not os.path.isdir(output_dir) or not os.listdir(output_dir):
+                raise RuntimeError(f"{case} extracted nothing from '{archive}'")
+            bytes_in += os.path.getsize(archive)
+            bytes_out += _dir_size(output_dir)
+        else:
+            output_file = os.path.join(work_dir, case, name + ('.cb7' if case.endswith('cb7') else '.cbz'))
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            if case == 'pack_7z_cbz':
+                pack_manga_to_7z(volume_dir, output_file)
+            elif case == 'pack_cb7':
+                pack_manga_to_cb7(volume_dir, output_file)
+            else:
+                pack_worker(volume_dir, output_file, case[-3:])
+            # The entry points print errors instead of raising them
+            if not os.path.isfile(output_file):
+                raise RuntimeError(f"{case} did not create '{output_file}'")
+            bytes_in += _dir_size(volume_dir)
+            bytes_out += os.path.getsize(output_file)
+    return bytes_in, bytes_out
+
+def _case_worker(case, volume_dirs, archive_dir, work_dir, queue):
+    """Runs in a fresh process so that peak RSS belongs to this case alone."""
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        bytes_in, bytes_out = _run_case(case, volume_dirs, archive_dir, work_dir)
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - start_cpu
+        queue.put({
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'mb_per_s': bytes_in / (1024 * 1024) / wall if wall else 0.0,
+            # Always compressed size over uncompressed size
+            'ratio': (bytes_in / bytes_out if bytes_out else 0.0) if 'unpack' in case
+                     else (bytes_out / bytes_in if bytes_in else 0.0),
+            'peak_rss_bytes': peak_rss_bytes(),
+        })
+    except Exception as e:
+        queue.put({'error': str(e)})
+
+def run_benchmarks(cases=None, volumes=4, seed=1234, repeat=1):
+    """
+    Generate a corpus in a temporary directory and run each case in its own process.
+
+    For unpack cases MB/s is measured against the archive size and ratio is the
+    archive size over the extracted size. With repeat > 1 the fastest run is kept.
+
+    Returns:
+        Dictionary with run metadata and per-case results
+    """
+    from Manga_worker import pack_worker
+
+    cases = cases or CASES
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        volume_dirs = generate_corpus(os.path.join(tmp, 'corpus'), volumes, seed)
+
+        # Archives for the unpack cases, built with the GUI paths (real ZIP CBZ and CB7)
+        archive_dir = os.path.join(tmp, 'archives')
+        os.makedirs(archive_dir)
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            for volume_dir in volume_dirs:
+                for format_type in ('cbz', 'cb7'):
+                    output_file = os.path.join(archive_dir, os.path.basename(volume_dir) + '.' + format_type)
+                    pack_worker(volume_dir, output_file, format_type)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+        for case in cases:
+            best = None
+            for _ in range(repeat):
+                work_dir = os.path.join(tmp, 'work')
+                os.makedirs(work_dir, exist_ok=True)
+                queue = context.Queue()
+                process = context.Process(target=_case_worker, args=(case, volume_dirs, archive_dir, work_dir, queue))
+                process.start()
+                result = queue.get()
+                process.join()
+                shutil.rmtree(work_dir, ignore_errors=True)
+                if 'error' in result:
+                    best = result
+                    break
+                if best is None or result['wall_seconds'] < best['wall_seconds']:
+                    best = result
+            results[case] = best
+            print(f"{case}: " + (f"error {best['error']}" if 'error' in best else
+                                 f"{best['mb_per_s']:.1f} MB/s, ratio {best['ratio']:.4f}, "
+                                 f"{best['wall_seconds']:.2f}s wall, {best['cpu_seconds']:.2f}s CPU"))
+
+    try:
+        import py7zr
+        py7zr_version = py7zr.__version__
+    except (ImportError, AttributeError):
+        py7zr_version = None
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'py7zr': py7zr_version,
+            'cpu_count': os.cpu_count(),
+            'volumes': volumes,
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+def compare_results(old, new, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two benchmark runs.
+
+    Returns:
+        List of (case, metric, old value, new value) tuples for every regression
+    """
+    regressions = []
+    for case, new_result in new['results'].items():
+        old_result = old['results'].get(case)
+        if not old_result or 'error' in old_result:
+            continue
+        if 'error' in new_result:
+            regressions.append((case, 'error', None, new_result['error']))
+            continue
+        if new_result['mb_per_s'] < old_result['mb_per_s'] * (1 - threshold):
+            regressions.append((case, 'mb_per_s', old_result['mb_per_s'], new_result['mb_per_s']))
+        if new_result['cpu_seconds'] > old_result['cpu_seconds'] * (1 + threshold):
+            regressions.append((case, 'cpu_seconds', old_result['cpu_seconds'], new_result['cpu_seconds']))
+        if new_result['ratio'] > old_result['ratio'] + RATIO_TOLERANCE:
+            regressions.append((case, 'ratio', old_result['ratio'], new_result['ratio']))
+        old_rss = old_result.get('peak_rss_bytes')
+        new_rss = new_result.get('peak_rss_bytes')
+        if old_rss and new_rss and new_rss > old_rss * (1 + threshold):
+            regressions.append((case, 'peak_rss_bytes', old_rss, new_rss))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pack/unpack throughput, ratio and peak memory.')
+    parser.add_argument('-o', '--output', help='Write results as JSON to this file (optional)')
+    parser.add_argument('-c', '--case', action='append', choices=CASES, help='Case to run, can be repeated (default: all)')
+    parser.add_argument('--volumes', type=int, default=4, help='Number of synthetic volumes (default: 4)')
+    parser.add_argument('--seed', type=int, default=1234, help='Corpus random seed (default: 1234)')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per case, fastest is kept (default: 1)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative change that counts as a regression (default: 0.10)')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        regressions = compare_results(old, new, args.threshold)
+        for case, metric, old_value, new_value in regressions:
+            print(f"REGRESSION {case} {metric}: {old_value} -> {new_value}")
+        if not regressions:
+            print("No regressions found")
+        sys.exit(1 if regressions else 0)
+
+    report = run_benchmarks(args.case, args.volumes, args.seed, args.repeat)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote results to '{args.output}'")
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import os
+import time
+import sqlite3
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import py7zr
+from Manga_extract import detect_archive_type, flatten_page_names
+from Manga_policy import detect_image_type, image_dimensions
+from Manga_verify import find_archives
+
+try:
+    from py7zr.io import Py7zIO, WriterFactory
+except ImportError:  # py7zr < 1.0 has no writer factory
+    Py7zIO = WriterFactory = None
+
+DEFAULT_DATABASE = 'manga_catalog.db'
+# Enough of each page to get past EXIF and thumbnails to the JPEG frame header
+HEADER_BYTES = 256 * 1024
+# Archives written per transaction, so an interrupted update keeps most of its work
+_COMMIT_EVERY = 50
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS archives (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    format TEXT,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    page_count INTEGER NOT NULL DEFAULT 0,
+    uncompressed_bytes INTEGER NOT NULL DEFAULT 0,
+    blocks INTEGER,
+    indexed_at REAL NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    archive_id INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+    page_index INTEGER NOT NULL,
+    member TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    compressed_size INTEGER,
+    crc INTEGER,
+    method INTEGER,
+    header_offset INTEGER,
+    block INTEGER,
+    image_type TEXT,
+    width INTEGER,
+    height INTEGER,
+    PRIMARY KEY (archive_id, page_index)
+);
+'''
+
+_PAGE_COLUMNS = ('page_index', 'member', 'name', 'size', 'compressed_size', 'crc', 'method',
+                 'header_offset', 'block', 'image_type', 'width', 'height')
+
+class _HeaderSink(Py7zIO or object):
+    """Keeps only the first HEADER_BYTES of a decoded CB7 member."""
+    def __init__(self, name, headers):
+        self.name = name
+        self.headers = headers
+        self.chunks = []
+        self.kept = 0
+        self.written = 0
+
+    def write(self, s):
+        if self.kept < HEADER_BYTES:
+            chunk = bytes(s[:HEADER_BYTES - self.kept])
+            self.chunks.append(chunk)
+            self.kept += len(chunk)
+        self.written += len(s)
+        return len(s)
+
+    def read(self, size=None):
+        return b''
+
+    def seek(self, offset, whence=0):
+        return self.written
+
+    def flush(self):
+        pass
+
+    def size(self):
+        return self.written
+
+    def close(self):
+        self.headers[self.name] = b''.join(self.chunks)
+
+class _HeaderSinkFactory(WriterFactory or object):
+    def __init__(self):
+        self.headers = {}
+
+    def create(self, filename):
+        return _HeaderSink(filename, self.headers)
+
+def _page_record(index, member, size, header, **fields):
+    dimensions = image_dimensions(header) if header else None
+    record = dict.fromkeys(_PAGE_COLUMNS)
+    record.update(fields)
+    record.update(
+        page_index=index,
+        member=member,
+        name=os.path.basename(member.replace('\\', '/')),
+        size=size,
+        image_type=detect_image_type(header[:16]) if header else None,
+        width=dimensions[0] if dimensions else None,
+        height=dimensions[1] if dimensions else None,
+    )
+    return record
+
+def index_archive(path, read_dimensions=True):
+    """
+    Collect the catalog entry of one CBZ/CB7 file.
+
+    Sizes and CRCs come from the central directory / 7z header. Image dimensions are
+    read from the first bytes of each page: a CBZ only inflates those bytes, while a
+    solid CB7 has to be decoded once (skipped with read_dimensions=False).
+
+    Returns:
+        Dictionary with the archive fields and a 'pages' list in natural order
+    """
+    st = os.stat(path)
+    entry = {
+        'path': os.path.abspath(path),
+        'format': None,
+        'mtime_ns': st.st_mtime_ns,
+        'size': st.st_size,
+        'page_count': 0,
+        'uncompressed_bytes': 0,
+        'blocks': None,
+        'error': None,
+        'pages': [],
+    }
+    try:
+        entry['format'] = detect_archive_type(path)
+        if entry['format'] == 'cbz':
+            with zipfile.ZipFile(path, 'r') as zipf:
+                for index, (member, _) in enumerate(flatten_page_names(zipf.namelist())):
+                    info = zipf.getinfo(member)
+                    header = b''
+                    if read_dimensions:
+                        with zipf.open(info) as f:
+                            header = f.read(HEADER_BYTES)
+                    entry['pages'].append(_page_record(
+                        index, member, info.file_size, header, compressed_size=info.compress_size,
+                        crc=info.CRC, method=info.compress_type, header_offset=info.header_offset))
+        elif entry['format'] == 'cb7':
+            with py7zr.SevenZipFile(path, 'r') as archive:
+                infos = {info.filename: info for info in archive.list()}
+                folders = {}
+                block_of = {}
+                for f in archive.files:
+                    if f.folder is not None:
+                        block_of[f.filename] = folders.setdefault(id(f.folder), len(folders))
+                entry['blocks'] = len(folders)
+                pages = flatten_page_names(infos)
+                headers = {}
+                if read_dimensions and WriterFactory is not None and pages:
+                    factory = _HeaderSinkFactory()
+                    archive.extract(targets=[member for member, _ in pages], factory=factory)
+                    headers = factory.headers
+                for index, (member, _) in enumerate(pages):
+                    info = infos[member]
+                    entry['pages'].append(_page_record(
+                        index, member, info.uncompressed, headers.get(member, b''),
+                        crc=info.crc32, block=block_of.get(member)))
+        else:
+            raise ValueError("not a CBZ or CB7 file")
+    except Exception as e:
+        entry['error'] = str(e)
+        entry['pages'] = []
+    entry['page_count'] = len(entry['pages'])
+    entry['uncompressed_bytes'] = sum(page['size'] for page in entry['pages'])
+    return entry
+
+class MangaCatalog:
+    """
+    SQLite index of a manga library: one row per archive and one per page.
+
+    Archives are re-read only when their size or mtime changed since they were
+    indexed, so updating a large library after adding a few volumes takes seconds,
+    and queries never open an archive.
+
+    Args:
+        database: Path of the SQLite file (created if missing)
+    """
+    def __init__(self, database=DEFAULT_DATABASE):
+        self.database = database
+        self._db = sqlite3.connect(database)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def _store(self, entry):
+        self._db.execute('DELETE FROM archives WHERE path = ?', (entry['path'],))
+        cursor = self._db.execute(
+            'INSERT INTO archives (path, format, mtime_ns, size, page_count, uncompressed_bytes, blocks, '
+            'indexed_at, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (entry['path'], entry['format'], entry['mtime_ns'], entry['size'], entry['page_count'],
+             entry['uncompressed_bytes'], entry['blocks'], time.time(), entry['error']))
+        self._db.executemany(
+            f"INSERT INTO pages (archive_id, {', '.join(_PAGE_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' * len(_PAGE_COLUMNS))})",
+            [(cursor.lastrowid,) + tuple(page[c] for c in _PAGE_COLUMNS) for page in entry['pages']])
+
+    def update(self, library_root, workers=None, read_dimensions=True, report=print):
+        """
+        Bring the index up to date with the archives under library_root.
+
+        New and changed archives are read in parallel worker processes; archives that
+        disappeared from library_root are dropped from the index.
+
+        Args:
+            library_root: Directory to scan (or a single archive)
+            workers: Number of worker processes (optional, defaults to the CPU count)
+            read_dimensions: Read image sizes from page headers (decodes CB7 files)
+            report: Called with a line of output per indexed archive (optional)
+
+        Returns:
+            Dictionary with the number of archives scanned, indexed, unchanged,
+            removed and unreadable, and the seconds taken
+        """
+        start = time.perf_counter()
+        archives = [os.path.abspath(path) for path in find_archives(library_root)]
+        known = {row['path']: (row['mtime_ns'], row['size']) for row in self._db.execute(
+            'SELECT path, mtime_ns, size FROM archives')}
+
+        changed = []
+        for path in archives:
+            st = os.stat(path)
+            if known.get(path) != (st.st_mtime_ns, st.st_size):
+                changed.append(path)
+
+        root = os.path.abspath(library_root)
+        seen = set(archives)
+        removed = [path for path in known
+                   if path not in seen and (path == root or path.startswith(os.path.join(root, '')))]
+        with self._db:
+            self._db.executemany('DELETE FROM archives WHERE path = ?', [(path,) for path in removed])
+
+        summary = {'scanned': len(archives), 'indexed': 0, 'unchanged': len(archives) - len(changed),
+                   'removed': len(removed), 'errors': 0, 'seconds': 0.0}
+        if changed:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for n, entry in enumerate(executor.map(index_archive, changed, [read_dimensions] * len(changed),
+                                                       chunksize=4), 1):
+                    self._store(entry)
+                    if n % _COMMIT_EVERY == 0:
+                        self._db.commit()
+                    if entry['error']:
+                        summary['errors'] += 1
+                        report(f"ERROR    {entry['path']}: {entry['error']}")
+                    else:
+                        summary['indexed'] += 1
+                        report(f"Indexed  {entry['path']} ({entry['page_count']} pages)")
+            self._db.commit()
+        summary['seconds'] = time.perf_counter() - start
+        return summary
+
+    def lookup(self, path):
+        """
+        Return the index entry of an archive with its pages, or None if the archive
+        is not indexed or changed on disk since.
+        """
+        path = os.path.abspath(path)
+        row = self._db.execute('SELECT * FROM archives WHERE path = ?', (path,)).fetchone()
+        if row is None or row['error']:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if (st.st_mtime_ns, st.st_size) != (row['mtime_ns'], row['size']):
+            return None
+        entry = dict(row)
+        entry['pages'] = self.pages(path)
+        return entry
+
+    def pages(self, path):
+        """Page rows of an archive as dictionaries, in natural page order."""
+        return [dict(row) for row in self._db.execute(
+            'SELECT pages.* FROM pages JOIN archives ON archives.id = pages.archive_id '
+            'WHERE archives.path = ? ORDER BY page_index', (os.path.abspath(path),))]
+
+    def archives(self, pattern=None, format_type=None):
+        """Archive rows as dictionaries, optionally filtered by a path glob and format."""
+        query = 'SELECT * FROM archives WHERE 1 = 1'
+        args = []
+        if pattern:
+            query += ' AND path GLOB ?'
+            args.append(pattern)
+        if format_type:
+            query += ' AND format = ?'
+            args.append(format_type)
+        return [dict(row) for row in self._db.execute(query + ' ORDER BY path', args)]
+
+    def stats(self):
+        """Totals per format: archives, pages, bytes on disk and uncompressed bytes."""
+        return [dict(row) for row in self._db.execute(
+            'SELECT format, COUNT(*) AS archives, SUM(page_count) AS pages, SUM(size) AS bytes, '
+            'SUM(uncompressed_bytes) AS uncompressed_bytes FROM archives WHERE error IS NULL '
+            'GROUP BY format ORDER BY format')]
+
+def main():
+    parser = argparse.ArgumentParser(description='Index a manga library in SQLite and query the index.')
+    parser.add_argument('-d', '--database', default=DEFAULT_DATABASE,
+                        help=f'Catalog database file (default: {DEFAULT_DATABASE})')
+    parser.add_argument('-i', '--input', help='Library root to index or update (optional)')
+    parser.add_argument('-j', '--workers', type=int, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--no-dimensions', action='store_true',
+                        help='Skip reading image sizes (avoids decoding CB7 files)')
+    parser.add_argument('--stats', action='store_true', help='Show totals per format')
+    parser.add_argument('--list', nargs='?', const='*', metavar='GLOB', help='List archives, optionally matching a path glob')
+    parser.add_argument('-f', '--format', choices=['cbz', 'cb7'], help='Only list archives of this format')
+    parser.add_argument('--pages', metavar='ARCHIVE', help='List the pages of an archive')
+    args = parser.parse_args()
+
+    with MangaCatalog(args.database) as catalog:
+        if args.input:
+            summary = catalog.update(args.input, args.workers, not args.no_dimensions)
+            print(f"Scanned {summary['scanned']} archives: {summary['indexed']} indexed, "
+                  f"{summary['unchanged']} unchanged, {summary['removed']} removed, "
+                  f"{summary['errors']} unreadable ({summary['seconds']:.1f}s)")
+        if args.stats:
+            for row in catalog.stats():
+                print(f"{row['format']}: {row['archives']} archives, {row['pages']} pages, "
+                      f"{row['bytes'] / (1024 * 1024):.1f} MB on disk, "
+                      f"{row['uncompressed_bytes'] / (1024 * 1024):.1f} MB of pages")
+        if args.list:
+            for row in catalog.archives(args.list, args.format):
+                packed = time.strftime('%Y-%m-%d %H:%M', time.localtime(row['mtime_ns'] / 1e9))
+                print(f"{row['format'] or '?':3} {row['page_count']:5d} pages {row['size'] / (1024 * 1024):9.1f} MB "
+                      f"{packed}  {row['path']}" + (f"  ERROR {row['error']}" if row['error'] else ''))
+        if args.pages:
+            entry = catalog.lookup(args.pages)
+            if entry is None:
+                print(f"'{args.pages}' is not indexed or changed since it was indexed")
+                return
+            for page in entry['pages']:
+                size = f"{page['width']}x{page['height']}" if page['width'] else '?'
+                print(f"{page['page_index'] + 1:4d}: {page['name']} {page['image_type'] or '?'} {size} "
+                      f"{page['size']} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import os
+import lzma
+import time
+import zlib
+import struct
+import argparse
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import py7zr
+from Manga_journal import atomic_output
+from Manga_memory import BASE_MEMORY, fit_dict_size, lzma2_encoder_memory, read_page
+from Manga_profile import NO_PROFILER
+from Manga_scan import scan_dir
+
+# 7z property IDs used by the writer
+_END = 0x00
+_HEADER = 0x01
+_MAIN_STREAMS_INFO = 0x04
+_FILES_INFO = 0x05
+_PACK_INFO = 0x06
+_UNPACK_INFO = 0x07
+_SUBSTREAMS_INFO = 0x08
+_SIZE = 0x09
+_CRC = 0x0A
+_FOLDER = 0x0B
+_CODERS_UNPACK_SIZE = 0x0C
+_NUM_UNPACK_STREAM = 0x0D
+_EMPTY_STREAM = 0x0E
+_EMPTY_FILE = 0x0F
+_NAME = 0x11
+_MTIME = 0x14
+_ATTRIBUTES = 0x15
+
+_SIGNATURE = b'7z\xbc\xaf\x27\x1c'
+_LZMA2_CODER_ID = b'\x21'
+_FILETIME_EPOCH_OFFSET = 11644473600
+
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+
+def _write_number(value):
+    """Encode an integer in the variable-length 7z number format."""
+    first = 0
+    mask = 0x80
+    for i in range(8):
+        if value < (1 << (7 * (i + 1))):
+            first |= value >> (8 * i)
+            return bytes([first]) + value.to_bytes(8, 'little')[:i]
+        first |= mask
+        mask >>= 1
+    return bytes([first]) + value.to_bytes(8, 'little')
+
+def _lzma2_dict_size(dict_size):
+    """
+    Round a dictionary size up to one LZMA2 can describe.
+
+    Returns:
+        (rounded dictionary size, LZMA2 coder property byte)
+    """
+    for prop in range(40):
+        size = (2 | (prop & 1)) << (prop // 2 + 11)
+        if size >= dict_size:
+            return size, prop
+    return 0xFFFFFFFF, 40
+
+def split_into_blocks(files, block_size):
+    """
+    Group (name, path, size) entries into consecutive blocks of about block_size bytes.
+    Every block holds at least one page, so a page larger than block_size gets its own block.
+    """
+    blocks = []
+    current = []
+    current_size = 0
+    for entry in files:
+        if current and current_size + entry[2] > block_size:
+            blocks.append(current)
+            current = []
+            current_size = 0
+        current.append(entry)
+        current_size += entry[2]
+    if current:
+        blocks.append(current)
+    return blocks
+
+def _compress_block(block, preset, dict_size, profiler=NO_PROFILER):
+    """
+    Compress one block as an independent solid LZMA2 stream.
+    lzma releases the GIL while compressing, so blocks run in parallel in threads.
+    """
+    unpack_size = sum(entry[2] for entry in block)
+    dict_size, prop = _lzma2_dict_size(max(4096, min(dict_size, unpack_size)))
+    compressor = lzma.LZMACompressor(format=lzma.FORMAT_RAW,
+                                     filters=[{'id': lzma.FILTER_LZMA2, 'preset': preset, 'dict_size': dict_size}])
+    chunks = []
+    crcs = []
+    for name, path, size in block:
+        with profiler.stage('read', size):
+            data = read_page(path)
+        with profiler.stage('compress', size):
+            crcs.append(zlib.crc32(data))
+            chunks.append(compressor.compress(data))
+    with profiler.stage('compress'):
+        chunks.append(compressor.flush())
+    return b''.join(chunks), unpack_size, crcs, prop
+
+def _bit_vector(bits):
+    """Pack booleans into a 7z bit vector, most significant bit first."""
+    out = bytearray((len(bits) + 7) // 8)
+    for i, bit in enumerate(bits):
+        if bit:
+            out[i // 8] |= 0x80 >> (i % 8)
+    return bytes(out)
+
+def _build_header(folders, files):
+    """Build an uncompressed 7z header for the given folders and file entries."""
+    out = bytearray([_HEADER, _MAIN_STREAMS_INFO])
+
+    out += bytes([_PACK_INFO]) + _write_number(0) + _write_number(len(folders))
+    out += bytes([_SIZE])
+    for folder in folders:
+        out += _write_number(folder['pack_size'])
+    out += bytes([_END])
+
+    out += bytes([_UNPACK_INFO, _FOLDER]) + _write_number(len(folders)) + b'\x00'
+    for folder in folders:
+        # One coder, simple (1 in / 1 out), 1-byte id, with properties
+        out += _write_number(1) + bytes([0x20 | len(_LZMA2_CODER_ID)]) + _LZMA2_CODER_ID
+        out += _write_number(1) + bytes([folder['prop']])
+    out += bytes([_CODERS_UNPACK_SIZE])
+    for folder in folders:
+        out += _write_number(folder['unpack_size'])
+    out += bytes([_END])
+
+    out += bytes([_SUBSTREAMS_INFO, _NUM_UNPACK_STREAM])
+    for folder in folders:
+        out += _write_number(len(folder['sizes']))
+    out += bytes([_SIZE])
+    for folder in folders:
+        for size in folder['sizes'][:-1]:
+            out += _write_number(size)
+    out += bytes([_CRC, 1])
+    for folder in folders:
+        for crc in folder['crcs']:
+            out += struct.pack('<I', crc)
+    out += bytes([_END, _END])
+
+    out += bytes([_FILES_INFO]) + _write_number(len(files))
+    empty = [size == 0 for _, _, _, size in files]
+    if any(empty):
+        # Empty pages have no stream in any folder
+        vector = _bit_vector(empty)
+        out += bytes([_EMPTY_STREAM]) + _write_number(len(vector)) + vector
+        vector = _bit_vector([True] * sum(empty))
+        out += bytes([_EMPTY_FILE]) + _write_number(len(vector)) + vector
+    names = b''.join(name.encode('utf-16-le') + b'\x00\x00' for name, _, _, _ in files)
+    out += bytes([_NAME]) + _write_number(len(names) + 1) + b'\x00' + names
+    mtimes = b''.join(struct.pack('<Q', int((mtime + _FILETIME_EPOCH_OFFSET) * 10000000))
+                      for _, mtime, _, _ in files)
+    out += bytes([_MTIME]) + _write_number(len(mtimes) + 2) + b'\x01\x00' + mtimes
+    attributes = b''.join(struct.pack('<I', attr) for _, _, attr, _ in files)
+    out += bytes([_ATTRIBUTES]) + _write_number(len(attributes) + 2) + b'\x01\x00' + attributes
+    out += bytes([_END, _END])
+    return bytes(out)
+
+def write_multiblock_7z(output_file, files, block_size=DEFAULT_BLOCK_SIZE, workers=None,
+                        preset=9, dict_size=64 * 1024 * 1024, max_memory=None, profiler=None):
+    """
+    Write a 7z archive whose pages are split into independent solid LZMA2 blocks
+    (7z folders) that are compressed at the same time.
+
+    Args:
+        output_file: Path of the archive to create, only replaced once it is complete
+        files: List of (archive name, source path) tuples, in archive order
+        block_size: Uncompressed bytes per block
+        workers: Number of compression threads (optional, defaults to the CPU count)
+        preset: LZMA2 preset
+        dict_size: Maximum LZMA2 dictionary size, capped per block to the block size
+        max_memory: Memory cap in bytes (optional). Fewer blocks are compressed at
+            once, and the dictionary shrinks if even a single block would not fit.
+        profiler: StageProfiler timing the 'read', 'compress', 'wait', 'write' and
+            'finalize' stages (optional)
+
+    Returns:
+        Number of blocks written
+    """
+    profiler = profiler or NO_PROFILER
+    entries = []
+    file_info = []
+    for name, path in files:
+        st = os.stat(path)
+        if st.st_size:
+            entries.append((name, path, st.st_size))
+        # FILE_ATTRIBUTE_ARCHIVE plus the unix mode, like py7zr writes it
+        file_info.append((name, st.st_mtime, 0x20 | 0x8000 | (st.st_mode << 16), st.st_size))
+
+    workers = workers or os.cpu_count() or 1
+    if max_memory is not None:
+        # Each block in flight holds an encoder and up to a block of compressed output
+        dict_size = fit_dict_size(max_memory, min(dict_size, block_size), BASE_MEMORY + block_size)
+        per_block = lzma2_encoder_memory(dict_size) + block_size
+        workers = max(1, min(workers, (max_memory - BASE_MEMORY) // per_block))
+
+    blocks = split_into_blocks(entries, block_size)
+    folders = []
+    pending = deque()
+
+    def write_oldest():
+        block, future = pending.popleft()
+        with profiler.stage('wait'):
+            data, unpack_size, crcs, prop = future.result()
+        with profiler.stage('write', len(data)):
+            out.write(data)
+        folders.append({
+            'pack_size': len(data),
+            'unpack_size': unpack_size,
+            'prop': prop,
+            'sizes': [entry[2] for entry in block],
+            'crcs': crcs,
+        })
+
+    with atomic_output(output_file) as temp_file, open(temp_file, 'wb') as out, ThreadPoolExecutor(max_workers=workers) as executor:
+        out.write(b'\x00' * 32)  # Signature header, filled in at the end
+        # Blocks are written in order, so pack streams land in folder order; at most
+        # `workers` blocks are in flight so compressed output does not pile up
+        for block in blocks:
+            if len(pending) >= workers:
+                write_oldest()
+            pending.append((block, executor.submit(_compress_block, block, preset, dict_size, profiler)))
+        while pending:
+            write_oldest()
+
+        with profiler.stage('finalize'):
+            header = _build_header(folders, file_info)
+            next_header_offset = out.tell() - 32
+            out.write(header)
+
+            start_header = struct.pack('<QQI', next_header_offset, len(header), zlib.crc32(header))
+            out.seek(0)
+            out.write(_SIGNATURE + b'\x00\x04' + struct.pack('<I', zlib.crc32(start_header)) + start_header)
+    return len(blocks)
+
+def compare_block_sizes(input_dir, block_sizes, workers=None):
+    """
+    Pack input_dir once as the current single-block CB7 and once per block size,
+    and report the size and speed of each.
+
+    Returns:
+        List of result dictionaries (mode, blocks, bytes, ratio, seconds, MB/s)
+    """
+    pages = scan_dir(input_dir)
+    files = [(page.name, page.path) for page in pages]
+    input_bytes = sum(page.size for page in pages)
+    results = []
+
+    def record(mode, blocks, path, seconds):
+        size = os.path.getsize(path)
+        results.append({
+            'mode': mode,
+            'blocks': blocks,
+            'bytes': size,
+            'ratio': size / input_bytes if input_bytes else 0.0,
+            'seconds': seconds,
+            'mb_per_s': input_bytes / (1024 * 1024) / seconds if seconds else 0.0,
+        })
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'single.cb7')
+        start = time.perf_counter()
+        with py7zr.SevenZipFile(path, 'w', filters=[{'id': py7zr.FILTER_LZMA2, 'preset': 9}]) as archive:
+            for name, source in files:
+                archive.write(source, name)
+        record('single', 1, path, time.perf_counter() - start)
+
+        for block_size in block_sizes:
+            path = os.path.join(tmp, f'multi_{block_size}.cb7')
+            start = time.perf_counter()
+            blocks = write_multiblock_7z(path, files, block_size, workers)
+            record(f'{block_size // (1024 * 1024)}MB blocks', blocks, path, time.perf_counter() - start)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare single-block and parallel multi-block CB7 packing.')
+    parser.add_argument('-i', '--input', required=True, help='Directory containing JPG images')
+    parser.add_argument('-b', '--block-size', type=int, action='append',
+                        help='Block size in MB, can be given several times (default: 4, 16, 64)')
+    parser.add_argument('-j', '--workers', type=int, help='Number of compression threads (default: CPU count)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input):
+        print(f"Error: '{args.input}' is not a valid directory")
+        return
+
+    block_sizes = [mb * 1024 * 1024 for mb in (args.block_size or [4, 16, 64])]
+    for r in compare_block_sizes(args.input, block_sizes, args.workers):
+        print(f"{r['mode']:>14}: {r['blocks']:4d} blocks, {r['bytes'] / (1024 * 1024):8.2f} MB, "
+              f"ratio {r['ratio']:.4f}, {r['seconds']:6.2f}s, {r['mb_per_s']:6.1f} MB/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+# The packing and unpacking backends are imported inside the functions below, so a
+# command only loads what it needs: standard CBZs and ZIP extraction never import py7zr
+
+FORMATS = ('zip', 'cbz', 'cb7')
+EXTENSIONS = {
+    'zip': '.cbz',
+    'cbz': '.cbz',
+    'cb7': '.cb7',
+}
+
+def default_output(input_dir, format_type):
+    """Archive path the packers use when none is given: the folder name plus the format's extension."""
+    return os.path.basename(os.path.normpath(input_dir)) + EXTENSIONS[format_type]
+
+def pack(input_dir, output_file=None, format_type='cbz', max_memory=None):
+    """
+    Pack a chapter directory with the backend its format needs.
+
+    Args:
+        input_dir: Directory containing JPG images
+        output_file: Path of the archive (optional, see default_output)
+        format_type: 'zip' (standard CBZ, no py7zr), 'cbz' (7z-compressed CBZ) or 'cb7'
+        max_memory: Memory cap in bytes for the 7z formats (optional)
+
+    Returns:
+        True if the archive was written
+    """
+    if format_type not in FORMATS:
+        print(f"Error: Unknown format '{format_type}'")
+        return False
+    output_file = output_file or default_output(input_dir, format_type)
+    if format_type == 'cbz':
+        from Manga_packer import pack_manga_to_7z
+        return pack_manga_to_7z(input_dir, output_file, max_memory=max_memory)
+    if format_type == 'cb7':
+        from Manga_packer_cb7_ultra import pack_manga_to_cb7
+        return pack_manga_to_cb7(input_dir, output_file, max_memory=max_memory)
+
+    from Manga_incremental import list_pages, pack_manga_to_zip
+    if not os.path.isdir(input_dir):
+        print(f"Error: '{input_dir}' is not a valid directory")
+        return False
+    pages = list_pages(input_dir)
+    if not pages:
+        print(f"Error: No JPG images found in '{input_dir}'")
+        return False
+    try:
+        counts = pack_manga_to_zip(input_dir, output_file, pages)
+    except Exception as e:
+        print(f"Error creating archive: {str(e)}")
+        return False
+    print(f"Successfully created '{output_file}' with {counts['compressed']} images using ZIP compression")
+    return True
+
+def unpack(input_file, output_dir=None, max_memory=None, workers=None):
+    """
+    Unpack a CBZ/CB7 file, telling the two apart by their magic bytes rather than the
+    extension (Manga_packer.py writes 7z data into .cbz files).
+
+    Returns:
+        True if the archive was extracted
+    """
+    from Manga_unpacker import unpack_manga_archive
+    return unpack_manga_archive(input_file, output_dir, max_memory, workers)
+
+def _megabytes(value):
+    return int(value) * 1024 * 1024 if value else None
+
+def run_job(job):
+    """
+    Run one job given as a dictionary and describe its outcome.
+
+    Args:
+        job: {"command": "pack" or "unpack", "input": path, plus optionally "output",
+            "format" (pack), "max_memory" in MB, "workers" (unpack) and an "id" that
+            is echoed back}
+
+    Returns:
+        Result dictionary with id, command, ok, output and seconds (and error on failure)
+    """
+    start = time.perf_counter()
+    command = job.get('command')
+    result = {'id': job.get('id'), 'command': command}
+    try:
+        input_path = job.get('input')
+        if not input_path:
+            raise ValueError("Job has no input")
+        if command == 'pack':
+            format_type = job.get('format', 'cbz')
+            if format_type not in FORMATS:
+                raise ValueError(f"Unknown format '{format_type}'")
+            output = job.get('output') or default_output(input_path, format_type)
+            ok = pack(input_path, output, format_type, _megabytes(job.get('max_memory')))
+        elif command == 'unpack':
+            output = job.get('output') or os.path.splitext(input_path)[0]
+            ok = unpack(input_path, output, _megabytes(job.get('max_memory')), job.get('workers'))
+        else:
+            raise ValueError(f"Unknown command '{command}'")
+        result.update(ok=bool(ok), output=output)
+    except Exception as e:
+        result.update(ok=False, error=str(e))
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+def serve(lines, out, log=None):
+    """
+    Run jobs read as JSON lines, writing one JSON result line per job as it finishes.
+
+    The process stays warm between jobs, so interpreter startup and backend imports
+    are paid once for thousands of chapters. What the packers print is kept off out,
+    which only carries results, and is passed on to log instead.
+
+    Args:
+        lines: Iterable of JSON job lines (see run_job), e.g. sys.stdin
+        out: Text stream for the result lines, e.g. sys.stdout
+        log: Text stream for the jobs' own messages (optional, dropped without one)
+
+    Returns:
+        Number of jobs run
+    """
+    count = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError("a job must be a JSON object")
+        except ValueError as e:
+            result = {'id': None, 'ok': False, 'error': f"Invalid job: {str(e)}"}
+        else:
+            messages = io.StringIO()
+            with contextlib.redirect_stdout(messages):
+                result = run_job(job)
+            if log is not None:
+                log.write(messages.getvalue())
+                log.flush()
+            if not result['ok'] and 'error' not in result:
+                # The packers report failures by printing them
+                printed = [message for message in messages.getvalue().splitlines() if message.strip()]
+                result['error'] = printed[-1] if printed else 'failed'
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+        count += 1
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack and unpack manga archives from one entry point, '
+                                                 'loading only the backend each command needs.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pack_parser = subparsers.add_parser('pack', help='Pack a directory of JPG images')
+    pack_parser.add_argument('-i', '--input', required=True, help='Directory containing JPG images')
+    pack_parser.add_argument('-o', '--output', help='Output archive filename (optional)')
+    pack_parser.add_argument('-f', '--format', choices=FORMATS, default='cbz',
+                             help='zip: standard CBZ, cbz: 7z-compressed CBZ, cb7: CB7 (default: cbz)')
+    pack_parser.add_argument('--max-memory', type=int, help='Memory cap in MB (optional)')
+
+    unpack_parser = subparsers.add_parser('unpack', help='Unpack a CBZ/CB7 file, detected by its contents')
+    unpack_parser.add_argument('-i', '--input', required=True, help='Input CBZ/CB7 file')
+    unpack_parser.add_argument('-o', '--output', help='Output directory (optional)')
+    unpack_parser.add_argument('--max-memory', type=int, help='Memory cap in MB (optional)')
+    unpack_parser.add_argument('-j', '--workers', type=int,
+                               help='Threads extracting CBZ members at once (default: CPU count)')
+
+    serve_parser = subparsers.add_parser('serve', help='Run pack/unpack jobs read as JSON lines on stdin, '
+                                                       'writing a JSON result line per job to stdout')
+    serve_parser.add_argument('-q', '--quiet', action='store_true',
+                              help="Drop the jobs' own messages instead of writing them to stderr")
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        ok = pack(args.input, args.output, args.format, _megabytes(args.max_memory))
+    elif args.command == 'unpack':
+        ok = unpack(args.input, args.output, _megabytes(args.max_memory), args.workers)
+    else:
+        serve(sys.stdin, sys.stdout, None if args.quiet else sys.stderr)
+        ok = True
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+import os
+import time
+import sqlite3
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from Manga_scan import find_leaf_dirs, scan_names
+
+try:
+    from PIL import Image
+except ImportError:  # Perceptual hashes are optional
+    Image = None
+
+DEFAULT_DATABASE = 'manga_pages.db'
+_READ_CHUNK_SIZE = 1024 * 1024
+# Perceptual hashes are split into this many bands; two hashes within
+# PERCEPTUAL_BANDS - 1 bits of each other always share at least one band
+PERCEPTUAL_BANDS = 4
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    source TEXT NOT NULL REFERENCES sources(source) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    phash TEXT,
+    PRIMARY KEY (source, name)
+);
+CREATE INDEX IF NOT EXISTS pages_hash ON pages(hash);
+CREATE TABLE IF NOT EXISTS boilerplate (
+    hash TEXT PRIMARY KEY,
+    size INTEGER,
+    note TEXT
+);
+'''
+
+def page_hash(path):
+    """BLAKE2b-128 of a file as hex; fast enough to run at disk speed."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def perceptual_hash(path):
+    """
+    64-bit difference hash (dHash) of an image as hex, or None without Pillow.
+
+    Re-encoded or slightly resized copies of a page get hashes a few bits apart,
+    where page_hash would differ completely.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as img:
+            # JPEG can decode straight to a small greyscale image, far faster than full size
+            img.draft('L', (64, 64))
+            small = img.convert('L').resize((9, 8), Image.BILINEAR)
+            pixels = list(small.getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+def hash_pages(input_dir, names, perceptual=False):
+    """
+    Hash pages of a directory.
+
+    Returns:
+        List of {'name', 'size', 'hash', 'phash'} dictionaries in the order of names
+    """
+    records = []
+    for name in names:
+        path = os.path.join(input_dir, name)
+        records.append({
+            'name': name,
+            'size': os.path.getsize(path),
+            'hash': page_hash(path),
+            'phash': perceptual_hash(path) if perceptual else None,
+        })
+    return records
+
+def drop_boilerplate(input_dir, drop_hashes, names=None):
+    """
+    Leave out pages whose content hash is in drop_hashes, e.g. PageIndex.boilerplate_hashes().
+
+    Args:
+        input_dir: Chapter directory
+        drop_hashes: Set of page_hash values to leave out
+        names: Page file names (optional, the JPG images of input_dir by default)
+
+    Returns:
+        Page names that were kept, in their original order
+    """
+    if names is None:
+        names = scan_names(input_dir)
+    kept = []
+    dropped = []
+    for name in names:
+        (dropped if page_hash(os.path.join(input_dir, name)) in drop_hashes else kept).append(name)
+    if dropped:
+        print(f"Leaving out {len(dropped)} boilerplate pages of '{input_dir}': {', '.join(dropped)}")
+    return kept
+
+def duplicate_order(input_dir, names):
+    """
+    Reorder pages so every exact duplicate directly follows its first copy.
+
+    7z has no way to point two members at the same data, but in a solid LZMA2 stream
+    a page repeated right after itself can be encoded as matches of the previous one
+    and takes next to no space. Match distances are bounded by the dictionary, so this
+    only works for pages smaller than it: with a small dictionary (a --max-memory cap,
+    or tuned settings of 1-4 MB) a larger page is compressed again in full, and moving
+    it gains nothing.
+
+    Readers order pages by name, so the order of members in the archive does not
+    change the reading order. Sequential readers pay a little: Manga_transcode keeps
+    pages stored ahead of their turn in a reorder buffer bounded by its max_buffered.
+
+    Returns:
+        (reordered page names, number of duplicate pages)
+    """
+    groups = {}
+    for name in names:
+        groups.setdefault(page_hash(os.path.join(input_dir, name)), []).append(name)
+    ordered = [name for group in groups.values() for name in group]
+    return ordered, len(names) - len(groups)
+
+def _index_chapter(chapter_dir, perceptual):
+    """Worker entry point: hash the pages of one chapter directory."""
+    return chapter_dir, hash_pages(chapter_dir, scan_names(chapter_dir), perceptual)
+
+class PageIndex:
+    """
+    SQLite index of page content hashes across a library.
+
+    Each source (a chapter directory) is recorded with the hashes of its pages, so the
+    same credit, recruitment or blank page showing up in many chapters can be found and
+    marked as boilerplate for the packers to leave out.
+
+    Args:
+        database: Path of the SQLite file (created if missing)
+    """
+    def __init__(self, database=DEFAULT_DATABASE):
+        self.database = database
+        self._db = sqlite3.connect(database)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def record(self, source, records):
+        """Replace the pages recorded for source with records (see hash_pages)."""
+        source = os.path.abspath(source)
+        with self._db:
+            self._db.execute('DELETE FROM sources WHERE source = ?', (source,))
+            self._db.execute('INSERT INTO sources (source, indexed_at) VALUES (?, ?)', (source, time.time()))
+            self._db.executemany(
+                'INSERT INTO pages (source, name, size, hash, phash) VALUES (?, ?, ?, ?, ?)',
+                [(source, r['name'], r['size'], r['hash'], r['phash']) for r in records])
+
+    def index_library(self, library_root, workers=None, perceptual=False, report=print):
+        """
+        Hash every chapter directory under library_root in parallel worker processes.
+
+        Returns:
+            Number of chapters indexed
+        """
+        chapters = [chapter_dir for chapter_dir, _ in find_leaf_dirs(library_root)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for n, (chapter_dir, records) in enumerate(
+                    executor.map(_index_chapter, chapters, [perceptual] * len(chapters), chunksize=4), 1):
+                self.record(chapter_dir, records)
+                report(f"[{n}/{len(chapters)}] Indexed '{chapter_dir}' ({len(records)} pages)")
+        return len(chapters)
+
+    def duplicates(self, min_sources=2, limit=None):
+        """
+        Pages whose exact content appears in at least min_sources chapters.
+
+        Returns:
+            List of dictionaries with hash, size, copies, sources and wasted bytes,
+            most wasted bytes first
+        """
+        query = ('SELECT hash, MAX(size) AS size, COUNT(*) AS copies, COUNT(DISTINCT source) AS sources, '
+                 "MIN(source || '/' || name) AS example FROM pages GROUP BY hash "
+                 'HAVING COUNT(DISTINCT source) >= ? ORDER BY (COUNT(*) - 1) * MAX(size) DESC')
+        args = [min_sources]
+        if limit:
+            query += ' LIMIT ?'
+            args.append(limit)
+        rows = [dict(row) for row in self._db.execute(query, args)]
+        for row in rows:
+            row['wasted_bytes'] = (row['copies'] - 1) * row['size']
+        return rows
+
+    def similar(self, max_distance=PERCEPTUAL_BANDS - 1):
+        """
+        Groups of pages whose perceptual hashes are at most max_distance bits apart but
+        whose exact content differs, e.g. the same credit page saved at another quality.
+
+        Only pages sharing a band of their perceptual hash are compared, which is
+        exhaustive for max_distance below PERCEPTUAL_BANDS.
+
+        Returns:
+            List of lists of (source, name) tuples
+        """
+        phashes = {}
+        for row in self._db.execute('SELECT source, name, hash, phash FROM pages WHERE phash IS NOT NULL'):
+            phashes.setdefault(int(row['phash'], 16), []).append((row['source'], row['name'], row['hash']))
+        width = 64 // PERCEPTUAL_BANDS
+        buckets = {}
+        for value in phashes:
+            for band in range(PERCEPTUAL_BANDS):
+                buckets.setdefault((band, (value >> (band * width)) & ((1 << width) - 1)), []).append(value)
+
+        # Union-find over perceptual hashes within max_distance of each other
+        parent = {value: value for value in phashes}
+
+        def find(value):
+            while parent[value] != value:
+                parent[value] = parent[parent[value]]
+                value = parent[value]
+            return value
+
+        for values in buckets.values():
+            for i, a in enumerate(values):
+                for b in values[i + 1:]:
+                    if bin(a ^ b).count('1') <= max_distance:
+                        parent[find(a)] = find(b)
+        groups = {}
+        for value, pages in phashes.items():
+            groups.setdefault(find(value), []).extend(pages)
+        return [[(source, name) for source, name, _ in pages] for pages in groups.values()
+                if len({content for _, _, content in pages}) > 1]
+
+    def mark_boilerplate(self, hashes, note=None):
+        """Mark content hashes as boilerplate; returns how many were new."""
+        before = self._db.total_changes
+        with self._db:
+            for content in hashes:
+                row = self._db.execute('SELECT MAX(size) FROM pages WHERE hash = ?', (content,)).fetchone()
+                self._db.execute('INSERT OR IGNORE INTO boilerplate (hash, size, note) VALUES (?, ?, ?)',
+                                 (content, row[0], note))
+        return self._db.total_changes - before
+
+    def mark_common(self, min_sources):
+        """Mark every page found in at least min_sources chapters as boilerplate."""
+        return self.mark_boilerplate([row['hash'] for row in self.duplicates(min_sources)],
+                                     f"in {min_sources}+ chapters")
+
+    def unmark_boilerplate(self, hashes):
+        with self._db:
+            self._db.executemany('DELETE FROM boilerplate WHERE hash = ?', [(content,) for content in hashes])
+
+    def boilerplate(self):
+        """Boilerplate entries as dictionaries with hash, size, note and one example page."""
+        return [dict(row) for row in self._db.execute(
+            "SELECT boilerplate.*, (SELECT source || '/' || name FROM pages WHERE pages.hash = boilerplate.hash "
+            "LIMIT 1) AS example FROM boilerplate ORDER BY hash")]
+
+    def boilerplate_hashes(self):
+        return {row[0] for row in self._db.execute('SELECT hash FROM boilerplate')}
+
+def main():
+    parser = argparse.ArgumentParser(description='Find pages repeated across a manga library and mark boilerplate.')
+    parser.add_argument('-d', '--database', default=DEFAULT_DATABASE,
+                        help=f'Page index database file (default: {DEFAULT_DATABASE})')
+    parser.add_argument('-i', '--input', help='Library root to index (optional)')
+    parser.add_argument('-j', '--workers', type=int, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--perceptual', action='store_true', help='Also store perceptual hashes (needs Pillow)')
+    parser.add_argument('--duplicates', type=int, nargs='?', const=2, metavar='N',
+                        help='Report pages found in at least N chapters (default: 2)')
+    parser.add_argument('--similar', type=int, nargs='?', const=PERCEPTUAL_BANDS - 1, metavar='BITS',
+                        help='Report near-identical pages by perceptual hash (default: 3 bits apart)')
+    parser.add_argument('--mark', nargs='+', metavar='IMAGE', help='Mark these page files as boilerplate')
+    parser.add_argument('--mark-common', type=int, metavar='N', help='Mark pages found in at least N chapters as boilerplate')
+    parser.add_argument('--unmark', nargs='+', metavar='HASH', help='Remove hashes from the boilerplate list')
+    parser.add_argument('--boilerplate', action='store_true', help='List the boilerplate pages')
+    parser.add_argument('--limit', type=int, default=50, help='Maximum rows in reports (default: 50)')
+    args = parser.parse_args()
+
+    if args.perceptual and Image is None:
+        print("Warning: Pillow is not installed, perceptual hashes are skipped")
+    with PageIndex(args.database) as index:
+        if args.input:
+            start = time.perf_counter()
+            count = index.index_library(args.input, args.workers, args.perceptual)
+            print(f"Indexed {count} chapters in {time.perf_counter() - start:.1f}s")
+        if args.duplicates:
+            rows = index.duplicates(args.duplicates, args.limit)
+            for row in rows:
+                print(f"{row['hash']} {row['copies']:5d} copies in {row['sources']:5d} chapters, "
+                      f"{row['wasted_bytes'] / (1024 * 1024):8.2f} MB repeated  e.g. {row['example']}")
+            print(f"{len(rows)} repeated pages, "
+                  f"{sum(row['wasted_bytes'] for row in rows) / (1024 * 1024):.1f} MB in extra copies")
+        if args.similar is not None:
+            for group in index.similar(args.similar)[:args.limit]:
+                print(f"{len(group)} similar pages:")
+                for source, name in group:
+                    print(f" - {os.path.join(source, name)}")
+        if args.mark:
+            added = index.mark_boilerplate([page_hash(path) for path in args.mark], 'marked by hand')
+            print(f"Marked {added} pages as boilerplate")
+        if args.mark_common:
+            added = index.mark_common(args.mark_common)
+            print(f"Marked {added} pages as boilerplate")
+        if args.unmark:
+            index.unmark_boilerplate(args.unmark)
+        if args.boilerplate:
+            for row in index.boilerplate():
+                print(f"{row['hash']} {row['size'] or 0:9d} bytes  {row['note'] or ''}  {row['example'] or ''}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import os
+import zipfile
+import argparse
+import shutil
+import py7zr
+# The py7zr-free helpers live in Manga_archive and are re-exported for existing callers
+from Manga_archive import (archive_type_from_path, detect_archive_type, extract_cbz_members, flatten_page_names,
+                           is_image_file, member_target_path)
+from Manga_memory import BASE_MEMORY, lzma2_decoder_memory
+
+try:
+    from py7zr.io import Py7zIO, WriterFactory
+except ImportError:  # py7zr < 1.0 has no writer factory
+    Py7zIO = WriterFactory = None
+
+class _PageFileWriter(Py7zIO or object):
+    """Writes one decoded CB7 member straight to its flattened target file."""
+    def __init__(self, target_path, on_close):
+        self.target_path = target_path
+        self.on_close = on_close
+        self.fileobj = open(target_path, 'wb')
+        self.written = 0
+
+    def write(self, s):
+        self.written += len(s)
+        return self.fileobj.write(s)
+
+    def read(self, size=None):
+        return b''
+
+    def seek(self, offset, whence=0):
+        return self.fileobj.seek(offset, whence)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def size(self):
+        return self.written
+
+    def close(self):
+        if not self.fileobj.closed:
+            self.fileobj.close()
+            self.on_close(self.target_path, self.written)
+
+class _PageFileFactory(WriterFactory or object):
+    """Hands py7zr a writer per member so the solid stream is decoded only once."""
+    def __init__(self, targets, output_dir, on_close):
+        self.targets = targets
+        self.output_dir = output_dir
+        self.on_close = on_close
+        self.writers = []
+
+    def create(self, filename):
+        writer = _PageFileWriter(os.path.join(self.output_dir, self.targets[filename]), self.on_close)
+        self.writers.append(writer)
+        return writer
+
+class _MemoryPageWriter(Py7zIO or object):
+    """Collects one decoded CB7 member in memory."""
+    def __init__(self):
+        self.chunks = []
+        self.written = 0
+
+    def write(self, s):
+        self.chunks.append(bytes(s))
+        self.written += len(s)
+        return len(s)
+
+    def read(self, size=None):
+        return b''
+
+    def seek(self, offset, whence=0):
+        return self.written
+
+    def flush(self):
+        pass
+
+    def size(self):
+        return self.written
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+class _MemoryPageFactory(WriterFactory or object):
+    def __init__(self):
+        self.products = {}
+
+    def create(self, filename):
+        self.products[filename] = _MemoryPageWriter()
+        return self.products[filename]
+
+def read_cb7_members(archive, targets):
+    """
+    Decode the given members of an open py7zr archive into memory in one pass.
+    The archive is reset afterwards so it can be read again.
+
+    Returns:
+        Dictionary of member name to bytes
+    """
+    try:
+        if WriterFactory is not None:
+            factory = _MemoryPageFactory()
+            archive.extract(targets=list(targets), factory=factory)
+            return {name: writer.getvalue() for name, writer in factory.products.items()}
+        return {name: data.read() for name, data in archive.read(list(targets)).items()}
+    finally:
+        archive.reset()
+
+def page_windows(pages, sizes, max_buffered):
+    """Split pages into consecutive runs whose total size fits in max_buffered."""
+    window = []
+    window_size = 0
+    for member in pages:
+        if window and window_size + sizes[member] > max_buffered:
+            yield window
+            window = []
+            window_size = 0
+        window.append(member)
+        window_size += sizes[member]
+    if window:
+        yield window
+
+def _lzma2_dict_size(prop):
+    if prop >= 40:
+        return 0xFFFFFFFF
+    return (2 | (prop & 1)) << (prop // 2 + 11)
+
+def cb7_decoder_memory(archive):
+    """Memory needed to decode the largest solid block of an open CB7, from its coder properties."""
+    main = archive.header.main_streams
+    largest = 0
+    for folder in (main.unpackinfo.folders if main is not None else []):
+        for coder in folder.coders:
+            props = coder.get('properties') or b''
+            if coder['method'] == b'\x21' and props:
+                largest = max(largest, _lzma2_dict_size(props[0]))
+            elif coder['method'] == b'\x03\x01\x01' and len(props) >= 5:
+                largest = max(largest, int.from_bytes(props[1:5], 'little'))
+    return lzma2_decoder_memory(largest) if largest else 0
+
+class _SequentialSevenZipFile(py7zr.SevenZipFile):
+    """py7zr only decodes blocks in parallel when it opened the file by name itself."""
+    def __init__(self, input_file):
+        super().__init__(open(input_file, 'rb'), 'r')
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.fp.close()
+
+def open_cb7(input_file, max_memory=None):
+    """
+    Open a CB7 for reading with decoding kept within max_memory (bytes, optional).
+
+    py7zr decodes the blocks of a multi-block archive on up to one thread per CPU,
+    each with its own dictionary. When that would not fit in the cap the archive is
+    opened so that blocks are decoded one after another instead.
+    """
+    archive = py7zr.SevenZipFile(input_file, 'r')
+    if max_memory is None:
+        return archive
+    main = archive.header.main_streams
+    folders = main.unpackinfo.numfolders if main is not None else 0
+    per_block = cb7_decoder_memory(archive)
+    if BASE_MEMORY + per_block > max_memory:
+        print(f"Warning: '{input_file}' needs {(BASE_MEMORY + per_block) / (1024 * 1024):.0f} MB "
+              f"to decode, more than the {max_memory / (1024 * 1024):.0f} MB cap")
+    if folders > 1 and BASE_MEMORY + min(folders, os.cpu_count() or 1) * per_block > max_memory:
+        archive.close()
+        return _SequentialSevenZipFile(input_file)
+    return archive
+
+def extract_archive_pages(input_file, output_dir, archive_type=None, progress_callback=None, max_memory=None,
+                          workers=None):
+    """
+    Extract every image of a CBZ/CB7 file into output_dir in a single pass.
+
+    Pages are written directly to their flattened names, so no files are moved and no
+    empty directories are left behind. Solid CB7 archives are decoded once from start
+    to end instead of once per page.
+
+    Args:
+        input_file: Path to the CBZ/CB7 file
+        output_dir: Directory to write the images to (created if missing)
+        archive_type: 'cbz' or 'cb7' (optional, detected from the magic bytes)
+        progress_callback: Called as progress_callback(done, total, filename) after each page
+        max_memory: Memory cap in bytes for CB7 decoding (optional, see open_cb7)
+        workers: Number of extraction threads for CBZ files (optional, defaults to the
+            CPU count, see extract_cbz_members)
+
+    Returns:
+        Number of images written
+    """
+    if archive_type is None:
+        archive_type = detect_archive_type(input_file)
+    if archive_type not in ('cbz', 'cb7'):
+        raise ValueError(f"'{input_file}' is not a CBZ or CB7 file")
+
+    os.makedirs(output_dir, exist_ok=True)
+    done = [0]
+
+    def page_done(target_path, size):
+        done[0] += 1
+        if progress_callback:
+            progress_callback(done[0], total, os.path.basename(target_path))
+
+    if archive_type == 'cbz':
+        with zipfile.ZipFile(input_file, 'r') as zipf:
+            pages = flatten_page_names(zipf.namelist())
+        return extract_cbz_members(input_file,
+                                   [(member, os.path.join(output_dir, filename)) for member, filename in pages],
+                                   workers, progress_callback)
+
+    with open_cb7(input_file, max_memory) as archive:
+        # Pages whose flattened names collide are written once, the last one winning as
+        # in extract_cbz_members, so total counts the files actually written
+        last = {os.path.normcase(filename): (member, filename)
+                for member, filename in flatten_page_names(archive.getnames())}
+        targets = dict(last.values())
+        total = len(targets)
+        if not targets:
+            return 0
+        if WriterFactory is not None:
+            factory = _PageFileFactory(targets, output_dir, page_done)
+            try:
+                archive.extract(targets=list(targets), factory=factory)
+            finally:
+                # Make sure no handle stays open if py7zr stopped midway
+                for writer in factory.writers:
+                    writer.close()
+        else:
+            # read() still decodes the stream only once on older py7zr, but holds every
+            # page it returns in memory, so under a cap pages are read in windows
+            windows = [list(targets)]
+            if max_memory is not None:
+                sizes = {info.filename: info.uncompressed for info in archive.list()}
+                windows = page_windows(list(targets), sizes, max(1, (max_memory - BASE_MEMORY) // 2))
+            for window in windows:
+                for member, data in archive.read(window).items():
+                    target_path = os.path.join(output_dir, targets[member])
+                    with open(target_path, 'wb') as target:
+                        shutil.copyfileobj(data, target)
+                    page_done(target_path, target.tell())
+                archive.reset()
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract CBZ/CB7 pages in a single pass with flattened names.')
+    parser.add_argument('-i', '--input', required=True, help='Input CBZ/CB7 file')
+    parser.add_argument('-o', '--output', help='Output directory (optional)')
+    parser.add_argument('--max-memory', type=int, help='Memory cap in MB (optional)')
+    parser.add_argument('-j', '--workers', type=int, help='Extraction threads for CBZ files (default: CPU count)')
+    args = parser.parse_args()
+
+    output_dir = args.output or os.path.splitext(args.input)[0]
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+    try:
+        count = extract_archive_pages(args.input, output_dir,
+                                      progress_callback=lambda done, total, name: print(f"[{done}/{total}] {name}"),
+                                      max_memory=max_memory, workers=args.workers)
+        print(f"Successfully extracted {count} images to '{output_dir}'")
+    except Exception as e:
+        print(f"Error extracting archive: {str(e)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import hashlib
+import zipfile
+import shutil
+import argparse
+from Manga_journal import atomic_output
+from Manga_policy import CompressionPolicy, DEFLATE
+from Manga_scan import scan_names
+from Manga_zipcopy import copy_member_raw
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = '.manifest.json'
+
+def manifest_path(archive_path):
+    """The manifest is kept next to the archive as <archive>.manifest.json."""
+    return archive_path + MANIFEST_SUFFIX
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def list_pages(input_dir):
+    """JPG pages of input_dir in natural order, as the packers see them."""
+    return scan_names(input_dir)
+
+def build_manifest(input_dir, pages, format_type, hash_content=False, previous=None):
+    """
+    Describe the source pages of an archive.
+
+    Args:
+        input_dir: Chapter directory
+        pages: Page file names in archive order
+        format_type: Archive format the manifest belongs to
+        hash_content: Store a SHA-256 of every page
+        previous: Earlier manifest whose hashes are reused for pages with the same
+            size and mtime, so unchanged pages are not hashed again (optional)
+    """
+    known = {}
+    if previous:
+        known = {f['name']: f for f in previous.get('files', [])}
+    files = []
+    for name in pages:
+        st = os.stat(os.path.join(input_dir, name))
+        entry = {'name': name, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        if hash_content:
+            old = known.get(name)
+            if old and old.get('sha256') and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+                entry['sha256'] = old['sha256']
+            else:
+                entry['sha256'] = _hash_file(os.path.join(input_dir, name))
+        files.append(entry)
+    return {'version': MANIFEST_VERSION, 'format': format_type, 'files': files}
+
+def load_manifest(archive_path):
+    """Return the stored manifest of an archive, or None if missing or unreadable."""
+    try:
+        with open(manifest_path(archive_path), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def save_manifest(archive_path, manifest):
+    st = os.stat(archive_path)
+    manifest = dict(manifest, archive={'size': st.st_size, 'mtime_ns': st.st_mtime_ns})
+    with atomic_output(manifest_path(archive_path)) as temp_file, open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+
+def _same_page(old, new):
+    if old['name'] != new['name'] or old['size'] != new['size']:
+        return False
+    if old['mtime_ns'] == new['mtime_ns']:
+        return True
+    # Touched but possibly identical: only the content hash can tell
+    return bool(old.get('sha256')) and old.get('sha256') == new.get('sha256')
+
+def archive_matches(manifest, archive_path):
+    """True if the archive exists and is the one the manifest was written for (same size and mtime)."""
+    try:
+        st = os.stat(archive_path)
+    except OSError:
+        return False
+    archive = manifest.get('archive', {})
+    return archive.get('size') == st.st_size and archive.get('mtime_ns') == st.st_mtime_ns
+
+def manifest_matches(old, new, archive_path):
+    """True if the archive exists, is the one the manifest was written for, and the pages are unchanged."""
+    if not old or old.get('format') != new['format'] or not archive_matches(old, archive_path):
+        return False
+    if len(old['files']) != len(new['files']):
+        return False
+    return all(_same_page(a, b) for a, b in zip(old['files'], new['files']))
+
+def pack_manga_to_zip(input_dir, output_file, pages=None, previous=None, manifest=None):
+    """
+    Pack JPG pages into a standard ZIP-based CBZ, reusing members of an earlier build.
+
+    Members whose page is unchanged since the previous manifest are copied raw from
+    the existing archive; only new or changed pages are compressed. If the only change
+    is pages added at the end, they are appended to a copy of the existing archive.
+    Either way output_file is only replaced once the new archive is complete. If
+    output_file was replaced since the previous manifest was saved, its members are
+    not trusted and every page is compressed again.
+
+    Args:
+        input_dir: Directory containing JPG images
+        output_file: Path of the CBZ file
+        pages: Page file names in archive order (optional, listed from input_dir)
+        previous: Manifest of the existing output_file (optional)
+        manifest: Manifest of the current pages (optional, needed with previous)
+
+    Returns:
+        Dictionary with the number of pages copied and compressed
+    """
+    if pages is None:
+        pages = list_pages(input_dir)
+    reusable = set()
+    if previous and manifest and archive_matches(previous, output_file) and zipfile.is_zipfile(output_file):
+        old_by_name = {f['name']: f for f in previous['files']}
+        for entry in manifest['files']:
+            old = old_by_name.get(entry['name'])
+            if old and _same_page(old, entry):
+                reusable.add(entry['name'])
+
+    policy = CompressionPolicy(baseline=DEFLATE)
+    old_names = [f['name'] for f in previous['files']] if reusable else []
+    if old_names and pages[:len(old_names)] == old_names and reusable.issuperset(old_names):
+        # Pages were only added at the end: append them to the archive as it is. Appending
+        # rewrites the central directory, so it is done on a copy a crash cannot truncate
+        with atomic_output(output_file) as temp_file:
+            shutil.copyfile(output_file, temp_file)
+            with zipfile.ZipFile(temp_file, 'a', compression=zipfile.ZIP_DEFLATED) as zipf:
+                for name in pages[len(old_names):]:
+                    path = os.path.join(input_dir, name)
+                    zipf.write(path, arcname=name, compress_type=policy.zip_method(path))
+        return {'copied': len(old_names), 'compressed': len(pages) - len(old_names)}
+
+    copied = 0
+    with atomic_output(output_file) as temp_file:
+        with zipfile.ZipFile(temp_file, 'w', compression=zipfile.ZIP_DEFLATED) as zipf:
+            source = zipfile.ZipFile(output_file, 'r') if reusable else None
+            try:
+                for name in pages:
+                    if source is not None and name in reusable and name in source.NameToInfo:
+                        copy_member_raw(source, source.getinfo(name), zipf)
+                        copied += 1
+                    else:
+                        path = os.path.join(input_dir, name)
+                        zipf.write(path, arcname=name, compress_type=policy.zip_method(path))
+            finally:
+                if source is not None:
+                    source.close()
+    return {'copied': copied, 'compressed': len(pages) - copied}
+
+def pack_incremental(input_dir, output_file, format_type='zip', hash_content=False, drop_hashes=None, dedup=False,
+                     settings=None):
+    """
+    Pack a chapter directory only if it changed since its archive was built.
+
+    Args:
+        input_dir: Directory containing JPG images
+        output_file: Path of the archive
+        format_type: 'zip' (standard CBZ, updated member by member), 'cbz'
+            (7z-compressed CBZ) or 'cb7'; 7z formats are rebuilt when anything changed
+        hash_content: Also compare SHA-256 hashes of pages whose mtime changed
+        drop_hashes: Content hashes of boilerplate pages to leave out (optional, see Manga_dedup)
+        dedup: Store identical pages next to each other in 7z formats
+        settings: CB7 compression settings from Manga_tune.tune_volume (optional)
+
+    Returns:
+        'skipped', 'updated', 'packed' or 'failed'
+    """
+    if not os.path.isdir(input_dir):
+        print(f"Error: '{input_dir}' is not a valid directory")
+        return 'failed'
+    pages = list_pages(input_dir)
+    if drop_hashes:
+        # Manga_dedup loads Pillow and sqlite3, which a plain CBZ build never needs
+        from Manga_dedup import drop_boilerplate
+        pages = drop_boilerplate(input_dir, drop_hashes, pages)
+    if not pages:
+        print(f"Error: No JPG images found in '{input_dir}'")
+        return 'failed'
+
+    previous = load_manifest(output_file)
+    manifest = build_manifest(input_dir, pages, format_type, hash_content, previous)
+    if manifest_matches(previous, manifest, output_file):
+        if manifest['files'] != previous['files']:
+            # Pages were touched but not changed: record the new mtimes
+            save_manifest(output_file, manifest)
+        print(f"Skipping '{input_dir}', '{output_file}' is up to date")
+        return 'skipped'
+
+    existed = os.path.isfile(output_file)
+    try:
+        if format_type == 'zip':
+            counts = pack_manga_to_zip(input_dir, output_file, pages,
+                                       previous if existed else None, manifest)
+            print(f"Wrote '{output_file}': {counts['copied']} pages reused, "
+                  f"{counts['compressed']} compressed")
+        else:
+            # The 7z packers load py7zr, so standard CBZ builds leave them unimported
+            if format_type == 'cb7':
+                from Manga_packer_cb7_ultra import pack_manga_to_cb7
+                ok = pack_manga_to_cb7(input_dir, output_file, pages=pages, dedup=dedup, settings=settings)
+            else:
+                from Manga_packer import pack_manga_to_7z
+                ok = pack_manga_to_7z(input_dir, output_file, pages=pages, dedup=dedup)
+            if not ok:
+                return 'failed'
+    except Exception as e:
+        print(f"Error packing '{input_dir}': {str(e)}")
+        return 'failed'
+
+    save_manifest(output_file, manifest)
+    return 'updated' if existed else 'packed'
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack a manga chapter only if it changed since the last build.')
+    parser.add_argument('-i', '--input', required=True, help='Directory containing JPG images')
+    parser.add_argument('-o', '--output', help='Output archive filename (optional)')
+    parser.add_argument('-f', '--format', choices=['zip', 'cbz', 'cb7'], default='zip',
+                        help='zip: standard CBZ, cbz: 7z-compressed CBZ, cb7: CB7 (default: zip)')
+    parser.add_argument('--hash', action='store_true', help='Compare page contents when mtimes differ')
+    args = parser.parse_args()
+
+    output_file = args.output or os.path.basename(os.path.normpath(args.input))
+    extension = '.cb7' if args.format == 'cb7' else '.cbz'
+    if not output_file.lower().endswith(extension):
+        output_file += extension
+
+    start = time.perf_counter()
+    result = pack_incremental(args.input, output_file, args.format, args.hash)
+    print(f"{result.capitalize()} in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
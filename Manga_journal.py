@@ -0,0 +1,198 @@
+import os
+import glob
+import json
+import time
+import hashlib
+import argparse
+from contextlib import contextmanager
+from Manga_scan import scan_dir
+
+JOURNAL_VERSION = 1
+DEFAULT_JOURNAL_NAME = '.manga_batch.journal'
+
+def fsync_directory(directory):
+    """Flush a directory entry to disk, so a rename in it survives a power loss (no-op on Windows)."""
+    try:
+        fd = os.open(directory or os.curdir, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+@contextmanager
+def atomic_output(path):
+    """
+    Write a file under a temporary name and move it into place only once it is complete.
+
+    Yields the temporary path, next to path so the final rename stays on one file
+    system. When the block finishes, the file is fsynced and renamed over path; if
+    it raises, or the process is killed, path is left as it was, so a crash never
+    leaves a truncated archive that looks valid to later runs.
+
+    Args:
+        path: Final path of the file
+    """
+    temp_file = f"{path}.{os.getpid()}.tmp"
+    try:
+        yield temp_file
+        with open(temp_file, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+        fsync_directory(os.path.dirname(path))
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+def remove_stale_temp_files(path):
+    """
+    Remove the temporary files atomic_output left next to path when a run was killed.
+
+    Returns:
+        Number of files removed
+    """
+    removed = 0
+    for temp_file in glob.glob(glob.escape(path) + '.*.tmp'):
+        try:
+            os.remove(temp_file)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+def input_signature(directory):
+    """
+    Fingerprint of the pages of a directory: a hash of every name, size and mtime.
+
+    It changes whenever a page is added, removed, replaced or touched, without
+    reading any page data.
+    """
+    digest = hashlib.sha1()
+    for entry in scan_dir(directory):
+        digest.update(f"{entry.name}\0{entry.size}\0{entry.mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def read_journal(path):
+    """
+    Read a journal without opening it for writing.
+
+    Returns:
+        (latest record of each item, False if the last line was cut short)
+    """
+    entries = {}
+    line = '\n'
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and record.get('version') == JOURNAL_VERSION and 'item' in record:
+                    entries[record['item']] = record
+    except OSError:
+        pass
+    return entries, line.endswith('\n')
+
+def status_counts(entries):
+    """Number of items per status, by their latest record."""
+    counts = {}
+    for record in entries.values():
+        counts[record['status']] = counts.get(record['status'], 0) + 1
+    return counts
+
+class JobJournal:
+    """
+    Append-only log of the items a batch job finished or failed, one JSON line each.
+
+    Every record is flushed and fsynced as it is written, so after a crash or kill
+    the journal holds everything that completed; a line cut short by the crash is
+    ignored when the journal is read back. The last record of an item wins.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries, complete = read_journal(path)
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        if not complete:
+            # End the line a crash cut short, so the next record starts on its own line
+            self._file.write('\n')
+
+    def record(self, item, status, **info):
+        """
+        Append the outcome of an item.
+
+        Args:
+            item: Key of the item, e.g. the chapter directory
+            status: 'done' or 'failed'
+            **info: Further JSON-serializable details (output path, input signature, ...)
+        """
+        record = {'version': JOURNAL_VERSION, 'item': item, 'status': status, 'time': time.time()}
+        record.update(info)
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.entries[item] = record
+
+    def record_done(self, item, output_file, signature, **info):
+        """Record a finished item along with the size and mtime of the archive it wrote."""
+        st = os.stat(output_file)
+        self.record(item, 'done', output=output_file, input=signature,
+                    archive={'size': st.st_size, 'mtime_ns': st.st_mtime_ns}, **info)
+
+    def is_done(self, item, output_file, signature):
+        """
+        True if the item finished in an earlier run and its result is still current:
+        same inputs, and the archive it wrote has not been replaced or removed since.
+        """
+        record = self.entries.get(item)
+        if not record or record.get('status') != 'done' or record.get('input') != signature:
+            return False
+        if record.get('output') != output_file:
+            return False
+        try:
+            st = os.stat(output_file)
+        except OSError:
+            return False
+        archive = record.get('archive', {})
+        return archive.get('size') == st.st_size and archive.get('mtime_ns') == st.st_mtime_ns
+
+    def counts(self):
+        """Number of items per status, by their latest record."""
+        return status_counts(self.entries)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the state of a batch job journal.')
+    parser.add_argument('journal', help='Journal file written by Manga_batch --journal/--resume')
+    parser.add_argument('--failed', action='store_true', help='List the items whose latest attempt failed')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.journal):
+        print(f"Error: '{args.journal}' does not exist")
+        return
+    # Read only: a journal a running job is appending to is left untouched
+    entries, _ = read_journal(args.journal)
+    counts = status_counts(entries)
+    print(f"{len(entries)} items: {counts.get('done', 0)} done, {counts.get('failed', 0)} failed")
+    if args.failed:
+        for item, record in sorted(entries.items()):
+            if record['status'] == 'failed':
+                print(f" - {item} {record.get('error', '')}".rstrip())
+
+if __name__ == "__main__":
+    main()
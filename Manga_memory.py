@@ -0,0 +1,123 @@
+import os
+import sys
+import mmap
+import argparse
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Pages at least this large are memory-mapped instead of copied into the heap
+MMAP_THRESHOLD = 1024 * 1024
+MIN_DICT_SIZE = 1024 * 1024
+MIN_BUFFER_SIZE = 4 * 1024 * 1024
+# Interpreter, py7zr and the bookkeeping of a large volume
+BASE_MEMORY = 64 * 1024 * 1024
+
+# LZMA2 dictionary size of each preset, as liblzma defines them
+PRESET_DICT_SIZES = [
+    256 * 1024, 1024 * 1024, 2 * 1024 * 1024, 4 * 1024 * 1024, 4 * 1024 * 1024,
+    8 * 1024 * 1024, 8 * 1024 * 1024, 16 * 1024 * 1024, 32 * 1024 * 1024, 64 * 1024 * 1024,
+]
+
+def lzma2_encoder_memory(dict_size):
+    """Upper bound of the memory an LZMA2 encoder uses (about 674 MB for a 64 MB dictionary)."""
+    return dict_size * 21 // 2 + 8 * 1024 * 1024
+
+def lzma2_decoder_memory(dict_size):
+    """Upper bound of the memory an LZMA2 decoder uses."""
+    return dict_size + 1024 * 1024
+
+def fit_dict_size(max_memory, dict_size, reserve=0):
+    """
+    Halve dict_size until its encoder fits in max_memory next to reserve bytes.
+
+    Returns:
+        Dictionary size, never below MIN_DICT_SIZE (dict_size as is without a cap)
+    """
+    if max_memory is None:
+        return dict_size
+    while dict_size > MIN_DICT_SIZE and lzma2_encoder_memory(dict_size) + reserve > max_memory:
+        dict_size //= 2
+    return dict_size
+
+def buffer_size(max_memory, used, default):
+    """Read-ahead buffer left over once `used` bytes of max_memory are taken."""
+    if max_memory is None:
+        return default
+    return max(MIN_BUFFER_SIZE, min(default, max_memory - used))
+
+def plan_lzma2_pack(max_memory, dict_size, default_buffer):
+    """
+    Split a memory cap between the LZMA2 encoder and the page read-ahead buffer.
+
+    The dictionary is shrunk first, as far as needed, and the buffer gets what is left.
+
+    Args:
+        max_memory: Memory cap in bytes (None for no cap)
+        dict_size: Dictionary size to use when there is room for it
+        default_buffer: Read-ahead buffer size to use when there is room for it
+
+    Returns:
+        (dictionary size, buffer size) tuple
+    """
+    if max_memory is None:
+        return dict_size, default_buffer
+    dict_size = fit_dict_size(max_memory, dict_size, BASE_MEMORY + MIN_BUFFER_SIZE)
+    used = BASE_MEMORY + lzma2_encoder_memory(dict_size)
+    if used + MIN_BUFFER_SIZE > max_memory:
+        print(f"Warning: a memory cap of {max_memory / (1024 * 1024):.0f} MB is below the "
+              f"{(used + MIN_BUFFER_SIZE) / (1024 * 1024):.0f} MB needed, using the minimum")
+    return dict_size, buffer_size(max_memory, used, default_buffer)
+
+def read_page(path):
+    """
+    Return the contents of a page as a bytes-like object.
+
+    Large pages are memory-mapped: their data stays in the page cache, which the
+    kernel can drop under pressure, instead of being copied into the heap.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            return f.read()
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def peak_rss_bytes():
+    """Peak resident set size of this process in bytes, or None if unknown."""
+    # On Linux ru_maxrss survives exec, so a fresh process would report the parent's
+    # peak; VmHWM belongs to the current address space only
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def print_peak_memory():
+    peak = peak_rss_bytes()
+    if peak is not None:
+        print(f"Peak memory: {peak / (1024 * 1024):.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description='Show how a memory cap is split for LZMA2 packing.')
+    parser.add_argument('-m', '--max-memory', type=int, required=True, help='Memory cap in MB')
+    parser.add_argument('-p', '--preset', type=int, default=9, choices=range(10), help='LZMA2 preset (default: 9)')
+    args = parser.parse_args()
+
+    max_memory = args.max_memory * 1024 * 1024
+    dict_size, buffer = plan_lzma2_pack(max_memory, PRESET_DICT_SIZES[args.preset], 64 * 1024 * 1024)
+    print(f"Dictionary: {dict_size // (1024 * 1024)} MB "
+          f"(encoder {lzma2_encoder_memory(dict_size) / (1024 * 1024):.0f} MB, "
+          f"decoder {lzma2_decoder_memory(dict_size) / (1024 * 1024):.0f} MB)")
+    print(f"Read-ahead buffer: {buffer / (1024 * 1024):.0f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,632 @@
+import os
+import io
+import re
+import time
+import zlib
+import shutil
+import struct
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from Manga_policy import detect_image_type
+from Manga_scan import IMAGE_EXTENSIONS, scan_dir
+
+try:
+    from PIL import Image
+except ImportError:  # Pages are then checked on their decoded PNG rows and JPEG coefficients only
+    Image = None
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Ancillary chunks that only carry metadata or a colour profile
+_PNG_METADATA_CHUNKS = {b'tEXt', b'zTXt', b'iTXt', b'tIME', b'eXIf', b'iCCP'}
+# Chunks that decide the pixel values, next to the image data itself
+_PNG_PIXEL_CHUNKS = (b'IHDR', b'PLTE', b'tRNS')
+
+_SOI = 0xD8
+_EOI = 0xD9
+_SOS = 0xDA
+_DHT = 0xC4
+_DQT = 0xDB
+_DRI = 0xDD
+_COM = 0xFE
+# Huffman-coded sequential frames, baseline and extended; progressive and arithmetic
+# coded JPEGs are left as they are
+_SEQUENTIAL_SOF = (0xC0, 0xC1)
+_OTHER_SOF = set(range(0xC2, 0xD0)) - {_DHT, 0xC8, 0xCC}
+# APP0 (JFIF) and APP14 (Adobe colour transform) change how pixels decode, the other
+# APPn segments and comments are metadata
+_JPEG_METADATA_MARKERS = set(range(0xE1, 0xEE)) | {0xEF, _COM}
+_RESTART = re.compile(rb'\xff[\xd0-\xd7]')
+
+def _png_chunks(data):
+    """Split a PNG into (type, data) chunks, up to IEND."""
+    if not data.startswith(_PNG_SIGNATURE):
+        raise ValueError("not a PNG image")
+    chunks = []
+    pos = len(_PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        if len(body) != length:
+            raise ValueError("truncated PNG chunk")
+        chunks.append((kind, body))
+        pos += length + 12
+        if kind == b'IEND':
+            break
+    return chunks
+
+def _png_chunk(kind, body):
+    return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+
+def png_pixels(data):
+    """The chunks that decide the pixels of a PNG, and its decompressed (filtered) rows."""
+    chunks = _png_chunks(data)
+    header = [(kind, body) for kind, body in chunks if kind in _PNG_PIXEL_CHUNKS]
+    return header, zlib.decompress(b''.join(body for kind, body in chunks if kind == b'IDAT'))
+
+def optimize_png(data, strip_metadata=False):
+    """
+    Recompress the image data of a PNG at maximum zlib effort, as one IDAT chunk.
+
+    The filtered rows are kept as they are, so the pixels cannot change. Animated
+    PNGs are returned unchanged.
+
+    Args:
+        data: PNG file contents
+        strip_metadata: Also drop text, time, EXIF and ICC profile chunks
+
+    Returns:
+        The optimized PNG
+    """
+    chunks = _png_chunks(data)
+    if any(kind == b'acTL' for kind, _ in chunks):
+        return data
+    rows = zlib.decompress(b''.join(body for kind, body in chunks if kind == b'IDAT'))
+    best = None
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        packed = compressor.compress(rows) + compressor.flush()
+        if best is None or len(packed) < len(best):
+            best = packed
+    out = [_PNG_SIGNATURE]
+    for kind, body in chunks:
+        if kind == b'IDAT':
+            if best is not None:
+                out.append(_png_chunk(kind, best))
+                best = None
+        elif not (strip_metadata and kind in _PNG_METADATA_CHUNKS):
+            out.append(_png_chunk(kind, body))
+    return b''.join(out)
+
+def _jpeg_segments(data):
+    """
+    Split a JPEG into ('segment', marker, payload) and ('scan', header, entropy data)
+    items, from after SOI up to EOI.
+    """
+    if not data.startswith(b'\xff\xd8'):
+        raise ValueError("not a JPEG image")
+    items = []
+    pos = 2
+    size = len(data)
+    while pos < size:
+        if data[pos] != 0xFF:
+            raise ValueError(f"expected a marker at offset {pos}")
+        marker = data[pos + 1]
+        if marker == 0xFF:  # Fill byte
+            pos += 1
+            continue
+        if marker == _EOI:
+            return items
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        payload = data[pos + 4:pos + 2 + length]
+        pos += 2 + length
+        if marker != _SOS:
+            items.append(('segment', marker, payload))
+            continue
+        # Entropy-coded data runs up to the first marker that is not a stuffed
+        # 0xFF or a restart marker
+        end = pos
+        while True:
+            end = data.find(b'\xff', end)
+            if end < 0 or end + 1 >= size:
+                raise ValueError("JPEG scan is not terminated")
+            following = data[end + 1]
+            if following == 0x00 or 0xD0 <= following <= 0xD7:
+                end += 2
+            else:
+                break
+        items.append(('scan', payload, data[pos:end]))
+        pos = end
+    raise ValueError("JPEG has no EOI marker")
+
+def _parse_dht(payload, tables):
+    pos = 0
+    while pos < len(payload):
+        slot = payload[pos]
+        counts = list(payload[pos + 1:pos + 17])
+        symbols = list(payload[pos + 17:pos + 17 + sum(counts)])
+        tables[(slot >> 4, slot & 0x0F)] = (counts, symbols)
+        pos += 17 + sum(counts)
+
+def _lookup_table(counts, symbols):
+    """16-bit lookahead decoding table: entry is code length << 8 | symbol, 0 for no code."""
+    table = [0] * 65536
+    code = 0
+    k = 0
+    for length in range(1, 17):
+        for _ in range(counts[length - 1]):
+            shift = 16 - length
+            table[code << shift:(code + 1) << shift] = [(length << 8) | symbols[k]] * (1 << shift)
+            code += 1
+            k += 1
+        code <<= 1
+    return table
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+def _scan_layout(frame, scan_header):
+    """
+    Return (number of MCUs, [(dc table, ac table), ...] per block of an MCU) for a
+    sequential scan.
+    """
+    height, width = struct.unpack('>HH', frame[1:5])
+    if not height:
+        raise ValueError("JPEGs sized by a DNL marker are not supported")
+    components = {}
+    for i in range(frame[5]):
+        cid, sampling = frame[6 + 3 * i], frame[7 + 3 * i]
+        components[cid] = (sampling >> 4, sampling & 0x0F)
+    h_max = max(h for h, _ in components.values())
+    v_max = max(v for _, v in components.values())
+    count = scan_header[0]
+    selected = [(scan_header[1 + 2 * i], scan_header[2 + 2 * i]) for i in range(count)]
+    if scan_header[1 + 2 * count] != 0 or scan_header[2 + 2 * count] != 63:
+        raise ValueError("not a sequential scan")
+    if count == 1:
+        cid, tables = selected[0]
+        h, v = components[cid]
+        blocks_x = _ceil_div(_ceil_div(width * h, h_max), 8)
+        blocks_y = _ceil_div(_ceil_div(height * v, v_max), 8)
+        return blocks_x * blocks_y, [(tables >> 4, tables & 0x0F)]
+    mcus = _ceil_div(width, 8 * h_max) * _ceil_div(height, 8 * v_max)
+    layout = []
+    for cid, tables in selected:
+        h, v = components[cid]
+        layout.extend([(tables >> 4, tables & 0x0F)] * (h * v))
+    return mcus, layout
+
+def _decode_interval(data, mcus, blocks, tokens):
+    """
+    Huffman-decode one restart interval into (table, symbol, extra bit count, extra bits)
+    tokens. The DCT coefficients follow from the tokens, so equal tokens mean equal pixels.
+    """
+    acc = 0
+    nbits = 0
+    pos = 0
+    size = len(data)
+    append = tokens.append
+    for _ in range(mcus):
+        for dc_slot, dc_table, ac_slot, ac_table in blocks:
+            while nbits < 32:
+                acc = ((acc & ((1 << nbits) - 1)) << 8) | (data[pos] if pos < size else 0xFF)
+                pos += 1
+                nbits += 8
+            entry = dc_table[(acc >> (nbits - 16)) & 0xFFFF]
+            if not entry:
+                raise ValueError("invalid Huffman code")
+            nbits -= entry >> 8
+            s = entry & 0xFF
+            if s:
+                nbits -= s
+                append((dc_slot, s, s, (acc >> nbits) & ((1 << s) - 1)))
+            else:
+                append((dc_slot, 0, 0, 0))
+            k = 1
+            while k < 64:
+                while nbits < 32:
+                    acc = ((acc & ((1 << nbits) - 1)) << 8) | (data[pos] if pos < size else 0xFF)
+                    pos += 1
+                    nbits += 8
+                entry = ac_table[(acc >> (nbits - 16)) & 0xFFFF]
+                if not entry:
+                    raise ValueError("invalid Huffman code")
+                nbits -= entry >> 8
+                rs = entry & 0xFF
+                s = rs & 0x0F
+                if s:
+                    nbits -= s
+                    append((ac_slot, rs, s, (acc >> nbits) & ((1 << s) - 1)))
+                    k += (rs >> 4) + 1
+                else:
+                    append((ac_slot, rs, 0, 0))
+                    if rs != 0xF0:
+                        break
+                    k += 16
+            if k > 64:
+                raise ValueError("JPEG block has more than 64 coefficients")
+    if pos - nbits // 8 > size:
+        raise ValueError("JPEG scan ends early")
+
+def _decode_scan(frame, scan_header, entropy, tables, restart_interval):
+    """Return the tokens of a scan, as one list per restart interval."""
+    mcus, layout = _scan_layout(frame, scan_header)
+    lookups = {}
+    blocks = []
+    for dc, ac in layout:
+        for key in ((0, dc), (1, ac)):
+            if key not in lookups:
+                if key not in tables:
+                    raise ValueError("scan uses an undefined Huffman table")
+                lookups[key] = _lookup_table(*tables[key])
+        blocks.append((dc, lookups[(0, dc)], 0x10 | ac, lookups[(1, ac)]))
+    intervals = _RESTART.split(entropy)
+    per_interval = restart_interval or mcus
+    if _ceil_div(mcus, per_interval) != len(intervals):
+        raise ValueError("unexpected number of restart intervals")
+    decoded = []
+    for i, interval in enumerate(intervals):
+        tokens = []
+        _decode_interval(interval.replace(b'\xff\x00', b'\xff'),
+                         min(per_interval, mcus - i * per_interval), blocks, tokens)
+        decoded.append(tokens)
+    return decoded
+
+def _optimal_table(freq):
+    """
+    Build an optimal JPEG Huffman table (code lengths limited to 16 bits, no all-ones
+    code) for symbol frequencies, as in ITU T.81 Annex K.2.
+
+    Returns:
+        (counts per code length, symbols in code order)
+    """
+    freq = list(freq) + [1]  # Reserved code point, so no code is all ones
+    codesize = [0] * 257
+    others = [-1] * 257
+    while True:
+        c1 = c2 = -1
+        for i in range(257):
+            if freq[i] and (c1 < 0 or freq[i] <= freq[c1]):
+                c1 = i
+        for i in range(257):
+            if freq[i] and i != c1 and (c2 < 0 or freq[i] <= freq[c2]):
+                c2 = i
+        if c2 < 0:
+            break
+        freq[c1] += freq[c2]
+        freq[c2] = 0
+        codesize[c1] += 1
+        while others[c1] >= 0:
+            c1 = others[c1]
+            codesize[c1] += 1
+        others[c1] = c2
+        codesize[c2] += 1
+        while others[c2] >= 0:
+            c2 = others[c2]
+            codesize[c2] += 1
+    bits = [0] * 33
+    for size in codesize:
+        if size:
+            bits[size] += 1
+    for i in range(32, 16, -1):
+        while bits[i] > 0:
+            j = i - 2
+            while bits[j] == 0:
+                j -= 1
+            bits[i] -= 2
+            bits[i - 1] += 1
+            bits[j + 1] += 2
+            bits[j] -= 1
+    i = 16
+    while bits[i] == 0:
+        i -= 1
+    bits[i] -= 1
+    symbols = [s for size in range(1, 33) for s in range(256) if codesize[s] == size]
+    return bits[1:17], symbols
+
+def _huffman_codes(counts, symbols):
+    codes = {}
+    code = 0
+    k = 0
+    for length in range(1, 17):
+        for _ in range(counts[length - 1]):
+            codes[symbols[k]] = (code, length)
+            code += 1
+            k += 1
+        code <<= 1
+    return codes
+
+def _encode_interval(tokens, codes):
+    out = bytearray()
+    acc = 0
+    nbits = 0
+    for slot, symbol, extra_bits, extra in tokens:
+        code, length = codes[slot][symbol]
+        acc = (((acc << length) | code) << extra_bits) | extra
+        nbits += length + extra_bits
+        if nbits >= 32:
+            nbits -= 32
+            out += (acc >> nbits).to_bytes(4, 'big')
+            acc &= (1 << nbits) - 1
+    pad = -nbits % 8  # Padded with one bits
+    acc = (acc << pad) | ((1 << pad) - 1)
+    out += acc.to_bytes((nbits + pad) // 8, 'big')
+    return bytes(out).replace(b'\xff', b'\xff\x00')
+
+def _exif_orientation(payload):
+    """EXIF orientation tag of an APP1 payload, or None."""
+    if not payload.startswith(b'Exif\x00\x00'):
+        return None
+    tiff = payload[6:]
+    order = '<' if tiff[:2] == b'II' else '>'
+    try:
+        ifd = struct.unpack(order + 'I', tiff[4:8])[0]
+        for i in range(struct.unpack(order + 'H', tiff[ifd:ifd + 2])[0]):
+            entry = tiff[ifd + 2 + 12 * i:ifd + 14 + 12 * i]
+            if struct.unpack(order + 'H', entry[:2])[0] == 0x0112:
+                return struct.unpack(order + 'H', entry[8:10])[0]
+    except struct.error:
+        return None
+    return None
+
+def jpeg_coefficients(data):
+    """
+    Decode a sequential JPEG down to its Huffman tokens, without touching pixels.
+
+    Returns:
+        (quantization tables, frame header, [(scan header, tokens per restart interval)])
+    """
+    tables = {}
+    quantization = []
+    frame = None
+    restart_interval = 0
+    scans = []
+    for item in _jpeg_segments(data):
+        if item[0] == 'scan':
+            if frame is None:
+                raise ValueError("scan before the frame header")
+            scans.append((item[1], _decode_scan(frame, item[1], item[2], tables, restart_interval)))
+            continue
+        _, marker, payload = item
+        if marker in _SEQUENTIAL_SOF:
+            frame = payload
+        elif marker in _OTHER_SOF:
+            raise ValueError("only sequential Huffman-coded JPEGs are supported")
+        elif marker == _DHT:
+            _parse_dht(payload, tables)
+        elif marker == _DQT:
+            quantization.append(payload)
+        elif marker == _DRI:
+            restart_interval = struct.unpack('>H', payload[:2])[0]
+    return quantization, frame, scans
+
+def optimize_jpeg(data, strip_metadata=False):
+    """
+    Rewrite a JPEG with Huffman tables built for its own symbol counts, like
+    `jpegtran -optimize`. Only the entropy coding changes: the DCT coefficients are
+    copied as they are, so the pixels cannot change.
+
+    Args:
+        data: JPEG file contents
+        strip_metadata: Also drop EXIF (unless it rotates the image), ICC profile, XMP
+            and comment segments
+
+    Returns:
+        The optimized JPEG
+
+    Raises:
+        ValueError: For progressive, arithmetic-coded or damaged JPEGs
+    """
+    return _optimize_jpeg(data, strip_metadata)[0]
+
+def _optimize_jpeg(data, strip_metadata):
+    """optimize_jpeg, also returning the jpeg_coefficients of data it decoded on the way."""
+    tables = {}
+    quantization = []
+    frame = None
+    restart_interval = 0
+    scans = []
+    out = [b'\xff\xd8']
+    for item in _jpeg_segments(data):
+        if item[0] == 'segment':
+            _, marker, payload = item
+            if marker in _SEQUENTIAL_SOF:
+                frame = payload
+            elif marker in _OTHER_SOF:
+                raise ValueError("only sequential Huffman-coded JPEGs are supported")
+            elif marker == _DHT:
+                # Replaced by the tables written before each scan
+                _parse_dht(payload, tables)
+                continue
+            elif marker == _DQT:
+                quantization.append(payload)
+            elif marker == _DRI:
+                restart_interval = struct.unpack('>H', payload[:2])[0]
+            elif strip_metadata and marker in _JPEG_METADATA_MARKERS:
+                if not (marker == 0xE1 and _exif_orientation(payload) not in (None, 1)):
+                    continue
+            out.append(struct.pack('>BBH', 0xFF, marker, len(payload) + 2) + payload)
+            continue
+
+        _, scan_header, entropy = item
+        if frame is None:
+            raise ValueError("scan before the frame header")
+        intervals = _decode_scan(frame, scan_header, entropy, tables, restart_interval)
+        scans.append((scan_header, intervals))
+        freqs = {}
+        for tokens in intervals:
+            for slot, symbol, _, _ in tokens:
+                freq = freqs.get(slot)
+                if freq is None:
+                    freq = freqs[slot] = [0] * 256
+                freq[symbol] += 1
+        dht = bytearray()
+        codes = {}
+        for slot in sorted(freqs):
+            counts, symbols = _optimal_table(freqs[slot])
+            dht += bytes([slot]) + bytes(counts) + bytes(symbols)
+            codes[slot] = _huffman_codes(counts, symbols)
+        out.append(struct.pack('>BBH', 0xFF, _DHT, len(dht) + 2) + bytes(dht))
+        out.append(struct.pack('>BBH', 0xFF, _SOS, len(scan_header) + 2) + scan_header)
+        for i, tokens in enumerate(intervals):
+            if i:
+                out.append(bytes([0xFF, 0xD0 + (i - 1) % 8]))
+            out.append(_encode_interval(tokens, codes))
+    out.append(b'\xff\xd9')
+    return b''.join(out), (quantization, frame, scans)
+
+def _same_image(original, optimized):
+    """Compare the images Pillow decodes, when it is installed."""
+    if Image is None:
+        return True
+    with Image.open(io.BytesIO(original)) as a, Image.open(io.BytesIO(optimized)) as b:
+        return a.mode == b.mode and a.size == b.size and a.tobytes() == b.tobytes()
+
+def pixels_identical(original, optimized):
+    """
+    Check that two encodings of a page decode to the same pixels: equal PNG rows or
+    equal JPEG coefficients, and equal decoded images if Pillow is installed.
+    """
+    if original == optimized:
+        return True
+    image_type = detect_image_type(original[:16])
+    if image_type != detect_image_type(optimized[:16]):
+        return False
+    if image_type == 'png':
+        same = png_pixels(original) == png_pixels(optimized)
+    elif image_type == 'jpeg':
+        same = jpeg_coefficients(original) == jpeg_coefficients(optimized)
+    else:
+        same = original == optimized
+    return same and _same_image(original, optimized)
+
+def optimize_page(data, strip_metadata=False):
+    """
+    Losslessly optimize a JPEG or PNG page, checking the result is pixel-identical.
+
+    Returns:
+        (page bytes, status), where status is 'optimized', 'unchanged' (no smaller
+        encoding found) or 'skipped' (not a JPEG/PNG, or an unsupported JPEG)
+    """
+    image_type = detect_image_type(data[:16])
+    try:
+        if image_type == 'jpeg':
+            optimized, coefficients = _optimize_jpeg(data, strip_metadata)
+        elif image_type == 'png':
+            optimized = optimize_png(data, strip_metadata)
+        else:
+            return data, 'skipped'
+    except ValueError:
+        return data, 'skipped'
+    if len(optimized) >= len(data):
+        return data, 'unchanged'
+    if image_type == 'jpeg':
+        # The source was decoded while optimizing, only the result needs decoding
+        same = jpeg_coefficients(optimized) == coefficients and _same_image(data, optimized)
+    else:
+        same = pixels_identical(data, optimized)
+    if not same:
+        raise ValueError("optimized page does not decode to the same pixels")
+    return optimized, 'optimized'
+
+def _optimize_job(source, target, strip_metadata):
+    """Worker entry point: write the optimized page to target if it is smaller."""
+    try:
+        with open(source, 'rb') as f:
+            data = f.read()
+        optimized, status = optimize_page(data, strip_metadata)
+        if status == 'optimized':
+            with open(target, 'wb') as f:
+                f.write(optimized)
+        return source, len(data), len(optimized), status, None
+    except Exception as e:
+        return source, 0, 0, 'error', str(e)
+
+def optimize_files(files, work_dir, workers=None, strip_metadata=False, report=print):
+    """
+    Losslessly optimize pages in worker processes before they are archived.
+
+    Args:
+        files: List of (archive name, source path) tuples
+        work_dir: Directory for the optimized copies; sources are never modified
+        workers: Number of worker processes (optional, defaults to the CPU count)
+        strip_metadata: Also drop metadata and ICC profiles (see optimize_jpeg/optimize_png)
+        report: Called with a line of output per optimized page (optional)
+
+    Returns:
+        (files with optimized pages pointing into work_dir, summary dictionary)
+    """
+    start = time.perf_counter()
+    targets = [os.path.join(work_dir, f"{i}.page") for i in range(len(files))]
+    sources = [path for _, path in files]
+    summary = {'pages': len(files), 'optimized': 0, 'failed': [], 'bytes_in': 0, 'bytes_out': 0}
+    optimized = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_optimize_job, sources, targets, [strip_metadata] * len(files), chunksize=4)
+        for (name, source), target, (_, before, after, status, error) in zip(files, targets, results):
+            if status == 'optimized':
+                optimized.append((name, target))
+                summary['optimized'] += 1
+                if report:
+                    report(f"{name}: {before} -> {after} bytes (-{(before - after) / before:.1%})")
+            else:
+                optimized.append((name, source))
+                if status == 'error':
+                    summary['failed'].append(name)
+                    if report:
+                        report(f"{name}: kept as is, {error}")
+            summary['bytes_in'] += before
+            summary['bytes_out'] += after
+    summary['wall_seconds'] = time.perf_counter() - start
+    return optimized, summary
+
+def print_optimize_summary(summary):
+    saved = summary['bytes_in'] - summary['bytes_out']
+    print(f"Optimized {summary['optimized']} of {summary['pages']} pages, saved "
+          f"{saved / (1024 * 1024):.2f} MB ({saved / summary['bytes_in'] if summary['bytes_in'] else 0:.1%}) "
+          f"in {summary['wall_seconds']:.1f}s")
+
+def optimize_for_archive(files, workers=None, strip_metadata=False):
+    """
+    Optimize pages into a new temporary directory, for the packers.
+
+    Returns:
+        (files with optimized pages, temporary directory to remove once archived)
+    """
+    work_dir = tempfile.mkdtemp(prefix='manga_optimize_')
+    try:
+        files, summary = optimize_files(files, work_dir, workers, strip_metadata)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    print_optimize_summary(summary)
+    return files, work_dir
+
+def main():
+    parser = argparse.ArgumentParser(description='Losslessly optimize the JPEG and PNG pages of a folder.')
+    parser.add_argument('-i', '--input', required=True, help='Directory containing the pages')
+    parser.add_argument('-o', '--output', required=True, help='Directory to write the optimized pages to')
+    parser.add_argument('-j', '--workers', type=int, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--strip-metadata', action='store_true',
+                        help='Drop EXIF, ICC profile, XMP and comment data')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only print the summary')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input):
+        print(f"Error: '{args.input}' is not a valid directory")
+        return
+    pages = scan_dir(args.input, IMAGE_EXTENSIONS, recursive=True)
+    if not pages:
+        print(f"Error: No images found in '{args.input}'")
+        return
+    with tempfile.TemporaryDirectory(prefix='manga_optimize_') as work_dir:
+        files, summary = optimize_files([(page.name, page.path) for page in pages], work_dir, args.workers,
+                                        args.strip_metadata, report=None if args.quiet else print)
+        for name, path in files:
+            target = os.path.join(args.output, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(path, target)
+    print_optimize_summary(summary)
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,64 @@
 import os
+import shutil
 import argparse
-import re
 import py7zr
+from Manga_dedup import PageIndex, drop_boilerplate, duplicate_order
+from Manga_policy import CompressionPolicy, LZMA
+from Manga_memory import plan_lzma2_pack, print_peak_memory, PRESET_DICT_SIZES
+from Manga_optimize import optimize_for_archive
+from Manga_pipeline import write_7z_archive, DEFAULT_BUFFER_SIZE
+from Manga_profile import NO_PROFILER, StageProfiler
+from Manga_scan import path_sort_key, scan_names
 
-def natural_sort_key(s):
-    """
-    Sort strings with embedded numbers in natural order.
-    E.g. ["img1.jpg", "img10.jpg", "img2.jpg"] -> ["img1.jpg", "img2.jpg", "img10.jpg"]
-    """
-    return [int(c) if c.isdigit() else c for c in re.split(r'(\d+)', s)]
-
-def pack_manga_to_7z(input_dir, output_file=None):
+def pack_manga_to_7z(input_dir, output_file=None, use_policy=True, max_memory=None, profiler=None, pages=None,
+                     dedup=False, recursive=False, optimize=False,
+                     strip_metadata=False):
     """
     Pack all JPG images from input_dir into a 7z-compressed CBZ file.
     
     Args:
         input_dir: Directory containing JPG images
         output_file: Name of the output CBZ file (optional)
+        use_policy: Skip LZMA2 when no page would shrink from it (optional)
+        max_memory: Memory cap in bytes (optional); shrinks the LZMA2 dictionary and
+            the read-ahead buffer to fit
+        profiler: StageProfiler to record the time spent in each stage (optional)
+        pages: Page file names to pack (optional, all JPG images by default)
+        dedup: Store identical pages next to each other (see Manga_dedup.duplicate_order)
+        recursive: Also pack the pages of nested folders, keeping their folder in the
+            archive so every folder stays a group of pages
+        optimize: Losslessly optimize JPEG/PNG pages in worker processes first (see
+            Manga_optimize); the source pages are not modified
+        strip_metadata: With optimize, also drop EXIF, ICC profile and comment data
     """
     # Validate input directory
     if not os.path.isdir(input_dir):
         print(f"Error: '{input_dir}' is not a valid directory")
         return False
     
-    # Get all JPG files
-    jpg_files = [f for f in os.listdir(input_dir) if f.lower().endswith(('.jpg', '.jpeg'))]
+    profiler = profiler or NO_PROFILER
+    
+    # Get all JPG files, unless the caller already picked the pages
+    with profiler.stage('scan'):
+        if pages is not None:
+            jpg_files = list(pages)
+        else:
+            jpg_files = scan_names(input_dir, recursive=recursive)
     
     if not jpg_files:
         print(f"Error: No JPG images found in '{input_dir}'")
         return False
     
     # Sort files naturally
-    jpg_files.sort(key=natural_sort_key)
+    with profiler.stage('sort'):
+        jpg_files.sort(key=path_sort_key)
+    
+    # Identical pages go right after their first copy, so LZMA2 stores them as a match
+    if dedup:
+        with profiler.stage('dedup'):
+            jpg_files, duplicates = duplicate_order(input_dir, jpg_files)
+        if duplicates:
+            print(f"Storing {duplicates} duplicate pages next to their first copy")
     
     # Determine output filename if not provided
     if not output_file:
@@ -41,34 +68,84 @@ def pack_manga_to_7z(input_dir, output_file=None):
     if not output_file.lower().endswith('.cbz'):
         output_file += '.cbz'
     
-    # 7z provides better compression than ZIP, LZMA2 is the default algorithm
-    print("Using 7z LZMA2 compression for maximum file size reduction")
-    
+    work_dir = None
     try:
+        # 7z provides better compression than ZIP, LZMA2 is the default algorithm.
+        # A 7z archive has a single filter chain here, so LZMA2 is only dropped
+        # when every page is already compressed (e.g. all JPEG).
+        dict_size, max_buffered = plan_lzma2_pack(max_memory, PRESET_DICT_SIZES[9], DEFAULT_BUFFER_SIZE)
+        filters = [{'id': py7zr.FILTER_LZMA2, 'preset': 9, 'dict_size': dict_size}]
+        if use_policy:
+            policy = CompressionPolicy(baseline=LZMA)
+            for jpg_file in jpg_files:
+                with profiler.stage('policy'):
+                    policy.decide(os.path.join(input_dir, jpg_file))
+            policy.print_report()
+            if policy.all_stored():
+                filters = [{'id': py7zr.FILTER_COPY}]
+        
+        if filters[0]['id'] == py7zr.FILTER_COPY:
+            print("Pages are already compressed, storing them without recompression")
+        else:
+            print("Using 7z LZMA2 compression for maximum file size reduction")
+        
         # Create file paths dictionary
         files_to_archive = {}
         for jpg_file in jpg_files:
             file_path = os.path.join(input_dir, jpg_file)
-            # Add file with its basename to avoid directory structure in the archive
-            files_to_archive[os.path.basename(jpg_file)] = file_path
+            # Add file with its basename to avoid directory structure in the archive,
+            # unless nested folders were packed as page groups
+            files_to_archive[jpg_file if recursive else os.path.basename(jpg_file)] = file_path
+        files = list(files_to_archive.items())
+        
+        # Optimized copies of the pages go to a temporary directory that is removed afterwards
+        if optimize:
+            with profiler.stage('optimize'):
+                files, work_dir = optimize_for_archive(files, strip_metadata=strip_metadata)
         
-        # Create the archive with maximum compression
-        with py7zr.SevenZipFile(output_file, 'w', filters=[{'id': py7zr.FILTER_LZMA2, 'preset': 9}]) as archive:
-            archive.writeall(files_to_archive)
+        # Create the archive with maximum compression, reading pages ahead while compressing
+        write_7z_archive(output_file, files, filters, max_buffered=max_buffered, profiler=profiler)
         
         print(f"Successfully created '{output_file}' with {len(jpg_files)} images using 7z compression")
+        print_peak_memory()
         return True
     except Exception as e:
         print(f"Error creating CBZ file: {str(e)}")
         return False
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
 
 def main():
     parser = argparse.ArgumentParser(description='Pack manga JPG images into a CBZ file with 7z compression.')
     parser.add_argument('-i', '--input', required=True, help='Directory containing JPG images')
     parser.add_argument('-o', '--output', help='Output CBZ filename (optional)')
+    parser.add_argument('--always-compress', action='store_true',
+                        help='Always use LZMA2, even for pages that are already compressed')
+    parser.add_argument('--max-memory', type=int, help='Memory cap in MB (optional)')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='Include nested folders, keeping each one as a group of pages')
+    parser.add_argument('--dedup', action='store_true', help='Store identical pages next to each other')
+    parser.add_argument('--optimize', action='store_true', help='Losslessly optimize JPEG/PNG pages before packing')
+    parser.add_argument('--strip-metadata', action='store_true',
+                        help='With --optimize, also drop EXIF, ICC profile and comment data')
+    parser.add_argument('--drop-boilerplate', metavar='DB',
+                        help='Leave out pages marked as boilerplate in this Manga_dedup index (optional)')
+    parser.add_argument('--profile', metavar='JSON', help='Write per-stage timings to this JSON file (optional)')
+    parser.add_argument('--trace', metavar='JSON', help='Write a Chrome trace of every stage to this file (optional)')
     args = parser.parse_args()
     
-    pack_manga_to_7z(args.input, args.output)
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+    profiler = StageProfiler(trace=bool(args.trace)) if args.profile or args.trace else None
+    pages = None
+    if args.drop_boilerplate and os.path.isdir(args.input):
+        with PageIndex(args.drop_boilerplate) as index:
+            pages = drop_boilerplate(args.input, index.boilerplate_hashes(),
+                                     scan_names(args.input, recursive=args.recursive))
+    if pack_manga_to_7z(args.input, args.output, use_policy=not args.always_compress, max_memory=max_memory,
+                        profiler=profiler, pages=pages, dedup=args.dedup, recursive=args.recursive,
+                        optimize=args.optimize, strip_metadata=args.strip_metadata) and profiler:
+        profiler.save(args.profile, args.trace)
 
 if __name__ == "__main__":
     main()
@@ -1,37 +1,69 @@
 import os
+import shutil
 import argparse
-import re
 import py7zr  # Replace zipfile with py7zr
+from Manga_cb7_parallel import write_multiblock_7z
+from Manga_dedup import PageIndex, drop_boilerplate, duplicate_order
+from Manga_memory import plan_lzma2_pack, print_peak_memory, PRESET_DICT_SIZES
+from Manga_optimize import optimize_for_archive
+from Manga_pipeline import write_7z_archive, DEFAULT_BUFFER_SIZE
+from Manga_profile import NO_PROFILER, StageProfiler
+from Manga_scan import path_sort_key, scan_names
+from Manga_tune import add_tune_arguments, describe_settings, settings_filters, tune_volume
 
-def natural_sort_key(s):
-    """
-    Sort strings with embedded numbers in natural order.
-    E.g. ["img1.jpg", "img10.jpg", "img2.jpg"] -> ["img1.jpg", "img2.jpg", "img10.jpg"]
-    """
-    return [int(c) if c.isdigit() else c for c in re.split(r'(\d+)', s)]
-
-def pack_manga_to_cb7(input_dir, output_file=None):
+def pack_manga_to_cb7(input_dir, output_file=None, block_size=None, workers=None, max_memory=None, profiler=None,
+                      pages=None, dedup=False, recursive=False, settings=None,
+                      optimize=False, strip_metadata=False):
     """
     Pack all JPG images from input_dir into a CB7 file with ultra compression.
     
     Args:
         input_dir: Directory containing JPG images
         output_file: Name of the output CB7 file (optional)
+        block_size: Split pages into independent solid blocks of this many bytes and
+            compress them in parallel (optional, default is one solid block)
+        workers: Number of compression threads for block mode (optional)
+        max_memory: Memory cap in bytes (optional); limits the blocks compressed at
+            once and shrinks the LZMA2 dictionary and read-ahead buffer to fit
+        profiler: StageProfiler to record the time spent in each stage (optional)
+        pages: Page file names to pack (optional, all JPG images by default)
+        dedup: Store identical pages next to each other (see Manga_dedup.duplicate_order)
+        recursive: Also pack the pages of nested folders, keeping their folder in the
+            archive so every folder stays a group of pages
+        settings: Compression settings from Manga_tune.tune_volume (optional); they
+            replace the default filter and block_size
+        optimize: Losslessly optimize JPEG/PNG pages in worker processes first (see
+            Manga_optimize); the source pages are not modified
+        strip_metadata: With optimize, also drop EXIF, ICC profile and comment data
     """
     # Validate input directory
     if not os.path.isdir(input_dir):
         print(f"Error: '{input_dir}' is not a valid directory")
         return False
     
-    # Get all JPG files
-    jpg_files = [f for f in os.listdir(input_dir) if f.lower().endswith(('.jpg', '.jpeg'))]
+    profiler = profiler or NO_PROFILER
+    
+    # Get all JPG files, unless the caller already picked the pages
+    with profiler.stage('scan'):
+        if pages is not None:
+            jpg_files = list(pages)
+        else:
+            jpg_files = scan_names(input_dir, recursive=recursive)
     
     if not jpg_files:
         print(f"Error: No JPG images found in '{input_dir}'")
         return False
     
     # Sort files naturally
-    jpg_files.sort(key=natural_sort_key)
+    with profiler.stage('sort'):
+        jpg_files.sort(key=path_sort_key)
+    
+    # Identical pages go right after their first copy, so LZMA2 stores them as a match
+    if dedup:
+        with profiler.stage('dedup'):
+            jpg_files, duplicates = duplicate_order(input_dir, jpg_files)
+        if duplicates:
+            print(f"Storing {duplicates} duplicate pages next to their first copy")
     
     # Determine output filename if not provided
     if not output_file:
@@ -45,37 +77,106 @@ def pack_manga_to_cb7(input_dir, output_file=None):
     # Using only parameters that are fully supported by py7zr
     compression_level = 9  # Maximum level (ultra)
     
-    print("Using 7z LZMA2 ULTRA compression for maximum possible file size reduction")
+    if settings is None:
+        print("Using 7z LZMA2 ULTRA compression for maximum possible file size reduction")
     
     # Create the CB7 file with ultra compression
+    work_dir = None
     try:
         # Dictionary to store files with proper source paths and target names
         files_to_archive = {}
         for jpg_file in jpg_files:
             source_path = os.path.join(input_dir, jpg_file)
-            # Use basename to avoid directory structure in archive
-            target_name = os.path.basename(jpg_file)
+            # Use basename to avoid directory structure in archive, unless nested
+            # folders were packed as page groups
+            target_name = jpg_file if recursive else os.path.basename(jpg_file)
             files_to_archive[target_name] = source_path
+        files = list(files_to_archive.items())
+        
+        # Optimized copies of the pages go to a temporary directory that is removed afterwards
+        if optimize:
+            with profiler.stage('optimize'):
+                files, work_dir = optimize_for_archive(files, strip_metadata=strip_metadata)
+        
+        if settings is not None:
+            print(f"Using tuned settings: {describe_settings(settings)}")
+            block_size = settings.get('block_size')
         
-        # Create the archive with maximum compression
-        with py7zr.SevenZipFile(output_file, mode='w', filters=[{'id': py7zr.FILTER_LZMA2}]) as archive:
-            # Add each file individually with proper naming
-            for target_name, source_path in files_to_archive.items():
-                archive.write(source_path, target_name)
+        if block_size:
+            # Independent blocks compress on separate cores at a small ratio cost
+            options = {'preset': compression_level}
+            if settings is not None:
+                options = {'preset': settings['preset'], 'dict_size': settings['dict_size']}
+            blocks = write_multiblock_7z(output_file, files, block_size, workers,
+                                         max_memory=max_memory, profiler=profiler, **options)
+            print(f"Compressed {blocks} blocks in parallel")
+        elif settings is not None:
+            filters = settings_filters(settings)
+            dict_size, max_buffered = plan_lzma2_pack(max_memory, settings.get('dict_size', 0), DEFAULT_BUFFER_SIZE)
+            if settings['filter'] == 'lzma2':
+                filters[0]['dict_size'] = dict_size
+            write_7z_archive(output_file, files, filters, max_buffered=max_buffered,
+                             profiler=profiler)
+        else:
+            # Create the archive with maximum compression, reading pages ahead while compressing.
+            # Without a preset liblzma uses its default (6) and that dictionary size
+            dict_size, max_buffered = plan_lzma2_pack(max_memory, PRESET_DICT_SIZES[6], DEFAULT_BUFFER_SIZE)
+            filters = [{'id': py7zr.FILTER_LZMA2}]
+            if dict_size < PRESET_DICT_SIZES[6]:
+                filters[0]['dict_size'] = dict_size
+            write_7z_archive(output_file, files, filters, max_buffered=max_buffered,
+                             profiler=profiler)
         
         print(f"Successfully created '{output_file}' with {len(jpg_files)} images using ULTRA compression")
+        print_peak_memory()
         return True
     except Exception as e:
         print(f"Error creating CB7 file: {str(e)}")
         return False
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
 
 def main():
     parser = argparse.ArgumentParser(description='Pack manga JPG images into a CB7 file.')
     parser.add_argument('-i', '--input', required=True, help='Directory containing JPG images')
     parser.add_argument('-o', '--output', help='Output CB7 filename (optional)')
+    parser.add_argument('-b', '--block-size', type=int,
+                        help='Compress independent blocks of this many MB in parallel (optional)')
+    parser.add_argument('-j', '--workers', type=int, help='Number of compression threads for block mode (optional)')
+    parser.add_argument('--max-memory', type=int, help='Memory cap in MB (optional)')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='Include nested folders, keeping each one as a group of pages')
+    parser.add_argument('--dedup', action='store_true', help='Store identical pages next to each other')
+    parser.add_argument('--optimize', action='store_true', help='Losslessly optimize JPEG/PNG pages before packing')
+    parser.add_argument('--strip-metadata', action='store_true',
+                        help='With --optimize, also drop EXIF, ICC profile and comment data')
+    parser.add_argument('--drop-boilerplate', metavar='DB',
+                        help='Leave out pages marked as boilerplate in this Manga_dedup index (optional)')
+    add_tune_arguments(parser)
+    parser.add_argument('--profile', metavar='JSON', help='Write per-stage timings to this JSON file (optional)')
+    parser.add_argument('--trace', metavar='JSON', help='Write a Chrome trace of every stage to this file (optional)')
     args = parser.parse_args()
     
-    pack_manga_to_cb7(args.input, args.output)
+    block_size = args.block_size * 1024 * 1024 if args.block_size else None
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+    profiler = StageProfiler(trace=bool(args.trace)) if args.profile or args.trace else None
+    pages = None
+    if args.drop_boilerplate and os.path.isdir(args.input):
+        with PageIndex(args.drop_boilerplate) as index:
+            pages = drop_boilerplate(args.input, index.boilerplate_hashes(),
+                                     scan_names(args.input, recursive=args.recursive))
+    settings = None
+    if args.tune and os.path.isdir(args.input):
+        try:
+            settings = tune_volume(args.input, args.tune, args.max_seconds, args.tolerance / 100,
+                                   args.tune_cache, workers=args.workers)
+        except ValueError as e:
+            print(f"Error tuning '{args.input}': {str(e)}")
+            return
+    if pack_manga_to_cb7(args.input, args.output, block_size, args.workers, max_memory, profiler,
+                         pages, args.dedup, args.recursive, settings, args.optimize, args.strip_metadata) and profiler:
+        profiler.save(args.profile, args.trace)
 
 if __name__ == "__main__":
     main()
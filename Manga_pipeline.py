@@ -0,0 +1,252 @@
+import io
+import os
+import time
+import zlib
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from Manga_journal import atomic_output
+from Manga_memory import read_page
+from Manga_profile import NO_PROFILER
+from Manga_zipcopy import write_member_raw
+
+DEFAULT_READERS = 4
+DEFAULT_BUFFER_SIZE = 64 * 1024 * 1024
+
+def run_pipeline(files, write, transform=None, readers=DEFAULT_READERS, compressors=None,
+                 max_buffered=DEFAULT_BUFFER_SIZE, progress_callback=None, profiler=None, write_stage='write'):
+    """
+    Read pages ahead on reader threads, transform (compress) them on a worker pool,
+    and hand them to `write` one at a time, in the original order.
+
+    Reads and compression overlap with writing, so slow storage and a busy compressor
+    hide each other's latency. At most `max_buffered` bytes of page data are held
+    between reading and writing (a single larger page is still let through).
+
+    Args:
+        files: List of (archive name, source path) tuples, in archive order
+        write: Called as write(name, path, payload) on the calling thread
+        transform: Called as transform(name, path, data) on a worker thread; its return
+            value is the payload (optional, the page data is passed on by default). Large
+            pages arrive as a read-only mmap rather than bytes, see Manga_memory.read_page
+        readers: Number of prefetch threads
+        compressors: Number of transform threads (optional, defaults to the CPU count)
+        max_buffered: Maximum bytes of page data in flight
+        progress_callback: Called as progress_callback(done, total, name) after each
+            page is written (optional). An exception raised from it stops the pipeline.
+        profiler: StageProfiler timing the 'read', 'compress' and write stages, and
+            'wait' for the time the writer spends waiting on them (optional)
+        write_stage: Stage name of the write calls, for writers that also compress
+
+    Returns:
+        Number of pages written
+    """
+    profiler = profiler or NO_PROFILER
+    read = profiler.wrap('read', read_page, len)
+    pending = deque()
+    buffered = 0
+    written = 0
+    total = len(files)
+    read_pool = ThreadPoolExecutor(max_workers=readers)
+    compress_pool = ThreadPoolExecutor(max_workers=compressors or os.cpu_count() or 1) if transform else None
+
+    def compress(name, path, future):
+        data = future.result()
+        with profiler.stage('compress', len(data)):
+            return transform(name, path, data)
+
+    def write_oldest():
+        nonlocal written
+        name, path, size, future = pending.popleft()
+        with profiler.stage('wait'):
+            payload = future.result()
+        with profiler.stage(write_stage, size):
+            write(name, path, payload)
+        written += 1
+        if progress_callback:
+            progress_callback(written, total, name)
+        return size
+
+    try:
+        for name, path in files:
+            size = os.path.getsize(path)
+            # Write out the oldest pages until this one fits in the buffer
+            while pending and buffered + size > max_buffered:
+                buffered -= write_oldest()
+            future = read_pool.submit(read, path)
+            if compress_pool is not None:
+                future = compress_pool.submit(compress, name, path, future)
+            pending.append((name, path, size, future))
+            buffered += size
+        while pending:
+            buffered -= write_oldest()
+    finally:
+        for _, _, _, future in pending:
+            future.cancel()
+        read_pool.shutdown(wait=True)
+        if compress_pool is not None:
+            compress_pool.shutdown(wait=True)
+    return written
+
+def _compress_zip_member(name, data, method, date_time, external_attr):
+    """Build the ZipInfo and compressed bytes of one member, ready for write_member_raw."""
+    zinfo = zipfile.ZipInfo(name, date_time)
+    zinfo.external_attr = external_attr
+    zinfo.compress_type = method
+    zinfo.file_size = len(data)
+    zinfo.CRC = zlib.crc32(data)
+    if method == zipfile.ZIP_STORED:
+        compressed = data
+    else:
+        compressor = zipfile._get_compressor(method)
+        compressed = compressor.compress(data) + compressor.flush()
+    zinfo.compress_size = len(compressed)
+    return zinfo, compressed
+
+def write_zip_archive(output_file, files, policy=None, compress_type=zipfile.ZIP_DEFLATED,
+                      readers=DEFAULT_READERS, compressors=None, max_buffered=DEFAULT_BUFFER_SIZE,
+                      progress_callback=None, profiler=None):
+    """
+    Write a ZIP-based CBZ, compressing members in parallel and writing them in order.
+
+    Args:
+        output_file: Path of the CBZ file, only replaced once it is complete
+        files: List of (archive name, source path) tuples, in archive order
+        policy: CompressionPolicy choosing the method per page (optional, compress_type
+            is used for every page otherwise)
+        compress_type: zipfile compression constant used without a policy
+        readers, compressors, max_buffered, progress_callback, profiler: See run_pipeline;
+            the profiler also times writing the central directory as 'finalize'
+
+    Returns:
+        Number of pages written
+    """
+    profiler = profiler or NO_PROFILER
+
+    def compress(name, path, data):
+        method = policy.zip_method_data(name, data) if policy else compress_type
+        st = os.stat(path)
+        return _compress_zip_member(name, data, method, time.localtime(st.st_mtime)[:6],
+                                    (st.st_mode & 0xFFFF) << 16)
+
+    with atomic_output(output_file) as temp_file:
+        zipf = zipfile.ZipFile(temp_file, 'w', compression=compress_type)
+        try:
+            written = run_pipeline(files, lambda name, path, payload: write_member_raw(zipf, *payload),
+                                   compress, readers, compressors, max_buffered, progress_callback, profiler)
+        finally:
+            with profiler.stage('finalize'):
+                zipf.close()
+    return written
+
+def write_zip_members(output_file, members, policy=None, compress_type=zipfile.ZIP_DEFLATED,
+                      compressors=None, max_buffered=DEFAULT_BUFFER_SIZE):
+    """
+    Write a ZIP-based CBZ from pages already in memory, e.g. streamed out of another archive.
+
+    Args:
+        output_file: Path of the CBZ file, only replaced once it is complete
+        members: Iterable of (archive name, bytes, date_time tuple), in archive order
+        policy, compress_type: See write_zip_archive
+        compressors: Number of compression threads (optional, defaults to the CPU count)
+        max_buffered: Maximum bytes of page data waiting to be written
+
+    Returns:
+        Number of pages written
+    """
+    def compress(name, data, date_time):
+        method = policy.zip_method_data(name, data) if policy else compress_type
+        return _compress_zip_member(name, data, method, date_time, 0o644 << 16)
+
+    pending = deque()
+    buffered = 0
+    written = 0
+    with atomic_output(output_file) as temp_file, \
+            zipfile.ZipFile(temp_file, 'w', compression=compress_type) as zipf, \
+            ThreadPoolExecutor(max_workers=compressors or os.cpu_count() or 1) as pool:
+        for name, data, date_time in members:
+            while pending and buffered + len(data) > max_buffered:
+                size, future = pending.popleft()
+                write_member_raw(zipf, *future.result())
+                buffered -= size
+                written += 1
+            pending.append((len(data), pool.submit(compress, name, data, date_time)))
+            buffered += len(data)
+        while pending:
+            size, future = pending.popleft()
+            write_member_raw(zipf, *future.result())
+            written += 1
+    return written
+
+# Seconds from 1601-01-01, the 7z FILETIME epoch, to 1970-01-01
+_FILETIME_EPOCH_OFFSET = 11644473600
+
+def _writestr_released(archive, data, name, date_time=None):
+    """
+    Add a member from memory without keeping its data alive.
+
+    py7zr compresses the member right away but keeps a reference to its data in the
+    header until the archive is closed, which would hold the whole volume in memory.
+    py7zr also stamps members added from memory with the current time, so a
+    date_time tuple (local time, as in ZIP) is written over it when given.
+    """
+    archive.writestr(data, name)
+    try:
+        info = archive.header.files_info.files[-1]
+        info['data'] = io.BytesIO()
+        if date_time is not None:
+            filetime = int((time.mktime(tuple(date_time) + (0, 0, -1)) + _FILETIME_EPOCH_OFFSET) * 10000000)
+            for field in ('creationtime', 'lastwritetime', 'lastaccesstime'):
+                info[field] = filetime
+    except (AttributeError, IndexError, TypeError, KeyError, OverflowError, ValueError):
+        pass
+
+def write_7z_archive(output_file, files, filters, readers=DEFAULT_READERS, max_buffered=DEFAULT_BUFFER_SIZE,
+                     progress_callback=None, profiler=None):
+    """
+    Write a solid 7z archive with pages prefetched while py7zr compresses the previous ones.
+
+    Args:
+        output_file: Path of the CB7/CBZ file, only replaced once it is complete
+        files: List of (archive name, source path) tuples, in archive order
+        filters: py7zr filter chain
+        readers, max_buffered, progress_callback, profiler: See run_pipeline. py7zr
+            compresses as pages are added, so compression and writing are timed together
+            as 'compress'; writing the header is timed as 'finalize'
+
+    Returns:
+        Number of pages written
+    """
+    import py7zr  # Only 7z output needs it, so ZIP-only callers start faster
+    profiler = profiler or NO_PROFILER
+    with atomic_output(output_file) as temp_file:
+        archive = py7zr.SevenZipFile(temp_file, 'w', filters=filters)
+        try:
+            # py7zr takes bytes only, so memory-mapped pages are copied just before writing
+            written = run_pipeline(files, lambda name, path, data: _writestr_released(archive, bytes(data), name),
+                                   readers=readers, max_buffered=max_buffered,
+                                   progress_callback=progress_callback, profiler=profiler, write_stage='compress')
+        finally:
+            with profiler.stage('finalize'):
+                archive.close()
+    return written
+
+def write_7z_members(output_file, members, filters):
+    """
+    Write a solid 7z archive from pages already in memory.
+
+    Args:
+        output_file: Path of the CB7 file, only replaced once it is complete
+        members: Iterable of (archive name, bytes, date_time tuple), in archive order
+        filters: py7zr filter chain
+
+    Returns:
+        Number of pages written
+    """
+    import py7zr
+    written = 0
+    with atomic_output(output_file) as temp_file, py7zr.SevenZipFile(temp_file, 'w', filters=filters) as archive:
+        for name, data, date_time in members:
+            _writestr_released(archive, data, name, date_time)
+            written += 1
+    return written
@@ -0,0 +1,256 @@
+import os
+import zlib
+import struct
+import lzma
+import time
+import zipfile
+import argparse
+import threading
+from Manga_scan import IMAGE_EXTENSIONS, scan_dir
+
+STORED = 'stored'
+DEFLATE = 'deflate'
+LZMA = 'lzma'
+
+ZIP_METHODS = {
+    STORED: zipfile.ZIP_STORED,
+    DEFLATE: zipfile.ZIP_DEFLATED,
+    LZMA: zipfile.ZIP_LZMA,
+}
+
+# Formats whose pixel data is already entropy-coded, so recompressing gains next to nothing
+ALREADY_COMPRESSED = ('jpeg', 'webp', 'avif', 'jxl')
+
+def detect_image_type(header):
+    """Return the image type from its magic bytes, or None if unknown."""
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return 'webp'
+    if header[4:12] in (b'ftypavif', b'ftypavis'):
+        return 'avif'
+    if header.startswith((b'\xff\x0a', b'\x00\x00\x00\x0cJXL ')):
+        return 'jxl'
+    if header.startswith(b'BM'):
+        return 'bmp'
+    return None
+
+# JPEG start-of-frame markers, which carry the image size (DHT, JPG and DAC share the range)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def image_dimensions(header):
+    """
+    Return (width, height) read from the first bytes of a JPEG, PNG, GIF, WebP or BMP
+    image, or None if the size is not in header.
+
+    For JPEG the size follows any APP segments (EXIF, thumbnails), so pass enough
+    bytes to cover them; 256KB is plenty for scans.
+    """
+    if header.startswith(b'\x89PNG\r\n\x1a\n') and header[12:16] == b'IHDR' and len(header) >= 24:
+        return struct.unpack('>II', header[16:24])
+    if header.startswith((b'GIF87a', b'GIF89a')) and len(header) >= 10:
+        return struct.unpack('<HH', header[6:10])
+    if header.startswith(b'BM') and len(header) >= 26:
+        width, height = struct.unpack('<ii', header[18:26])
+        return width, abs(height)
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        chunk = header[12:16]
+        if chunk == b'VP8 ' and len(header) >= 30:
+            width, height = struct.unpack('<HH', header[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L' and len(header) >= 25:
+            bits = int.from_bytes(header[21:25], 'little')
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b'VP8X' and len(header) >= 30:
+            return int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1
+        return None
+    if header.startswith(b'\xff\xd8'):
+        i = 2
+        while i + 9 <= len(header):
+            if header[i] != 0xFF:
+                return None
+            marker = header[i + 1]
+            if marker == 0xFF:
+                # Fill byte before a marker
+                i += 1
+                continue
+            if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            if marker in _JPEG_SOF_MARKERS:
+                height, width = struct.unpack('>HH', header[i + 5:i + 9])
+                return width, height
+            i += 2 + struct.unpack('>H', header[i + 2:i + 4])[0]
+    return None
+
+def trial_compress(sample, method):
+    """
+    Compress a sample with the given method.
+
+    Returns:
+        (compressed size, CPU seconds spent)
+    """
+    start = time.process_time()
+    if method == DEFLATE:
+        size = len(zlib.compress(sample, 6))
+    elif method == LZMA:
+        size = len(lzma.compress(sample, format=lzma.FORMAT_RAW,
+                                 filters=[{'id': lzma.FILTER_LZMA2, 'preset': 9}]))
+    else:
+        size = len(sample)
+    return size, time.process_time() - start
+
+class CompressionPolicy:
+    """
+    Chooses STORED, DEFLATE or LZMA for each page from its magic bytes and a quick
+    trial compression of a sample, and keeps statistics on what the choice saved
+    compared to always using the baseline method.
+
+    Args:
+        baseline: Method the packer would use without a policy (DEFLATE or LZMA)
+        allow_lzma: Allow LZMA for pages where it clearly beats DEFLATE
+        sample_size: Number of bytes to sample from each page
+        min_saving: Minimum fraction a page must shrink by to be worth compressing
+        lzma_gain: Extra fraction LZMA must save over DEFLATE to be chosen
+        calibration_pages: Pages per image type on which the baseline method is also
+            trialled, to estimate the CPU time and ratio the policy trades away
+    """
+    def __init__(self, baseline=DEFLATE, allow_lzma=False, sample_size=64 * 1024,
+                 min_saving=0.02, lzma_gain=0.02, calibration_pages=3):
+        self.baseline = baseline
+        self.allow_lzma = allow_lzma
+        self.sample_size = sample_size
+        self.min_saving = min_saving
+        self.lzma_gain = lzma_gain
+        self.calibration_pages = calibration_pages
+        # Per image type: [sample bytes, baseline compressed bytes, baseline CPU seconds, samples]
+        self.calibration = {}
+        self.decisions = []
+        self._lock = threading.Lock()
+
+    def _calibrate(self, image_type, sample):
+        entry = self.calibration.setdefault(image_type, [0, 0, 0.0, 0])
+        if entry[3] < self.calibration_pages:
+            size, cpu = trial_compress(sample, self.baseline)
+            entry[0] += len(sample)
+            entry[1] += size
+            entry[2] += cpu
+            entry[3] += 1
+        return entry
+
+    def decide(self, file_path):
+        """
+        Decide the compression method for one page.
+
+        Returns:
+            Dictionary with the page name, size, image type, chosen method and reason
+        """
+        size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            sample = f.read(self.sample_size)
+        return self._decide_sample(os.path.basename(file_path), size, sample)
+
+    def decide_data(self, name, data):
+        """Decide the compression method for a page already read into memory. Thread-safe."""
+        return self._decide_sample(name, len(data), data[:self.sample_size])
+
+    def _decide_sample(self, name, size, sample):
+        image_type = detect_image_type(sample[:16])
+        decision = {'name': name, 'size': size, 'type': image_type}
+
+        if not sample:
+            decision.update(method=STORED, reason='empty')
+        elif image_type in ALREADY_COMPRESSED:
+            decision.update(method=STORED, reason='magic')
+        else:
+            deflate_size, _ = trial_compress(sample, DEFLATE)
+            deflate_saving = 1 - deflate_size / len(sample)
+            if deflate_saving < self.min_saving:
+                decision.update(method=STORED, reason=f'trial {deflate_saving:.1%}')
+            elif self.allow_lzma:
+                lzma_size, _ = trial_compress(sample, LZMA)
+                lzma_saving = 1 - lzma_size / len(sample)
+                if lzma_saving - deflate_saving >= self.lzma_gain:
+                    decision.update(method=LZMA, reason=f'trial {lzma_saving:.1%}')
+                else:
+                    decision.update(method=DEFLATE, reason=f'trial {deflate_saving:.1%}')
+            else:
+                decision.update(method=DEFLATE, reason=f'trial {deflate_saving:.1%}')
+
+        with self._lock:
+            if decision['method'] == STORED and sample:
+                self._calibrate(image_type, sample)
+            self.decisions.append(decision)
+        return decision
+
+    def zip_method(self, file_path):
+        """Decide a page and return the matching zipfile compression constant."""
+        return ZIP_METHODS[self.decide(file_path)['method']]
+
+    def zip_method_data(self, name, data):
+        """Decide a page held in memory and return the matching zipfile compression constant."""
+        return ZIP_METHODS[self.decide_data(name, data)['method']]
+
+    def all_stored(self):
+        """True if every decided page is stored, so the archive needs no compressor at all."""
+        return bool(self.decisions) and all(d['method'] == STORED for d in self.decisions)
+
+    def report(self):
+        """
+        Estimate what the policy saved against always using the baseline method.
+
+        Returns:
+            Dictionary with page counts per method, estimated CPU seconds saved and the
+            estimated compression ratio lost (fraction of the input size)
+        """
+        counts = {STORED: 0, DEFLATE: 0, LZMA: 0}
+        total_bytes = 0
+        cpu_saved = 0.0
+        bytes_lost = 0.0
+        for d in self.decisions:
+            counts[d['method']] += 1
+            total_bytes += d['size']
+            if d['method'] != STORED:
+                continue
+            entry = self.calibration.get(d['type'])
+            if entry and entry[0]:
+                cpu_saved += entry[2] / entry[0] * d['size']
+                bytes_lost += max(0, entry[0] - entry[1]) / entry[0] * d['size']
+        return {
+            'pages': len(self.decisions),
+            'methods': counts,
+            'bytes': total_bytes,
+            'cpu_seconds_saved': cpu_saved,
+            'ratio_lost': bytes_lost / total_bytes if total_bytes else 0.0,
+        }
+
+    def print_report(self):
+        report = self.report()
+        methods = ', '.join(f"{count} {method}" for method, count in report['methods'].items() if count)
+        print(f"Compression policy: {methods}")
+        print(f"Estimated CPU time saved: {report['cpu_seconds_saved']:.2f}s, "
+              f"ratio lost: {report['ratio_lost']:.2%}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the compression method chosen for each page in a directory.')
+    parser.add_argument('-i', '--input', required=True, help='Directory containing images')
+    parser.add_argument('--baseline', choices=[DEFLATE, LZMA], default=DEFLATE, help='Method to compare against')
+    parser.add_argument('--allow-lzma', action='store_true', help='Allow LZMA for pages where it helps')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input):
+        print(f"Error: '{args.input}' is not a valid directory")
+        return
+
+    policy = CompressionPolicy(baseline=args.baseline, allow_lzma=args.allow_lzma)
+    for entry in scan_dir(args.input, IMAGE_EXTENSIONS):
+        d = policy.decide(entry.path)
+        print(f"{d['name']}: {d['method']} ({d['reason']})")
+    policy.print_report()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import argparse
+import threading
+from Manga_memory import peak_rss_bytes
+
+# Trace events kept per run; later events still count towards the totals
+MAX_TRACE_EVENTS = 500000
+
+class _Stage:
+    """One timed span of a stage; `nbytes` can be set or added to before it ends."""
+    __slots__ = ('profiler', 'name', 'nbytes', 'start')
+
+    def __init__(self, profiler, name, nbytes):
+        self.profiler = profiler
+        self.name = name
+        self.nbytes = nbytes
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler._record(self.name, self.start, time.perf_counter_ns(), self.nbytes)
+
+class _NullStage:
+    __slots__ = ('nbytes',)
+
+    def __enter__(self):
+        self.nbytes = 0
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+class NullProfiler:
+    """Stands in for StageProfiler when profiling is off; every call is a no-op."""
+    _stage = _NullStage()
+
+    def stage(self, name, nbytes=0):
+        return self._stage
+
+    def wrap(self, name, func, count_bytes=None):
+        return func
+
+NO_PROFILER = NullProfiler()
+
+class StageProfiler:
+    """
+    Collects wall time, byte counts and call counts per named stage of a job.
+
+    Stages are timed with `with profiler.stage('read', nbytes):` from any thread. Totals
+    are always kept; with trace=True every span is also kept as an event, so the run
+    can be opened in chrome://tracing or Perfetto with one row per thread.
+
+    Args:
+        trace: Keep individual spans for write_trace (optional)
+    """
+    def __init__(self, trace=False):
+        self.trace = trace
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._events = []
+        self._dropped = 0
+        self._threads = {}
+        self._start = time.perf_counter_ns()
+        self._end = None
+
+    def stage(self, name, nbytes=0):
+        return _Stage(self, name, nbytes)
+
+    def wrap(self, name, func, count_bytes=None):
+        """
+        Return func timed as a stage on every call.
+
+        Args:
+            name: Stage name
+            func: Function to time
+            count_bytes: Called with the result to get the byte count (optional)
+        """
+        def timed(*args, **kwargs):
+            with self.stage(name) as span:
+                result = func(*args, **kwargs)
+                if count_bytes is not None:
+                    span.nbytes = count_bytes(result)
+            return result
+        return timed
+
+    def _record(self, name, start, end, nbytes):
+        with self._lock:
+            totals = self._totals.get(name)
+            if totals is None:
+                totals = self._totals[name] = [0, 0, 0]
+            totals[0] += 1
+            totals[1] += end - start
+            totals[2] += nbytes
+            if self.trace:
+                if len(self._events) < MAX_TRACE_EVENTS:
+                    tid = threading.get_ident()
+                    if tid not in self._threads:
+                        self._threads[tid] = threading.current_thread().name
+                    self._events.append((name, start, end, nbytes, tid))
+                else:
+                    self._dropped += 1
+
+    def stop(self):
+        """Mark the end of the job; the summary's wall time runs up to here."""
+        self._end = time.perf_counter_ns()
+
+    def summary(self):
+        """
+        Returns:
+            Dictionary with the wall time, peak memory and, per stage in the order they
+            first ran, calls, seconds, bytes, MB/s and share of the wall time. Stages
+            running on several threads at once can add up to more than the wall time.
+        """
+        wall = ((self._end or time.perf_counter_ns()) - self._start) / 1e9
+        stages = {}
+        with self._lock:
+            for name, (calls, ns, nbytes) in self._totals.items():
+                seconds = ns / 1e9
+                stages[name] = {
+                    'calls': calls,
+                    'seconds': seconds,
+                    'bytes': nbytes,
+                    'mb_per_s': nbytes / (1024 * 1024) / seconds if seconds and nbytes else 0.0,
+                    'share': seconds / wall if wall else 0.0,
+                }
+        return {
+            'wall_seconds': wall,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'stages': stages,
+            'dropped_trace_events': self._dropped,
+        }
+
+    def write_json(self, path):
+        """Write the summary to path as JSON."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_trace(self, path):
+        """Write the recorded spans to path in the Chrome trace event format."""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in threads.items()]
+        for name, start, end, nbytes, tid in events:
+            trace.append({
+                'name': name,
+                'cat': 'stage',
+                'ph': 'X',
+                'ts': (start - self._start) / 1000,
+                'dur': (end - start) / 1000,
+                'pid': pid,
+                'tid': tid,
+                'args': {'bytes': nbytes},
+            })
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+
+    def print_report(self):
+        summary = self.summary()
+        print(f"Profile ({summary['wall_seconds']:.2f}s wall):")
+        for name, stage in summary['stages'].items():
+            line = f"  {name:>10}: {stage['seconds']:8.3f}s {stage['share'] * 100:5.1f}% {stage['calls']:7d} calls"
+            if stage['bytes']:
+                line += f" {stage['bytes'] / (1024 * 1024):9.1f} MB {stage['mb_per_s']:8.1f} MB/s"
+            print(line)
+
+    def save(self, json_path=None, trace_path=None):
+        """Stop the profiler, print the report and write whichever outputs were asked for."""
+        self.stop()
+        self.print_report()
+        if json_path:
+            self.write_json(json_path)
+            print(f"Profile written to '{json_path}'")
+        if trace_path:
+            self.write_trace(trace_path)
+            print(f"Trace written to '{trace_path}' (open it in chrome://tracing or ui.perfetto.dev)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a profile written with --profile.')
+    parser.add_argument('-i', '--input', required=True, help='Profile JSON file')
+    args = parser.parse_args()
+
+    with open(args.input, 'r', encoding='utf-8') as f:
+        summary = json.load(f)
+    stages = sorted(summary['stages'].items(), key=lambda item: item[1]['seconds'], reverse=True)
+    print(f"{summary['wall_seconds']:.2f}s wall, slowest stages first:")
+    for name, stage in stages:
+        print(f"  {name:>10}: {stage['seconds']:8.3f}s {stage['share'] * 100:5.1f}% "
+              f"{stage['calls']:7d} calls {stage['bytes'] / (1024 * 1024):9.1f} MB")
+
+if __name__ == "__main__":
+    main()
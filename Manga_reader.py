@@ -0,0 +1,233 @@
+import os
+import zlib
+import struct
+import zipfile
+import argparse
+import threading
+from collections import OrderedDict
+import py7zr
+from Manga_extract import detect_archive_type, flatten_page_names, read_cb7_members
+
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+class MangaArchive:
+    """
+    Random access to the pages of a CBZ/CB7 file without extracting it to disk.
+
+    The archive is opened and indexed once; pages are numbered from 0 in natural order.
+    Decoded pages are kept in a size-bounded LRU cache. Reading page N of a solid CB7
+    means decoding the block from its start up to N, so a miss also keeps the pages
+    stored right after N, as many as fit in the cache, and reading on is served from
+    the cache instead of decoding the block again. py7zr stops after the last page
+    asked for, so nothing past those pages is decoded or held.
+
+    Args:
+        path: Path to the CBZ/CB7 file
+        cache_size: Maximum bytes of decoded pages to keep (the most recent page is
+            always kept, even if it is larger)
+        archive_type: 'cbz' or 'cb7' (optional, detected from the magic bytes)
+        catalog: MangaCatalog to take the page list from (optional). If the archive is
+            indexed and unchanged, its directory is not parsed: CBZ pages are read
+            straight from their offsets and a CB7 is only opened for its first decode.
+    """
+    def __init__(self, path, cache_size=DEFAULT_CACHE_SIZE, archive_type=None, catalog=None):
+        self.path = path
+        self.cache_size = cache_size
+        self.archive_type = archive_type or detect_archive_type(path)
+        if self.archive_type not in ('cbz', 'cb7'):
+            raise ValueError(f"'{path}' is not a CBZ or CB7 file")
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._archive = None
+        self._indexed = None
+        self._layout = None
+
+        entry = catalog.lookup(path) if catalog is not None else None
+        if entry is not None and entry['format'] == self.archive_type:
+            self._indexed = {page['member']: page for page in entry['pages']}
+            self._pages = [page['member'] for page in entry['pages']]
+            if self.archive_type == 'cbz':
+                self._fp = open(path, 'rb')
+            else:
+                self._block_of = {page['member']: page['block'] for page in entry['pages']
+                                  if page['block'] is not None}
+            return
+
+        if self.archive_type == 'cbz':
+            self._archive = zipfile.ZipFile(path, 'r')
+            members = self._archive.namelist()
+        else:
+            self._archive = py7zr.SevenZipFile(path, 'r')
+            members = []
+            self._block_of = {}
+            folders = {}
+            for f in self._archive.files:
+                if f.is_directory:
+                    continue
+                members.append(f.filename)
+                if f.folder is not None:
+                    self._block_of[f.filename] = folders.setdefault(id(f.folder), len(folders))
+
+        self._pages = [member for member, _ in flatten_page_names(members)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+        if self._indexed is not None and self.archive_type == 'cbz':
+            self._fp.close()
+        self._cache.clear()
+        self._cached_bytes = 0
+
+    @property
+    def page_count(self):
+        return len(self._pages)
+
+    @property
+    def page_names(self):
+        """Archive member names of the pages, in page order."""
+        return list(self._pages)
+
+    def _cache_get(self, key):
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache.move_to_end(key)
+        return entry
+
+    def _cache_put(self, key, data):
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self._cached_bytes -= len(old)
+        self._cache[key] = data
+        self._cached_bytes += len(data)
+        while self._cached_bytes > self.cache_size and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted)
+
+    def _stored_blocks(self):
+        """Members and sizes of every CB7 solid block, in the order they are stored."""
+        if self._layout is None:
+            layout = {}
+            for f in self._open_archive().files:
+                block = self._block_of.get(f.filename)
+                if block is not None and not f.is_directory:
+                    layout.setdefault(block, []).append((f.filename, f.uncompressed))
+            self._layout = layout
+        return self._layout
+
+    def _cb7_targets(self, member):
+        """The page, then the pages stored after it in its block that still fit in the cache."""
+        stored = self._stored_blocks()[self._block_of[member]]
+        start = next(i for i, (name, _) in enumerate(stored) if name == member)
+        targets = [member]
+        total = stored[start][1]
+        for name, size in stored[start + 1:]:
+            if total + size > self.cache_size:
+                break
+            targets.append(name)
+            total += size
+        return targets
+
+    def _open_archive(self):
+        if self._archive is None:
+            if self.archive_type == 'cbz':
+                self._archive = zipfile.ZipFile(self.path, 'r')
+            else:
+                self._archive = py7zr.SevenZipFile(self.path, 'r')
+        return self._archive
+
+    def _read_indexed_cbz(self, member):
+        """Read a CBZ page from the offset stored in the catalog, or None if that is not possible."""
+        page = self._indexed[member]
+        if page['method'] not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or page['header_offset'] is None:
+            return None
+        self._fp.seek(page['header_offset'])
+        header = self._fp.read(30)
+        if len(header) != 30 or header[:4] != b'PK\x03\x04':
+            raise zipfile.BadZipFile(f"Bad local header for '{member}'")
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        self._fp.seek(name_length + extra_length, os.SEEK_CUR)
+        data = self._fp.read(page['compressed_size'])
+        if page['method'] == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -15)
+        if len(data) != page['size'] or zlib.crc32(data) != page['crc']:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file '{member}'")
+        return data
+
+    def _decode(self, member):
+        """Decode member, plus the CB7 pages read ahead with it, and return them as {name: bytes}."""
+        if self.archive_type == 'cbz':
+            data = self._read_indexed_cbz(member) if self._indexed is not None else None
+            if data is None:
+                data = self._open_archive().read(member)
+            return {member: data}
+        block = self._block_of.get(member)
+        if block is None:
+            # Empty member with no stream
+            return {member: b''}
+        return read_cb7_members(self._open_archive(), self._cb7_targets(member))
+
+    def get_page(self, n):
+        """Return the bytes of page n (0-based, natural order)."""
+        if not 0 <= n < len(self._pages):
+            raise IndexError(f"Page {n} out of range (0-{len(self._pages) - 1})")
+        member = self._pages[n]
+        with self._lock:
+            data = self._cache_get(member)
+            if data is None:
+                decoded = self._decode(member)
+                data = decoded.pop(member)
+                # Pages read ahead go in after the requested one, in stored order
+                self._cache_put(member, data)
+                for name, page in decoded.items():
+                    self._cache_put(name, page)
+            return data
+
+    def iter_pages(self):
+        """Yield (page name, bytes) for every page in order."""
+        for n, member in enumerate(self._pages):
+            yield os.path.basename(member.replace('\\', '/')), self.get_page(n)
+
+def main():
+    parser = argparse.ArgumentParser(description='Read a single page from a CBZ/CB7 file without extracting it.')
+    parser.add_argument('-i', '--input', required=True, help='Input CBZ/CB7 file')
+    parser.add_argument('-p', '--page', type=int, help='Page number to write out, starting at 1 (optional)')
+    parser.add_argument('-o', '--output', help='Output image file for --page (optional)')
+    parser.add_argument('--catalog', help='Catalog database to take the page list from (optional)')
+    args = parser.parse_args()
+
+    catalog = None
+    try:
+        if args.catalog:
+            from Manga_catalog import MangaCatalog
+            catalog = MangaCatalog(args.catalog)
+        with MangaArchive(args.input, catalog=catalog) as archive:
+            if args.page is None:
+                print(f"'{args.input}' has {archive.page_count} pages")
+                for n, name in enumerate(archive.page_names, 1):
+                    print(f"{n:4d}: {name}")
+                return
+            data = archive.get_page(args.page - 1)
+            name = archive.page_names[args.page - 1]
+            output_file = args.output or os.path.basename(name.replace('\\', '/'))
+            with open(output_file, 'wb') as f:
+                f.write(data)
+            print(f"Wrote page {args.page} ({len(data)} bytes) to '{output_file}'")
+    except Exception as e:
+        print(f"Error reading archive: {str(e)}")
+    finally:
+        if catalog is not None:
+            catalog.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import re
+import time
+import argparse
+from collections import namedtuple
+
+PAGE_EXTENSIONS = ('.jpg', '.jpeg')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+ARCHIVE_EXTENSIONS = ('.cbz', '.cb7')
+
+_DIGITS = re.compile(r'(\d+)')
+
+# One scanned file: name relative to the scanned directory ('/'-separated), full
+# path, and the size and mtime from the directory scan
+ScanEntry = namedtuple('ScanEntry', 'name path size mtime_ns')
+
+def natural_sort_key(s):
+    """
+    Sort strings with embedded numbers in natural order.
+    E.g. ["img1.jpg", "img10.jpg", "img2.jpg"] -> ["img1.jpg", "img2.jpg", "img10.jpg"]
+
+    The key alternates text and numbers at fixed positions, so any two keys compare
+    without a TypeError, and ends with the string itself, so names that only differ
+    in leading zeros ("01" and "1") still have a fixed order.
+    """
+    parts = _DIGITS.split(s)
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts), s
+
+def is_page(name, extensions=PAGE_EXTENSIONS):
+    """Return True if a file or archive member name has one of the given extensions, in any case."""
+    return name.lower().endswith(extensions)
+
+def path_sort_key(path):
+    """Natural sort key of a relative path, folder by folder, so each folder sorts as a group."""
+    return tuple(natural_sort_key(part) for part in path.replace('\\', '/').split('/'))
+
+def _scan(directory, prefix, extensions, recursive, entries):
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_dir():
+                if recursive:
+                    _scan(entry.path, prefix + entry.name + '/', extensions, recursive, entries)
+            elif is_page(entry.name, extensions):
+                # DirEntry caches its stat result, and on Windows it comes with the listing
+                st = entry.stat()
+                entries.append(ScanEntry(prefix + entry.name, entry.path, st.st_size, st.st_mtime_ns))
+
+def scan_dir(directory, extensions=PAGE_EXTENSIONS, recursive=False):
+    """
+    List the files of a directory with the given extensions, in natural order.
+
+    One os.scandir pass collects names, sizes and mtimes, so callers need no further
+    stat calls, which matters for folders of thousands of strips on network shares.
+
+    Args:
+        directory: Directory to scan
+        extensions: Lowercase file extensions to keep
+        recursive: Include nested folders; their files are named by relative path
+            and every folder sorts as a group, after natural folder order
+
+    Returns:
+        List of ScanEntry tuples
+    """
+    entries = []
+    _scan(directory, '', tuple(extensions), recursive, entries)
+    entries.sort(key=lambda e: path_sort_key(e.name) if recursive else natural_sort_key(e.name))
+    return entries
+
+def scan_names(directory, extensions=PAGE_EXTENSIONS, recursive=False):
+    """Names of the files scan_dir finds, in natural order."""
+    return [entry.name for entry in scan_dir(directory, extensions, recursive)]
+
+def find_files(root, extensions=ARCHIVE_EXTENSIONS):
+    """Return the files with the given extensions at root (a file, or a directory searched recursively)."""
+    if os.path.isfile(root):
+        return [root]
+    return [entry.path for entry in scan_dir(root, extensions, recursive=True)]
+
+def find_leaf_dirs(root, extensions=PAGE_EXTENSIONS):
+    """
+    Find every directory under root that has files with the given extensions and no
+    subdirectories, e.g. the chapter folders of a library.
+
+    Returns:
+        List of (directory, total bytes of those files) tuples in natural order
+    """
+    found = []
+
+    def walk(directory, relative):
+        files_size = 0
+        has_files = False
+        has_dirs = False
+        with os.scandir(directory) as it:
+            subdirs = []
+            for entry in it:
+                if entry.is_dir():
+                    has_dirs = True
+                    subdirs.append(entry)
+                elif is_page(entry.name, extensions):
+                    has_files = True
+                    files_size += entry.stat().st_size
+        if has_files and not has_dirs:
+            found.append((directory, relative, files_size))
+        for entry in subdirs:
+            walk(entry.path, relative + '/' + entry.name if relative else entry.name)
+
+    walk(root, '')
+    found.sort(key=lambda f: path_sort_key(f[1]))
+    return [(directory, size) for directory, _, size in found]
+
+def main():
+    parser = argparse.ArgumentParser(description='List the pages of a folder in natural order.')
+    parser.add_argument('-i', '--input', required=True, help='Directory to scan')
+    parser.add_argument('-r', '--recursive', action='store_true', help='Include nested folders as page groups')
+    parser.add_argument('--all-images', action='store_true', help='List PNG and GIF pages too, not only JPG')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only print the totals')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    entries = scan_dir(args.input, IMAGE_EXTENSIONS if args.all_images else PAGE_EXTENSIONS, args.recursive)
+    seconds = time.perf_counter() - start
+    if not args.quiet:
+        for entry in entries:
+            print(f"{entry.size:10d}  {entry.name}")
+    print(f"{len(entries)} pages, {sum(e.size for e in entries) / (1024 * 1024):.1f} MB, "
+          f"scanned in {seconds * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import io
+import os
+import time
+import hashlib
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import py7zr
+from Manga_extract import detect_archive_type, flatten_page_names, read_cb7_members
+from Manga_policy import detect_image_type
+from Manga_verify import find_archives
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow pages are cached at full size
+    Image = None
+
+DEFAULT_CACHE_DIR = '.manga_thumbnails'
+DEFAULT_SIZE = (320, 480)
+THUMBNAIL_QUALITY = 85
+
+_EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'gif': '.gif', 'webp': '.webp', 'bmp': '.bmp'}
+
+def cache_key(archive_path, page=0, size=DEFAULT_SIZE):
+    """
+    Key of a thumbnail in the cache: a hash of the archive path, size, mtime, page
+    and thumbnail size, so a changed or replaced archive gets a new entry.
+    """
+    st = os.stat(archive_path)
+    ident = f"{os.path.abspath(archive_path)}\0{st.st_size}\0{st.st_mtime_ns}\0{page}\0{size[0]}x{size[1]}"
+    return hashlib.sha256(ident.encode('utf-8')).hexdigest()
+
+def cached_thumbnail(cache_dir, key):
+    """Path of the cached thumbnail for key, or None if it is not there yet."""
+    folder = os.path.join(cache_dir, key[:2])
+    for extension in ('.jpg',) + tuple(_EXTENSIONS.values()):
+        path = os.path.join(folder, key + extension)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def _page_member(archive_path, names, page):
+    pages = flatten_page_names(names)
+    try:
+        return pages[page][0]
+    except IndexError:
+        raise ValueError(f"'{archive_path}' has only {len(pages)} pages") from None
+
+def read_archive_page(archive_path, page=0):
+    """
+    Read a single page of a CBZ/CB7 file into memory.
+
+    A CBZ member is read on its own. For a CB7 only the solid block holding the page
+    is decoded, and decoding stops as soon as the page is out, so the cover of a
+    volume costs a fraction of a full unpack.
+
+    Args:
+        archive_path: Path to the CBZ/CB7 file
+        page: Page number, from 0 in natural order (negative counts from the end)
+
+    Returns:
+        (member name, bytes) tuple
+
+    Raises:
+        ValueError: If the file is not a CBZ/CB7, or has no page with that number
+    """
+    archive_type = detect_archive_type(archive_path)
+    if archive_type == 'cbz':
+        with zipfile.ZipFile(archive_path, 'r') as zipf:
+            member = _page_member(archive_path, zipf.namelist(), page)
+            return member, zipf.read(member)
+    if archive_type == 'cb7':
+        with py7zr.SevenZipFile(archive_path, 'r') as archive:
+            member = _page_member(archive_path, archive.getnames(), page)
+            return member, read_cb7_members(archive, [member])[member]
+    raise ValueError(f"'{archive_path}' is not a CBZ or CB7 file")
+
+def downscale(data, size=DEFAULT_SIZE):
+    """
+    Shrink an image to fit in size, keeping its aspect ratio.
+
+    Returns:
+        (image bytes, file extension); the page as it is when Pillow is missing
+    """
+    if Image is None:
+        return data, _EXTENSIONS.get(detect_image_type(data[:16]), '.img')
+    with Image.open(io.BytesIO(data)) as img:
+        # JPEG decodes at 1/2, 1/4 or 1/8 scale for free, far faster than full size
+        img.draft('RGB', (size[0] * 2, size[1] * 2))
+        img = img.convert('RGB')
+        img.thumbnail(size, Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+    return out.getvalue(), '.jpg'
+
+def make_thumbnail(archive_path, cache_dir=DEFAULT_CACHE_DIR, page=0, size=DEFAULT_SIZE):
+    """
+    Return the cached thumbnail of a page, creating it first if needed.
+
+    Args:
+        archive_path: Path to the CBZ/CB7 file
+        cache_dir: Cache directory (created if missing)
+        page: Page number, from 0 in natural order (default: the cover)
+        size: (width, height) box the thumbnail fits in
+
+    Returns:
+        Path of the thumbnail file
+    """
+    key = cache_key(archive_path, page, size)
+    path = cached_thumbnail(cache_dir, key)
+    if path is not None:
+        return path
+    _, data = read_archive_page(archive_path, page)
+    thumbnail, extension = downscale(data, size)
+    folder = os.path.join(cache_dir, key[:2])
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, key + extension)
+    # Written under a temporary name, so a reader never sees half a file
+    temp_file = f"{path}.{os.getpid()}.tmp"
+    with open(temp_file, 'wb') as f:
+        f.write(thumbnail)
+    os.replace(temp_file, path)
+    return path
+
+def _thumbnail_job(archive_path, cache_dir, page, size):
+    """Worker entry point: never raises, so one bad archive does not stop the run."""
+    try:
+        return archive_path, make_thumbnail(archive_path, cache_dir, page, size), None
+    except Exception as e:
+        return archive_path, None, str(e)
+
+def generate_thumbnails(archives, cache_dir=DEFAULT_CACHE_DIR, workers=None, page=0, size=DEFAULT_SIZE,
+                        report=print):
+    """
+    Make thumbnails for many archives in parallel worker processes.
+
+    Archives whose thumbnail is already cached for their current mtime are not opened,
+    so re-running over a large library only handles new and changed volumes.
+
+    Args:
+        archives: List of archive paths
+        cache_dir: Cache directory
+        workers: Number of worker processes (optional, defaults to the CPU count)
+        page: Page number, from 0 in natural order (default: the cover)
+        size: (width, height) box the thumbnails fit in
+        report: Called with a line of output per generated or failed thumbnail (optional)
+
+    Returns:
+        Summary dictionary with counts, wall time and a {archive: thumbnail path} map
+    """
+    start = time.perf_counter()
+    thumbnails = {}
+    todo = []
+    for archive_path in archives:
+        try:
+            path = cached_thumbnail(cache_dir, cache_key(archive_path, page, size))
+        except OSError:
+            path = None
+        if path is not None:
+            thumbnails[archive_path] = path
+        else:
+            todo.append(archive_path)
+
+    summary = {'archives': len(archives), 'cached': len(thumbnails), 'generated': 0, 'failed': []}
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_thumbnail_job, todo, [cache_dir] * len(todo), [page] * len(todo),
+                                   [size] * len(todo), chunksize=8)
+            for archive_path, path, error in results:
+                if error is None:
+                    thumbnails[archive_path] = path
+                    summary['generated'] += 1
+                    report(f"Thumbnail '{path}' for '{archive_path}'")
+                else:
+                    summary['failed'].append(archive_path)
+                    report(f"ERROR    {archive_path}: {error}")
+    summary['thumbnails'] = thumbnails
+    summary['wall_seconds'] = time.perf_counter() - start
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract cover thumbnails of CBZ/CB7 files into a cache.')
+    parser.add_argument('-i', '--input', required=True, help='Archive file or directory of archives')
+    parser.add_argument('-o', '--output', default=DEFAULT_CACHE_DIR,
+                        help=f'Thumbnail cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('-j', '--workers', type=int, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('-p', '--page', type=int, default=1,
+                        help='Page to use, starting at 1; negative counts from the end (default: 1)')
+    parser.add_argument('--size', default=f'{DEFAULT_SIZE[0]}x{DEFAULT_SIZE[1]}',
+                        help=f'Box the thumbnail fits in, WIDTHxHEIGHT (default: {DEFAULT_SIZE[0]}x{DEFAULT_SIZE[1]})')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only print the summary')
+    args = parser.parse_args()
+
+    try:
+        size = tuple(int(n) for n in args.size.lower().split('x'))
+        if len(size) != 2:
+            raise ValueError
+    except ValueError:
+        print(f"Error: '{args.size}' is not a WIDTHxHEIGHT size")
+        return
+    if Image is None:
+        print("Warning: Pillow is not installed, pages are cached at full size")
+
+    archives = find_archives(args.input)
+    if not archives:
+        print(f"Error: No CBZ/CB7 files found in '{args.input}'")
+        return
+    page = args.page - 1 if args.page > 0 else args.page
+    summary = generate_thumbnails(archives, args.output, args.workers, page, size,
+                                  report=(lambda line: None) if args.quiet else print)
+    print(f"{summary['archives']} archives: {summary['generated']} thumbnails made, {summary['cached']} cached, "
+          f"{len(summary['failed'])} failed ({summary['wall_seconds']:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import os
+import queue
+import zipfile
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import py7zr
+from Manga_extract import detect_archive_type, flatten_page_names, page_windows, read_cb7_members
+from Manga_pipeline import write_zip_members, write_7z_members, DEFAULT_BUFFER_SIZE
+from Manga_policy import CompressionPolicy, DEFLATE
+from Manga_scan import find_files
+
+try:
+    from py7zr.io import Py7zIO, WriterFactory
+except ImportError:  # py7zr < 1.0 has no writer factory
+    Py7zIO = WriterFactory = None
+
+CB7_FILTERS = [{'id': py7zr.FILTER_LZMA2, 'preset': 9}]
+
+class _TranscodeAborted(Exception):
+    pass
+
+class _QueuedMember(Py7zIO or object):
+    """Collects one decoded member and hands it to the consumer when py7zr closes it."""
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.chunks = []
+        self.written = 0
+
+    def write(self, s):
+        self.chunks.append(bytes(s))
+        self.written += len(s)
+        return len(s)
+
+    def read(self, size=None):
+        return b''
+
+    def seek(self, offset, whence=0):
+        return self.written
+
+    def flush(self):
+        pass
+
+    def size(self):
+        return self.written
+
+    def close(self):
+        if self.chunks is not None:
+            data = b''.join(self.chunks)
+            self.chunks = None
+            self.factory.put((self.name, data))
+
+class _QueueFactory(WriterFactory or object):
+    """Passes decoded members through a bounded queue, so decoding waits for the writer."""
+    def __init__(self, max_items):
+        self.queue = queue.Queue(maxsize=max_items)
+        self.stopped = threading.Event()
+
+    def create(self, filename):
+        return _QueuedMember(filename, self)
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _TranscodeAborted()
+
+def _stream_cb7_in_order(archive, pages):
+    """Decode a whole CB7 in one pass on a background thread, yielding (member, bytes)."""
+    factory = _QueueFactory(max_items=4)
+    done = object()
+    errors = []
+
+    def produce():
+        try:
+            archive.extract(targets=list(pages), factory=factory)
+        except _TranscodeAborted:
+            pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                factory.put(done)
+            except _TranscodeAborted:
+                pass
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = factory.queue.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        factory.stopped.set()
+        producer.join()
+    if errors:
+        raise errors[0]
+
+def iter_archive_pages(input_file, max_buffered=DEFAULT_BUFFER_SIZE, archive_type=None):
+    """
+    Yield (page name, bytes, date_time) for every page of a CBZ/CB7 in natural order,
+    keeping about max_buffered bytes of decoded data in memory at most.
+
+    CB7 archives are decoded in a single streaming pass in stored order. Pages stored
+    ahead of their natural place (e.g. duplicates packed next to their first copy, see
+    Manga_dedup.duplicate_order) wait in a reorder buffer until their turn. Only if
+    that buffer would outgrow max_buffered are the remaining pages decoded in
+    buffer-sized windows instead, which costs extra decoding but keeps memory bounded.
+    """
+    archive_type = archive_type or detect_archive_type(input_file)
+    if archive_type == 'cbz':
+        with zipfile.ZipFile(input_file, 'r') as zipf:
+            for member, name in flatten_page_names(zipf.namelist()):
+                yield name, zipf.read(member), zipf.getinfo(member).date_time
+        return
+    if archive_type != 'cb7':
+        raise ValueError(f"'{input_file}' is not a CBZ or CB7 file")
+
+    with py7zr.SevenZipFile(input_file, 'r') as archive:
+        infos = {info.filename: info for info in archive.list()}
+        pages = flatten_page_names(infos)
+        names = dict(pages)
+        stored_order = [f.filename for f in archive.files if f.filename in names]
+        natural_order = [member for member, _ in pages]
+
+        def date_time(member):
+            created = infos[member].creationtime
+            # py7zr reports UTC; ZIP timestamps are local time
+            return created.astimezone().timetuple()[:6] if created else (1980, 1, 1, 0, 0, 0)
+
+        position = 0  # Index in natural_order of the next page to yield
+        if WriterFactory is not None:
+            held = {}
+            held_bytes = 0
+            stream = _stream_cb7_in_order(archive, stored_order)
+            try:
+                for member, data in stream:
+                    held[member] = data
+                    held_bytes += len(data)
+                    while position < len(natural_order) and natural_order[position] in held:
+                        next_member = natural_order[position]
+                        data = held.pop(next_member)
+                        held_bytes -= len(data)
+                        position += 1
+                        yield names[next_member], data, date_time(next_member)
+                    if held_bytes > max_buffered:
+                        break
+            finally:
+                stream.close()
+            if position == len(natural_order):
+                return
+            held.clear()
+            archive.reset()
+
+        remaining = natural_order[position:]
+        sizes = {member: infos[member].uncompressed for member in remaining}
+        for window in page_windows(remaining, sizes, max_buffered):
+            decoded = read_cb7_members(archive, window)
+            for member in window:
+                yield names[member], decoded.pop(member), date_time(member)
+
+def transcode_archive(input_file, output_file=None, target_format=None, max_buffered=DEFAULT_BUFFER_SIZE):
+    """
+    Convert a CBZ to CB7 or the other way round without writing pages to disk.
+
+    Args:
+        input_file: Source CBZ/CB7 file (format detected from its magic bytes)
+        output_file: Target file (optional, source name with the new extension)
+        target_format: 'cbz' or 'cb7' (optional, the other format than the source)
+        max_buffered: Bytes of page data held in memory at most
+
+    Returns:
+        True on success, False otherwise
+    """
+    if not os.path.isfile(input_file):
+        print(f"Error: '{input_file}' is not a valid file")
+        return False
+    source_format = detect_archive_type(input_file)
+    if source_format not in ('cbz', 'cb7'):
+        print(f"Error: '{input_file}' is not a CBZ or CB7 file")
+        return False
+    target_format = target_format or ('cb7' if source_format == 'cbz' else 'cbz')
+    if not output_file:
+        output_file = os.path.splitext(input_file)[0] + '.' + target_format
+    if os.path.abspath(output_file) == os.path.abspath(input_file):
+        print(f"Error: output would overwrite '{input_file}'")
+        return False
+
+    try:
+        pages = iter_archive_pages(input_file, max_buffered, source_format)
+        if target_format == 'cb7':
+            count = write_7z_members(output_file, pages, CB7_FILTERS)
+        else:
+            policy = CompressionPolicy(baseline=DEFLATE)
+            count = write_zip_members(output_file, pages, policy, max_buffered=max_buffered)
+        print(f"Transcoded '{input_file}' to '{output_file}' ({count} images)")
+        return True
+    except Exception as e:
+        print(f"Error transcoding '{input_file}': {str(e)}")
+        return False
+
+def transcode_directory(input_dir, output_dir=None, target_format='cb7', workers=None,
+                        max_buffered=DEFAULT_BUFFER_SIZE):
+    """
+    Transcode every CBZ/CB7 under input_dir that is not already in the target format,
+    in parallel worker processes. The directory layout is mirrored into output_dir
+    (optional, next to each source archive by default).
+
+    Returns:
+        (number converted, list of failed source files)
+    """
+    jobs = []
+    for source in find_files(input_dir):
+        if detect_archive_type(source) == target_format:
+            continue
+        base = os.path.splitext(os.path.relpath(source, input_dir))[0]
+        target = os.path.join(output_dir or input_dir, base + '.' + target_format)
+        if os.path.abspath(target) == os.path.abspath(source):
+            # e.g. a 7z-based .cbz converted to cbz: keep the source intact
+            target = os.path.join(output_dir or input_dir, base + '.zip.' + target_format)
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        jobs.append((source, target))
+
+    converted = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(transcode_archive, source, target, target_format, max_buffered): source
+                   for source, target in jobs}
+        for future in as_completed(futures):
+            try:
+                ok = future.result()
+            except Exception:
+                ok = False
+            if ok:
+                converted += 1
+            else:
+                failed.append(futures[future])
+    return converted, failed
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert CBZ to CB7 and back without unpacking to disk.')
+    parser.add_argument('-i', '--input', required=True, help='Input CBZ/CB7 file, or a directory of archives')
+    parser.add_argument('-o', '--output', help='Output file or directory (optional)')
+    parser.add_argument('-f', '--format', choices=['cbz', 'cb7'],
+                        help='Target format (default: the other format; cb7 for directories)')
+    parser.add_argument('-j', '--workers', type=int, help='Worker processes for directories (default: CPU count)')
+    parser.add_argument('--buffer', type=int, default=DEFAULT_BUFFER_SIZE // (1024 * 1024),
+                        help='Memory buffer in MB (default: 64)')
+    args = parser.parse_args()
+
+    max_buffered = args.buffer * 1024 * 1024
+    if os.path.isdir(args.input):
+        converted, failed = transcode_directory(args.input, args.output, args.format or 'cb7',
+                                                args.workers, max_buffered)
+        print(f"Converted {converted} archives")
+        if failed:
+            print(f"Failed: {len(failed)}")
+            for source in failed:
+                print(f" - {source}")
+    else:
+        transcode_archive(args.input, args.output, args.format, max_buffered)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import os
+import json
+import lzma
+import time
+import zlib
+import argparse
+import py7zr
+from Manga_cb7_parallel import split_into_blocks
+from Manga_memory import lzma2_decoder_memory
+from Manga_scan import scan_dir
+
+DEFAULT_CACHE_FILE = 'manga_tune.json'
+# Pages trial-compressed per series; LZMA2 runs at a few MB/s on JPEG data, so
+# this keeps a full set of trials to seconds
+DEFAULT_SAMPLE_BYTES = 2 * 1024 * 1024
+PRESETS = (0, 3, 6, 9)
+DICT_SIZES = (4 * 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024)
+BLOCK_SIZES = (None, 4 * 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024)
+TARGETS = ('ratio', 'fast')
+DEFAULT_TOLERANCE = 0.01
+# Ratios closer than this count as equal, so the faster setting wins
+_RATIO_EPSILON = 0.0001
+_MB = 1024 * 1024
+
+def sample_pages(pages, sample_bytes=DEFAULT_SAMPLE_BYTES):
+    """
+    Pick pages spread evenly over a volume, up to about sample_bytes in total.
+
+    Args:
+        pages: List of ScanEntry tuples (see Manga_scan.scan_dir), in archive order
+
+    Returns:
+        The picked pages, in archive order
+    """
+    total = sum(page.size for page in pages)
+    if total <= sample_bytes:
+        return list(pages)
+    picked = []
+    picked_bytes = 0
+    step = total / sample_bytes
+    # Take the next page once `step` times the picked bytes have gone by, so front
+    # matter, chapters and back matter all get a say
+    position = 0.0
+    offset = 0
+    for page in pages:
+        if offset >= position:
+            picked.append(page)
+            picked_bytes += page.size
+            position += page.size * step
+            if picked_bytes >= sample_bytes:
+                break
+        offset += page.size
+    return picked
+
+def candidate_settings(volume_bytes, workers=1, presets=PRESETS, dict_sizes=DICT_SIZES, block_sizes=BLOCK_SIZES):
+    """
+    Settings worth trying for a volume of volume_bytes.
+
+    Dictionaries more than twice the volume and blocks as large as the volume are left
+    out, as they behave like the smaller dictionary or a single solid block. Blocks
+    are only tried with several workers, since on one core they only cost ratio.
+
+    Returns:
+        List of settings dictionaries: 'filter' ('copy' or 'lzma2'), and for LZMA2
+        'preset', 'dict_size' and 'block_size' (None for one solid block)
+    """
+    candidates = [{'filter': 'copy', 'block_size': None}]
+    useful_dicts = [d for d in dict_sizes if d <= max(2 * volume_bytes, min(dict_sizes))]
+    for preset in presets:
+        for dict_size in useful_dicts:
+            for block_size in block_sizes:
+                if block_size is not None and (workers < 2 or block_size >= volume_bytes):
+                    continue
+                candidates.append({'filter': 'lzma2', 'preset': preset, 'dict_size': dict_size,
+                                   'block_size': block_size})
+    return candidates
+
+def settings_filters(settings):
+    """py7zr filter chain of a settings dictionary."""
+    if settings['filter'] == 'copy':
+        return [{'id': py7zr.FILTER_COPY}]
+    return [{'id': py7zr.FILTER_LZMA2, 'preset': settings['preset'], 'dict_size': settings['dict_size']}]
+
+def describe_settings(settings):
+    if settings['filter'] == 'copy':
+        return 'copy'
+    text = f"lzma2 preset {settings['preset']}, {settings['dict_size'] // _MB}MB dict"
+    if settings.get('block_size'):
+        text += f", {settings['block_size'] // _MB}MB blocks"
+    return text
+
+def _compress_sample(data, settings, block_size):
+    """Compress the sample pages as blocks of block_size, returning (compressed bytes, seconds)."""
+    if settings['filter'] == 'copy':
+        # Storing still reads and checksums every page
+        start = time.perf_counter()
+        for page in data:
+            zlib.crc32(page)
+        return sum(len(page) for page in data), time.perf_counter() - start
+    blocks = split_into_blocks([(i, None, len(page)) for i, page in enumerate(data)], block_size) \
+        if block_size else [[(i, None, len(page)) for i, page in enumerate(data)]]
+    packed = 0
+    start = time.perf_counter()
+    for block in blocks:
+        unpack_size = sum(entry[2] for entry in block)
+        dict_size = max(4096, min(settings['dict_size'], unpack_size))
+        compressor = lzma.LZMACompressor(format=lzma.FORMAT_RAW, filters=[
+            {'id': lzma.FILTER_LZMA2, 'preset': settings['preset'], 'dict_size': dict_size}])
+        for i, _, _ in block:
+            zlib.crc32(data[i])
+            packed += len(compressor.compress(data[i]))
+        packed += len(compressor.flush())
+    return packed, time.perf_counter() - start
+
+def run_trials(input_dir, workers=None, sample_bytes=DEFAULT_SAMPLE_BYTES, candidates=None, report=None):
+    """
+    Trial-compress a sample of a volume's pages with every candidate setting.
+
+    Ratios come straight from the sample. Speeds are measured on the sample, and for
+    block mode multiplied by the blocks the volume keeps in flight at once. Settings
+    whose dictionary and blocks both cover the whole sample compress it identically,
+    so each such group is only measured once.
+
+    Args:
+        input_dir: Directory containing JPG images
+        workers: Compression threads block mode would use (optional, CPU count)
+        sample_bytes: Bytes of pages to trial-compress
+        candidates: Settings to try (optional, see candidate_settings)
+        report: Called with a line of output per trial (optional)
+
+    Returns:
+        List of result dictionaries: 'settings', 'ratio', 'mb_per_s' and 'decoder_memory'
+    """
+    pages = scan_dir(input_dir)
+    if not pages:
+        raise ValueError(f"No JPG images found in '{input_dir}'")
+    volume_bytes = sum(page.size for page in pages)
+    data = []
+    for page in sample_pages(pages, sample_bytes):
+        with open(page.path, 'rb') as f:
+            data.append(f.read())
+    sampled = sum(len(page) for page in data)
+    workers = workers or os.cpu_count() or 1
+    if candidates is None:
+        candidates = candidate_settings(volume_bytes, workers)
+
+    measured = {}
+    results = []
+    for settings in candidates:
+        block_size = settings.get('block_size')
+        trial_block = block_size if block_size and block_size < sampled else None
+        key = (settings['filter'], settings.get('preset'), min(settings.get('dict_size') or 0, sampled), trial_block)
+        if key not in measured:
+            measured[key] = _compress_sample(data, settings, trial_block)
+        packed, seconds = measured[key]
+        parallel = min(workers, -(-volume_bytes // block_size)) if block_size else 1
+        result = {
+            'settings': settings,
+            'ratio': packed / sampled if sampled else 1.0,
+            'mb_per_s': sampled / _MB / max(seconds, 1e-6) * parallel,
+            'decoder_memory': lzma2_decoder_memory(settings['dict_size']) if settings['filter'] == 'lzma2' else 0,
+        }
+        results.append(result)
+        if report:
+            report(f"{describe_settings(settings):>38}: ratio {result['ratio']:.4f}, "
+                   f"{result['mb_per_s']:8.1f} MB/s")
+    return results
+
+def estimated_seconds(result, volume_bytes):
+    """Estimated time to compress volume_bytes with the setting of a trial result."""
+    return volume_bytes / _MB / result['mb_per_s']
+
+def choose_settings(results, volume_bytes, target='ratio', max_seconds=None, tolerance=DEFAULT_TOLERANCE):
+    """
+    Pick the trial result that best meets a target.
+
+    Args:
+        results: Results of run_trials
+        volume_bytes: Size of the pages to pack, for max_seconds
+        target: 'ratio' for the best ratio within max_seconds per volume, or 'fast'
+            for the fastest setting within tolerance of the best ratio
+        max_seconds: Time budget per volume for 'ratio' (optional, no limit by default)
+        tolerance: Relative ratio loss 'fast' accepts, e.g. 0.01 for 1%
+
+    Returns:
+        The chosen result dictionary
+    """
+    if target not in TARGETS:
+        raise ValueError(f"Unknown target '{target}'")
+    if target == 'fast':
+        best_ratio = min(r['ratio'] for r in results)
+        allowed = [r for r in results if r['ratio'] <= best_ratio * (1 + tolerance) + _RATIO_EPSILON]
+        return max(allowed, key=lambda r: (r['mb_per_s'], -r['decoder_memory']))
+    allowed = [r for r in results if max_seconds is None or estimated_seconds(r, volume_bytes) <= max_seconds]
+    if not allowed:
+        print(f"Warning: no setting packs {volume_bytes / _MB:.1f} MB within {max_seconds}s, using the fastest")
+        return max(results, key=lambda r: r['mb_per_s'])
+    # Ratios within _RATIO_EPSILON are a tie, which goes to the faster setting; on JPEG
+    # pages that is usually storing them as they are
+    return min(allowed, key=lambda r: (round(r['ratio'] / _RATIO_EPSILON), -r['mb_per_s']))
+
+def series_of(input_dir):
+    """Series a chapter directory belongs to: its parent directory."""
+    return os.path.dirname(os.path.abspath(input_dir))
+
+def load_cache(cache_file):
+    """Return the tuning cache, {series: trial entry}, or an empty one."""
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def save_cache(cache_file, cache):
+    temp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=1)
+    os.replace(temp_file, cache_file)
+
+def tune_volume(input_dir, target='ratio', max_seconds=None, tolerance=DEFAULT_TOLERANCE,
+                cache_file=DEFAULT_CACHE_FILE, series=None, workers=None, sample_bytes=DEFAULT_SAMPLE_BYTES,
+                report=None):
+    """
+    Return the CB7 settings for a volume, running trials only for a new series.
+
+    The trial results are cached per series, so later chapters of the same series,
+    with any target, pick their settings without compressing anything.
+
+    Args:
+        input_dir: Directory containing JPG images
+        target, max_seconds, tolerance: See choose_settings
+        cache_file: JSON file to cache trials in (optional, None to always run trials)
+        series: Name to cache the trials under (optional, the parent directory of input_dir)
+        workers, sample_bytes: See run_trials
+        report: Called with a line of output per trial (optional)
+
+    Returns:
+        Settings dictionary (see candidate_settings)
+    """
+    series = series or series_of(input_dir)
+    cache = load_cache(cache_file) if cache_file else {}
+    entry = cache.get(series)
+    if not entry:
+        start = time.perf_counter()
+        entry = {
+            'results': run_trials(input_dir, workers, sample_bytes, report=report),
+            'tuned_from': os.path.abspath(input_dir),
+            'tuned_at': time.time(),
+        }
+        print(f"Ran {len(entry['results'])} trials for '{series}' in {time.perf_counter() - start:.1f}s")
+        if cache_file:
+            # Re-read, so trials other processes saved meanwhile are kept
+            cache = load_cache(cache_file)
+            cache[series] = entry
+            save_cache(cache_file, cache)
+
+    volume_bytes = sum(page.size for page in scan_dir(input_dir))
+    chosen = choose_settings(entry['results'], volume_bytes, target, max_seconds, tolerance)
+    print(f"Settings for '{input_dir}': {describe_settings(chosen['settings'])} (ratio {chosen['ratio']:.4f}, "
+          f"~{estimated_seconds(chosen, volume_bytes):.1f}s)")
+    return chosen['settings']
+
+def add_tune_arguments(parser):
+    """Add the --tune options shared by the packer command lines."""
+    parser.add_argument('--tune', choices=TARGETS,
+                        help='Trial-compress a sample and pick settings: ratio (best ratio within '
+                             '--max-seconds) or fast (fastest within --tolerance of the best ratio)')
+    parser.add_argument('--max-seconds', type=float, help='With --tune ratio, time budget per volume')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE * 100,
+                        help='With --tune fast, ratio loss accepted in percent (default: 1)')
+    parser.add_argument('--tune-cache', default=DEFAULT_CACHE_FILE,
+                        help=f'JSON file caching the trials per series (default: {DEFAULT_CACHE_FILE})')
+
+def main():
+    parser = argparse.ArgumentParser(description='Find CB7 compression settings for a manga volume.')
+    parser.add_argument('-i', '--input', required=True, help='Directory containing JPG images')
+    parser.add_argument('-t', '--target', choices=TARGETS, default='ratio',
+                        help='ratio: best ratio within --max-seconds, fast: fastest within --tolerance '
+                             'of the best ratio (default: ratio)')
+    parser.add_argument('--max-seconds', type=float, help='Time budget per volume for --target ratio')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE * 100,
+                        help='Ratio loss accepted by --target fast, in percent (default: 1)')
+    parser.add_argument('-j', '--workers', type=int, help='Compression threads for block mode (default: CPU count)')
+    parser.add_argument('--sample', type=int, default=DEFAULT_SAMPLE_BYTES // _MB,
+                        help=f'MB of pages to trial-compress (default: {DEFAULT_SAMPLE_BYTES // _MB})')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE,
+                        help=f'JSON file caching the trials per series (default: {DEFAULT_CACHE_FILE})')
+    parser.add_argument('--series', help='Series to cache the trials under (default: parent directory)')
+    parser.add_argument('--no-cache', action='store_true', help='Always run the trials, and do not save them')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input):
+        print(f"Error: '{args.input}' is not a valid directory")
+        return
+    try:
+        tune_volume(args.input, args.target, args.max_seconds, args.tolerance / 100,
+                    None if args.no_cache else args.cache, args.series, args.workers,
+                    args.sample * _MB, report=print)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+
+if __name__ == "__main__":
+    main()
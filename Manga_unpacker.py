@@ -1,37 +1,31 @@
 import os
 import zipfile
 import argparse
-import re
-import py7zr
-import shutil
-from pathlib import Path
+from Manga_archive import detect_archive_type, extract_cbz_members, is_image_file, member_target_path
+from Manga_memory import print_peak_memory
+from Manga_profile import NO_PROFILER, StageProfiler
+from Manga_scan import IMAGE_EXTENSIONS, natural_sort_key, scan_names
 
-def natural_sort_key(s):
-    """
-    Sort strings with embedded numbers in natural order.
-    E.g. ["img1.jpg", "img10.jpg", "img2.jpg"] -> ["img1.jpg", "img2.jpg", "img10.jpg"]
-    """
-    return [int(c) if c.isdigit() else c for c in re.split(r'(\d+)', s)]
-
-def unpack_manga_archive(input_file, output_dir=None):
+def unpack_manga_archive(input_file, output_dir=None, max_memory=None, workers=None, profiler=None):
     """
     Unpack a CBZ/CB7 file to a directory of images.
     
     Args:
         input_file: Path to the CBZ/CB7 file
         output_dir: Directory to extract images to (optional)
+        max_memory: Memory cap in bytes for CB7 decoding (optional)
+        workers: Number of threads extracting CBZ members at once (optional, CPU count)
+        profiler: StageProfiler to record the time spent in each stage (optional)
     """
+    
     # Validate input file
     if not os.path.isfile(input_file):
         print(f"Error: '{input_file}' is not a valid file")
         return False
     
-    # Check if file is a CBZ or CB7
-    if input_file.lower().endswith('.cbz'):
-        archive_type = 'cbz'
-    elif input_file.lower().endswith('.cb7'):
-        archive_type = 'cb7'
-    else:
+    # Check if file is a CBZ or CB7 by its contents; Manga_packer.py writes 7z data into .cbz files
+    archive_type = detect_archive_type(input_file)
+    if archive_type not in ('cbz', 'cb7'):
         print(f"Error: '{input_file}' is not a CBZ or CB7 file")
         return False
     
@@ -41,34 +35,43 @@ def unpack_manga_archive(input_file, output_dir=None):
     
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
+    profiler = profiler or NO_PROFILER
     
     try:
         if archive_type == 'cbz':
             print(f"Extracting CBZ archive: {input_file}")
-            with zipfile.ZipFile(input_file, 'r') as zipf:
-                # Get list of image files
-                image_files = [f for f in zipf.namelist() 
-                               if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))]
+            with profiler.stage('scan'):
+                with zipfile.ZipFile(input_file, 'r') as zipf:
+                    # Get list of image files
+                    image_files = [f for f in zipf.namelist() 
+                                   if is_image_file(f)]
                 
-                # Sort images naturally
+            # Sort images naturally
+            with profiler.stage('sort'):
                 image_files.sort(key=natural_sort_key)
                 
-                # Extract each file
-                for image in image_files:
-                    zipf.extract(image, output_dir)
+            # Extract the files on several threads, keeping their directories
+            extract_cbz_members(input_file, [(image, member_target_path(output_dir, image)) for image in image_files],
+                                workers, profiler=profiler)
         
         elif archive_type == 'cb7':
             print(f"Extracting CB7 archive: {input_file}")
-            with py7zr.SevenZipFile(input_file, 'r') as archive:
-                # Extract all files
-                archive.extractall(output_dir)
+            # Imported here so extracting ZIP-based CBZs never loads py7zr
+            from Manga_extract import open_cb7
+            with profiler.stage('scan'):
+                archive = open_cb7(input_file, max_memory)
+            with archive:
+                # Extract all files, streamed to disk member by member; py7zr decodes
+                # and writes in one go, so both are timed as 'decode'
+                with profiler.stage('decode') as span:
+                    span.nbytes = sum(info.uncompressed for info in archive.list())
+                    archive.extractall(output_dir)
                 
                 # Get list of extracted image files for counting
-                image_files = [f for f in os.listdir(output_dir) 
-                               if os.path.isfile(os.path.join(output_dir, f)) and 
-                               f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))]
+                image_files = scan_names(output_dir, IMAGE_EXTENSIONS)
         
         print(f"Successfully extracted {len(image_files)} images to '{output_dir}'")
+        print_peak_memory()
         return True
     
     except Exception as e:
@@ -79,9 +82,16 @@ def main():
     parser = argparse.ArgumentParser(description='Unpack CBZ/CB7 manga files to images.')
     parser.add_argument('-i', '--input', required=True, help='Input CBZ/CB7 file')
     parser.add_argument('-o', '--output', help='Output directory (optional)')
+    parser.add_argument('--max-memory', type=int, help='Memory cap in MB (optional)')
+    parser.add_argument('-j', '--workers', type=int, help='Threads extracting CBZ members at once (default: CPU count)')
+    parser.add_argument('--profile', metavar='JSON', help='Write per-stage timings to this JSON file (optional)')
+    parser.add_argument('--trace', metavar='JSON', help='Write a Chrome trace of every stage to this file (optional)')
     args = parser.parse_args()
     
-    unpack_manga_archive(args.input, args.output)
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+    profiler = StageProfiler(trace=bool(args.trace)) if args.profile or args.trace else None
+    if unpack_manga_archive(args.input, args.output, max_memory, args.workers, profiler) and profiler:
+        profiler.save(args.profile, args.trace)
 
 if __name__ == "__main__":
     main()
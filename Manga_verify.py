@@ -0,0 +1,222 @@
+import os
+import time
+import zlib
+import struct
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import py7zr
+from Manga_extract import detect_archive_type
+from Manga_scan import find_files
+
+try:
+    from py7zr.io import Py7zIO, WriterFactory
+except ImportError:  # py7zr < 1.0 has no writer factory
+    Py7zIO = WriterFactory = None
+
+_READ_CHUNK_SIZE = 1024 * 1024
+
+class _CrcSink(Py7zIO or object):
+    """Discards decoded data, keeping only its CRC32 and length."""
+    def __init__(self, name, results):
+        self.name = name
+        self.results = results
+        self.crc = 0
+        self.written = 0
+
+    def write(self, s):
+        self.crc = zlib.crc32(s, self.crc)
+        self.written += len(s)
+        return len(s)
+
+    def read(self, size=None):
+        return b''
+
+    def seek(self, offset, whence=0):
+        return self.written
+
+    def flush(self):
+        pass
+
+    def size(self):
+        return self.written
+
+    def close(self):
+        self.results[self.name] = (self.crc, self.written)
+
+class _CrcSinkFactory(WriterFactory or object):
+    def __init__(self):
+        self.results = {}
+
+    def create(self, filename):
+        return _CrcSink(filename, self.results)
+
+def _verify_cbz(path, header_only):
+    corrupt = []
+    checked_bytes = 0
+    file_size = os.path.getsize(path)
+    with zipfile.ZipFile(path, 'r') as zipf:
+        infos = [info for info in zipf.infolist() if not info.is_dir()]
+        for info in infos:
+            if header_only:
+                # Local header must exist where the central directory says, under the same name
+                zipf.fp.seek(info.header_offset)
+                header = zipf.fp.read(30)
+                if len(header) != 30 or header[:4] != b'PK\x03\x04':
+                    corrupt.append(info.filename)
+                    continue
+                name_length, extra_length = struct.unpack('<HH', header[26:30])
+                data_end = info.header_offset + 30 + name_length + extra_length + info.compress_size
+                if data_end > file_size:
+                    corrupt.append(info.filename)
+                continue
+            try:
+                crc = 0
+                # zipfile checks the CRC itself once the member is fully read
+                with zipf.open(info) as member:
+                    for chunk in iter(lambda: member.read(_READ_CHUNK_SIZE), b''):
+                        crc = zlib.crc32(chunk, crc)
+                        checked_bytes += len(chunk)
+                if crc != info.CRC:
+                    corrupt.append(info.filename)
+            except (zipfile.BadZipFile, zlib.error, EOFError, OSError, NotImplementedError):
+                corrupt.append(info.filename)
+    return len(infos), corrupt, checked_bytes
+
+def _verify_cb7(path, header_only):
+    corrupt = []
+    with py7zr.SevenZipFile(path, 'r') as archive:
+        infos = [info for info in archive.list() if not info.is_directory]
+        if header_only:
+            # py7zr already checked the header CRC; make sure the packed streams fit in the file
+            main = archive.header.main_streams
+            if main is not None and main.packinfo is not None:
+                end = 32 + main.packinfo.packpos + sum(main.packinfo.packsizes)
+                if end > os.path.getsize(path):
+                    corrupt = [info.filename for info in infos]
+            return len(infos), corrupt, 0
+
+        if WriterFactory is None:
+            bad = archive.testzip()
+            return len(infos), [bad] if bad else [], sum(info.uncompressed for info in infos)
+
+        factory = _CrcSinkFactory()
+        try:
+            archive.extract(factory=factory)
+        except Exception:
+            # Decoding stopped; whatever did not come out intact is reported below
+            pass
+        checked_bytes = 0
+        for info in infos:
+            result = factory.results.get(info.filename)
+            if result is None or result[1] != info.uncompressed or \
+                    (info.crc32 is not None and result[0] != info.crc32):
+                corrupt.append(info.filename)
+            else:
+                checked_bytes += result[1]
+    return len(infos), corrupt, checked_bytes
+
+def verify_archive(path, header_only=False):
+    """
+    Check that a CBZ/CB7 file is intact without writing anything to disk.
+
+    A full check decompresses every member into a null sink and compares its CRC32
+    with the stored value. A header-only check just parses the central directory /
+    7z header and checks that every member's data lies inside the file.
+
+    Returns:
+        Dictionary with path, format, status ('ok', 'corrupt' or 'error'), member
+        count, corrupt member names, archive bytes, bytes checked and seconds taken
+    """
+    start = time.perf_counter()
+    result = {
+        'path': path,
+        'format': None,
+        'status': 'ok',
+        'members': 0,
+        'corrupt': [],
+        'archive_bytes': 0,
+        'checked_bytes': 0,
+        'seconds': 0.0,
+    }
+    try:
+        result['archive_bytes'] = os.path.getsize(path)
+        result['format'] = detect_archive_type(path)
+        if result['format'] == 'cbz':
+            members, corrupt, checked = _verify_cbz(path, header_only)
+        elif result['format'] == 'cb7':
+            members, corrupt, checked = _verify_cb7(path, header_only)
+        else:
+            raise ValueError("not a CBZ or CB7 file")
+        result.update(members=members, corrupt=corrupt, checked_bytes=checked)
+        if corrupt:
+            result['status'] = 'corrupt'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def find_archives(input_path):
+    """Return the CBZ/CB7 files at input_path (a file, or a directory searched recursively)."""
+    return find_files(input_path)
+
+def verify_library(archives, workers=None, header_only=False, report=print):
+    """
+    Verify many archives in parallel worker processes.
+
+    Args:
+        archives: List of archive paths
+        workers: Number of worker processes (optional, defaults to the CPU count)
+        header_only: Only run the quick header check
+        report: Called with each line of per-archive output (optional)
+
+    Returns:
+        Summary dictionary with counts per status, byte totals, wall time and the
+        per-archive results
+    """
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(verify_archive, archives, [header_only] * len(archives), chunksize=4):
+            results.append(result)
+            if result['status'] == 'ok':
+                report(f"OK       {result['path']} ({result['members']} members)")
+            elif result['status'] == 'corrupt':
+                report(f"CORRUPT  {result['path']}: {', '.join(result['corrupt'])}")
+            else:
+                report(f"ERROR    {result['path']}: {result.get('error', '')}")
+
+    wall = time.perf_counter() - start
+    archive_bytes = sum(r['archive_bytes'] for r in results)
+    return {
+        'archives': len(results),
+        'ok': sum(1 for r in results if r['status'] == 'ok'),
+        'corrupt': sum(1 for r in results if r['status'] == 'corrupt'),
+        'errors': sum(1 for r in results if r['status'] == 'error'),
+        'archive_bytes': archive_bytes,
+        'checked_bytes': sum(r['checked_bytes'] for r in results),
+        'wall_seconds': wall,
+        'mb_per_s': archive_bytes / (1024 * 1024) / wall if wall else 0.0,
+        'results': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify CBZ/CB7 archives against their stored CRCs.')
+    parser.add_argument('-i', '--input', required=True, help='Archive file or directory of archives')
+    parser.add_argument('-j', '--workers', type=int, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--quick', action='store_true', help='Only check the central directory / 7z header')
+    args = parser.parse_args()
+
+    archives = find_archives(args.input)
+    if not archives:
+        print(f"Error: No CBZ/CB7 files found in '{args.input}'")
+        return
+    summary = verify_library(archives, args.workers, args.quick)
+    print(f"Verified {summary['archives']} archives: {summary['ok']} ok, "
+          f"{summary['corrupt']} corrupt, {summary['errors']} unreadable")
+    print(f"{summary['archive_bytes'] / (1024 * 1024):.1f} MB in {summary['wall_seconds']:.1f}s "
+          f"({summary['mb_per_s']:.1f} MB/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import os
+import time
+import zipfile
+import argparse
+from Manga_archive import detect_archive_type, flatten_page_names, is_image_file
+from Manga_journal import atomic_output
+from Manga_scan import natural_sort_key, scan_dir
+from Manga_zipcopy import copy_member_raw
+
+def page_name(number, total, member):
+    """Zero-padded page name that sorts the same way as a string and naturally, e.g. '007.jpg'."""
+    width = max(3, len(str(total)))
+    return f"{number:0{width}d}{os.path.splitext(member)[1].lower()}"
+
+def _open_cbz(path):
+    """Open a ZIP-based CBZ, refusing 7z-based ones whose members cannot be copied raw."""
+    if detect_archive_type(path) != 'cbz':
+        raise ValueError(f"'{path}' is not a ZIP-based CBZ; convert it with Manga_transcode.py first")
+    return zipfile.ZipFile(path, 'r')
+
+def find_chapters(input_paths):
+    """
+    Expand input paths into a list of CBZ files.
+
+    Directories are replaced by the CBZ files directly inside them, in natural order;
+    files given one by one keep the order they were given in.
+    """
+    chapters = []
+    for path in input_paths:
+        if os.path.isdir(path):
+            chapters.extend(entry.path for entry in scan_dir(path, ('.cbz',)))
+        else:
+            chapters.append(path)
+    return chapters
+
+def merge_cbz(chapters, output_file, folders=False):
+    """
+    Merge chapter CBZs into one volume CBZ without recompressing any page.
+
+    Each page's compressed bytes and CRC are copied as they are, so the merge runs at
+    close to disk speed. Pages are renamed to 001.jpg, 002.jpg, ... across all
+    chapters, in chapter order and natural page order within each chapter.
+
+    Args:
+        chapters: List of CBZ paths, in reading order
+        output_file: Path of the volume CBZ
+        folders: Put each chapter's pages in a folder named after the chapter file,
+            so split_cbz can split the volume back into the same chapters
+
+    Returns:
+        Number of pages written
+    """
+    sources = []
+    try:
+        for chapter in chapters:
+            zipf = _open_cbz(chapter)
+            sources.append((chapter, zipf, flatten_page_names(zipf.namelist())))
+        total = sum(len(pages) for _, _, pages in sources)
+
+        number = 0
+        with atomic_output(output_file) as temp_file, zipfile.ZipFile(temp_file, 'w') as target:
+            for chapter, zipf, pages in sources:
+                prefix = os.path.splitext(os.path.basename(chapter))[0] + '/' if folders else ''
+                skipped = len([m for m in zipf.namelist() if not m.endswith('/')]) - len(pages)
+                if skipped:
+                    print(f"Skipping {skipped} non-image members of '{chapter}'")
+                for member, _ in pages:
+                    number += 1
+                    copy_member_raw(zipf, zipf.getinfo(member), target, prefix + page_name(number, total, member))
+        return number
+    finally:
+        for _, zipf, _ in sources:
+            zipf.close()
+
+def split_cbz(input_file, output_dir=None, every=None, starts=None):
+    """
+    Split a volume CBZ into chapter CBZs without recompressing any page.
+
+    Without every/starts the volume is split by its top-level folders (as written by
+    merge_cbz with folders=True), one CBZ per folder. Pages are renumbered from 001
+    in each part.
+
+    Args:
+        input_file: Path of the volume CBZ
+        output_dir: Directory for the parts (optional, next to the volume)
+        every: Start a new part every this many pages (optional)
+        starts: 1-based page numbers that start a new part, e.g. [25, 49] (optional)
+
+    Returns:
+        List of (part path, page count) tuples
+    """
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    output_dir = output_dir or os.path.dirname(os.path.abspath(input_file))
+    os.makedirs(output_dir, exist_ok=True)
+
+    with _open_cbz(input_file) as zipf:
+        if every or starts:
+            pages = [member for member, _ in flatten_page_names(zipf.namelist())]
+            cuts = set(range(every, len(pages), every)) if every else {n - 1 for n in starts if 1 < n <= len(pages)}
+            parts = []
+            for i, member in enumerate(pages):
+                if not parts or i in cuts:
+                    parts.append([])
+                parts[-1].append(member)
+            width = max(2, len(str(len(parts))))
+            named = [(f"{stem}_{n:0{width}d}", part) for n, part in enumerate(parts, 1)]
+        else:
+            groups = {}
+            for member in zipf.namelist():
+                path = member.replace('\\', '/')
+                if is_image_file(path) and '/' in path:
+                    groups.setdefault(path.split('/', 1)[0], []).append(member)
+            if not groups:
+                raise ValueError(f"'{input_file}' has no chapter folders; give the pages to split at")
+            named = []
+            for folder in sorted(groups, key=natural_sort_key):
+                named.append((folder, [member for member, _ in flatten_page_names(groups[folder])]))
+
+        written = []
+        for name, members in named:
+            part_file = os.path.join(output_dir, name + '.cbz')
+            with atomic_output(part_file) as temp_file, zipfile.ZipFile(temp_file, 'w') as target:
+                for number, member in enumerate(members, 1):
+                    copy_member_raw(zipf, zipf.getinfo(member), target, page_name(number, len(members), member))
+            written.append((part_file, len(members)))
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge chapter CBZs into volumes and split volumes into chapters '
+                                                 'without recompressing pages.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    merge = subparsers.add_parser('merge', help='Merge chapter CBZs into one volume')
+    merge.add_argument('-i', '--input', required=True, nargs='+',
+                       help='Chapter CBZ files in reading order, or a directory of chapters')
+    merge.add_argument('-o', '--output', required=True, help='Output volume CBZ')
+    merge.add_argument('--folders', action='store_true',
+                       help='Keep each chapter in its own folder, so the volume can be split again')
+
+    split = subparsers.add_parser('split', help='Split a volume CBZ into chapters')
+    split.add_argument('-i', '--input', required=True, help='Volume CBZ')
+    split.add_argument('-o', '--output', help='Output directory (optional, next to the volume)')
+    split.add_argument('--every', type=int, help='Start a new chapter every this many pages')
+    split.add_argument('--at', help='Comma-separated page numbers that start a new chapter, e.g. 25,49')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        if args.command == 'merge':
+            chapters = find_chapters(args.input)
+            if not chapters:
+                print("Error: No CBZ files to merge")
+                return
+            count = merge_cbz(chapters, args.output, args.folders)
+            total = os.path.getsize(args.output)
+            print(f"Merged {len(chapters)} chapters ({count} pages) into '{args.output}'")
+        else:
+            starts = [int(n) for n in args.at.split(',')] if args.at else None
+            parts = split_cbz(args.input, args.output, args.every, starts)
+            for part_file, count in parts:
+                print(f"Wrote '{part_file}' ({count} pages)")
+            total = sum(os.path.getsize(part_file) for part_file, _ in parts)
+        seconds = time.perf_counter() - start
+        print(f"{total / (1024 * 1024):.1f} MB in {seconds:.2f}s "
+              f"({total / (1024 * 1024) / seconds if seconds else 0.0:.1f} MB/s)")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+if __name__ == "__main__":
+    main()
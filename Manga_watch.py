@@ -0,0 +1,366 @@
+import os
+import time
+import struct
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from Manga_batch import PACKERS, default_memory_budget, estimate_job_memory, output_path, pack_chapter, print_summary
+from Manga_scan import is_page
+
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _libc.inotify_init1
+except (OSError, AttributeError, TypeError):  # Not Linux: polling only
+    _libc = None
+
+DEFAULT_SETTLE_SECONDS = 10.0
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_MAX_QUEUE = 64
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_WATCH_MASK = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct('iIII')
+
+class _Inotify:
+    """Minimal inotify wrapper: one watch per directory, read without blocking."""
+    def __init__(self):
+        self.fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {}
+
+    def add(self, path):
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch '{path}'")
+        self.paths[wd] = path
+
+    def changed_dirs(self):
+        """Return the directories with events since the last call, or None after a queue overflow."""
+        changed = set()
+        overflow = False
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+                offset += _EVENT_HEADER.size + length
+                if mask & _IN_Q_OVERFLOW:
+                    overflow = True
+                elif mask & _IN_IGNORED:
+                    self.paths.pop(wd, None)
+                elif wd in self.paths:
+                    changed.add(self.paths[wd])
+        return None if overflow else changed
+
+    def close(self):
+        os.close(self.fd)
+
+def _chapter_signature(chapter_dir):
+    """(page count, total bytes, newest mtime) of a chapter, or None if it has no pages."""
+    count = size = newest = 0
+    try:
+        with os.scandir(chapter_dir) as entries:
+            for entry in entries:
+                if is_page(entry.name) and entry.is_file():
+                    st = entry.stat()
+                    count += 1
+                    size += st.st_size
+                    newest = max(newest, st.st_mtime_ns)
+    except OSError:
+        return None
+    return (count, size, newest) if count else None
+
+class ChapterWatcher:
+    """
+    Tracks the chapter directories (leaf directories with JPG pages) under a root and
+    reports each one once its pages have stopped changing for settle_seconds.
+
+    On Linux directory changes come from inotify. Elsewhere, or if inotify runs out of
+    watches, every poll stats the known directories and relists only those whose mtime
+    moved, so pages are never rescanned across the whole tree. Polling notices added,
+    removed and renamed pages; a page rewritten in place is only seen with inotify.
+    """
+    def __init__(self, root, settle_seconds=DEFAULT_SETTLE_SECONDS, exclude=None, use_inotify=True):
+        self.root = os.path.abspath(root)
+        self.settle_seconds = settle_seconds
+        self.exclude = os.path.abspath(exclude) if exclude else None
+        self._dirs = {}        # directory -> (mtime_ns, subdirectories)
+        self._candidates = {}  # chapter dir -> [signature, time of its last change]
+        self._inotify = None
+        if use_inotify and _libc is not None:
+            try:
+                self._inotify = _Inotify()
+            except OSError as e:
+                print(f"inotify unavailable ({e}), polling instead")
+        self._scan(self.root)
+
+    @property
+    def mode(self):
+        return 'inotify' if self._inotify is not None else 'polling'
+
+    @property
+    def pending(self):
+        """Number of chapters seen but not settled yet."""
+        return len(self._candidates)
+
+    def _fall_back_to_polling(self, reason):
+        print(f"{reason}, polling instead")
+        self._inotify.close()
+        self._inotify = None
+
+    def _scan(self, path):
+        """List path, start tracking any new subdirectories below it and note chapters."""
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            if self._inotify is not None and directory not in self._dirs:
+                # Watch before listing, so nothing created in between is missed
+                try:
+                    self._inotify.add(directory)
+                except OSError as e:
+                    if os.path.isdir(directory):
+                        self._fall_back_to_polling(str(e))
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                self._forget(directory)
+                continue
+
+            subdirs = [entry.path for entry in entries
+                       if entry.is_dir(follow_symlinks=False) and os.path.abspath(entry.path) != self.exclude]
+            previous = self._dirs.get(directory)
+            self._dirs[directory] = (mtime, subdirs)
+            if previous:
+                for gone in set(previous[1]) - set(subdirs):
+                    self._forget(gone)
+            stack.extend(sub for sub in subdirs if sub not in self._dirs)
+
+            if not subdirs and any(is_page(entry.name) for entry in entries):
+                self._candidates.setdefault(directory, [None, 0.0])
+            else:
+                self._candidates.pop(directory, None)
+
+    def _forget(self, directory):
+        entry = self._dirs.pop(directory, None)
+        self._candidates.pop(directory, None)
+        if entry:
+            for sub in entry[1]:
+                self._forget(sub)
+
+    def _changed_dirs(self):
+        if self._inotify is not None:
+            changed = self._inotify.changed_dirs()
+            if changed is not None:
+                return changed
+            # Events were lost; relist everything once
+            return list(self._dirs)
+        changed = []
+        for directory, (mtime, _) in list(self._dirs.items()):
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    changed.append(directory)
+            except OSError:
+                changed.append(directory)
+        return changed
+
+    def poll(self, limit):
+        """
+        Pick up directory changes and return up to limit settled chapters.
+
+        Chapters beyond the limit are not even looked at, so a burst of new
+        directories costs work in proportion to the room left in the queue.
+
+        Returns:
+            List of (chapter directory, total page bytes) tuples
+        """
+        for directory in self._changed_dirs():
+            if directory in self._dirs or os.path.dirname(directory) in self._dirs:
+                self._scan(directory)
+
+        now = time.monotonic()
+        settled = []
+        for chapter, state in list(self._candidates.items()):
+            if len(settled) >= limit:
+                break
+            signature = _chapter_signature(chapter)
+            if signature is None:
+                del self._candidates[chapter]
+            elif signature != state[0]:
+                state[0] = signature
+                state[1] = now
+            elif now - state[1] >= self.settle_seconds:
+                del self._candidates[chapter]
+                settled.append((chapter, signature[1]))
+        return settled
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+def watch_library(watch_root, output_root=None, format_type='cbz', workers=None,
+                  settle_seconds=DEFAULT_SETTLE_SECONDS, poll_interval=DEFAULT_POLL_INTERVAL,
+                  max_queue=DEFAULT_MAX_QUEUE, max_memory=None, hash_content=False, once=False,
+                  use_inotify=True):
+    """
+    Watch a drop directory and pack chapters as soon as they settle.
+
+    Settled chapters wait in a deduplicated queue of at most max_queue entries and are
+    handed to the worker pool under the same worker and memory limits as pack_library.
+    Chapters are packed incrementally, so a restart or a re-settled chapter whose pages
+    did not change is skipped quickly.
+
+    Args:
+        watch_root: Directory to watch
+        output_root: Directory to mirror the tree into (optional, archives are written
+            next to each chapter directory by default)
+        format_type: 'cbz' (7z-compressed CBZ), 'cb7' or 'zip' (standard CBZ)
+        workers: Number of worker processes (optional, defaults to the CPU count)
+        settle_seconds: How long a chapter must stay unchanged before it is packed
+        poll_interval: Seconds between checks for changes
+        max_queue: Maximum settled chapters waiting for a worker
+        max_memory: In-flight memory budget in bytes (optional, half of physical memory)
+        hash_content: Compare page hashes when mtimes differ (see Manga_incremental)
+        once: Return once every chapter seen has been packed, instead of running until
+            interrupted
+        use_inotify: Use inotify where available (polling otherwise)
+
+    Returns:
+        Summary dictionary, as returned by pack_library
+    """
+    if format_type not in PACKERS:
+        raise ValueError(f"Unknown format '{format_type}'")
+    if not os.path.isdir(watch_root):
+        raise ValueError(f"'{watch_root}' is not a valid directory")
+
+    workers = workers or os.cpu_count() or 1
+    if max_memory is None:
+        max_memory = default_memory_budget()
+
+    start = time.perf_counter()
+    summary = {
+        'chapters': 0,
+        'archives': 0,
+        'skipped': 0,
+        'failed': [],
+        'bytes_in': 0,
+        'bytes_out': 0,
+        'wall_seconds': 0.0,
+    }
+    watcher = ChapterWatcher(watch_root, settle_seconds, output_root, use_inotify)
+    print(f"Watching '{watch_root}' ({watcher.mode}), {watcher.pending} chapters found, "
+          f"packing with {workers} workers")
+
+    ready = OrderedDict()  # chapter dir -> page bytes, one entry per chapter
+    in_flight = {}
+    running = set()
+    in_flight_memory = 0
+    next_poll = 0.0
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                now = time.monotonic()
+                if now >= next_poll:
+                    for chapter_dir, input_bytes in watcher.poll(max_queue - len(ready)):
+                        ready[chapter_dir] = input_bytes
+                    next_poll = now + poll_interval
+
+                # A chapter already being packed stays queued until that job is done
+                for chapter_dir in list(ready):
+                    if len(in_flight) >= workers:
+                        break
+                    if chapter_dir in running:
+                        continue
+                    needed = estimate_job_memory(ready[chapter_dir], format_type)
+                    if in_flight and max_memory is not None and in_flight_memory + needed > max_memory:
+                        break
+                    input_bytes = ready.pop(chapter_dir)
+                    output_file = output_path(chapter_dir, watch_root, output_root, format_type)
+                    future = executor.submit(pack_chapter, chapter_dir, output_file, format_type,
+                                             True, hash_content)
+                    in_flight[future] = (chapter_dir, input_bytes, needed)
+                    running.add(chapter_dir)
+                    in_flight_memory += needed
+
+                if once and not in_flight and not ready and not watcher.pending:
+                    break
+                timeout = max(0.0, next_poll - time.monotonic())
+                if not in_flight:
+                    time.sleep(timeout)
+                    continue
+
+                finished, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chapter_dir, input_bytes, needed = in_flight.pop(future)
+                    running.discard(chapter_dir)
+                    in_flight_memory -= needed
+                    summary['chapters'] += 1
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'ok': False, 'bytes_out': 0, 'error': str(e)}
+
+                    if result.get('status') == 'skipped':
+                        summary['skipped'] += 1
+                    elif result['ok']:
+                        summary['archives'] += 1
+                        summary['bytes_in'] += input_bytes
+                        summary['bytes_out'] += result['bytes_out']
+                        print(f"Packed '{chapter_dir}' ({result['seconds']:.1f}s, {len(ready)} queued)")
+                    else:
+                        summary['failed'].append(chapter_dir)
+                        print(f"Failed '{chapter_dir}' {result.get('error', '')}".rstrip())
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        watcher.close()
+
+    summary['wall_seconds'] = time.perf_counter() - start
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Watch a drop directory and pack chapters once they stop changing.')
+    parser.add_argument('-i', '--input', required=True, help='Directory to watch')
+    parser.add_argument('-o', '--output', help='Output root directory (optional, defaults to next to each chapter)')
+    parser.add_argument('-f', '--format', choices=sorted(PACKERS), default='cbz', help='Archive format (default: cbz)')
+    parser.add_argument('-j', '--workers', type=int, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help='Seconds a chapter must stay unchanged before packing (default: 10)')
+    parser.add_argument('--interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='Seconds between checks for changes (default: 2)')
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                        help='Maximum settled chapters waiting for a worker (default: 64)')
+    parser.add_argument('--max-memory', type=int, help='In-flight memory budget in MB (default: half of RAM)')
+    parser.add_argument('--hash', action='store_true', help='Compare page contents when mtimes differ')
+    parser.add_argument('--poll', action='store_true', help='Poll directory mtimes instead of using inotify')
+    parser.add_argument('--once', action='store_true', help='Exit once every chapter found has been packed')
+    args = parser.parse_args()
+
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+    try:
+        summary = watch_library(args.input, args.output, args.format, args.workers, args.settle,
+                                args.interval, args.max_queue, max_memory, args.hash, args.once,
+                                not args.poll)
+    except Exception as e:
+        print(f"Error watching library: {str(e)}")
+        return
+    print_summary(summary)
+
+if __name__ == "__main__":
+    main()
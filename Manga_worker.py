@@ -0,0 +1,280 @@
+import os
+import queue
+import shutil
+import zipfile
+import threading
+import py7zr
+from Manga_extract import detect_archive_type, extract_archive_pages, extract_cbz_members, is_image_file
+from Manga_memory import BASE_MEMORY, buffer_size, plan_lzma2_pack, print_peak_memory
+from Manga_optimize import optimize_for_archive
+from Manga_policy import CompressionPolicy, DEFLATE
+from Manga_pipeline import write_7z_archive, write_zip_archive, DEFAULT_BUFFER_SIZE
+from Manga_profile import NO_PROFILER
+from Manga_scan import natural_sort_key, scan_names
+
+# The pack and unpack operations of the GUI, free of tkinter so scripts such as
+# Manga_benchmark.py can run them without a display
+
+class OperationCancelled(Exception):
+    """Raised in a worker thread once the user has pressed Cancel."""
+
+class ProgressReporter:
+    """
+    Thread-safe channel for progress events from a worker thread to the GUI.
+
+    The worker posts ('start', total), ('advance', pages, bytes) and ('finish', status)
+    events; the GUI drains them on its timer. advance() raises OperationCancelled once
+    cancel() has been called, so the worker unwinds from wherever it is.
+    """
+    def __init__(self):
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+
+    def start(self, total):
+        self.events.put(('start', total))
+
+    def advance(self, pages=1, nbytes=0):
+        if self.cancelled.is_set():
+            raise OperationCancelled()
+        self.events.put(('advance', pages, nbytes))
+
+    def finish(self, status):
+        self.events.put(('finish', status))
+
+    def cancel(self):
+        self.cancelled.set()
+
+def save_profile(profiler, output_path):
+    """Write the profile and trace next to output_path and print the report to the log."""
+    base = os.path.normpath(output_path)
+    profiler.save(base + '.profile.json', base + '.trace.json')
+
+def pack_worker(source_dir, output_file, format_type, max_memory=None, profiler=None, optimize=False, progress=None):
+    """
+    Pack a directory of JPG images into a CBZ (ZIP) or CB7 file, the way the GUI does.
+
+    Args:
+        source_dir: Directory containing JPG images
+        output_file: Path of the archive (optional, named after source_dir)
+        format_type: 'cbz' or 'cb7'
+        max_memory: Memory cap in bytes (optional)
+        profiler: StageProfiler timing the stages (optional)
+        optimize: Pack optimized copies of the pages (see Manga_optimize)
+        progress: ProgressReporter receiving the progress events (optional)
+
+    Returns:
+        'done', 'cancelled' or 'failed'
+    """
+    status = 'failed'
+    stages = profiler or NO_PROFILER
+    work_dir = None
+    try:
+        print(f"Packing manga from {source_dir}...")
+        
+        # Validate input directory
+        if not os.path.isdir(source_dir):
+            print(f"Error: '{source_dir}' is not a valid directory")
+            return status
+        
+        # Get all JPG files
+        with stages.stage('scan'):
+            jpg_files = scan_names(source_dir)
+        
+        if not jpg_files:
+            print(f"Error: No JPG images found in '{source_dir}'")
+            return status
+        
+        # Sort files naturally
+        with stages.stage('sort'):
+            jpg_files.sort(key=natural_sort_key)
+        
+        # Determine output filename if not provided
+        if not output_file:
+            output_file = os.path.basename(os.path.normpath(source_dir))
+            
+            # Add extension if not present
+            if format_type == "cb7" and not output_file.lower().endswith('.cb7'):
+                output_file += '.cb7'
+            elif format_type == "cbz" and not output_file.lower().endswith('.cbz'):
+                output_file += '.cbz'
+        
+        # Source paths by archive name, for the byte counts of the progress display
+        page_paths = {os.path.basename(jpg_file): os.path.join(source_dir, jpg_file) for jpg_file in jpg_files}
+        
+        # Pack optimized copies of the pages, from a temporary directory removed at the end
+        if optimize:
+            with stages.stage('optimize'):
+                files, work_dir = optimize_for_archive(list(page_paths.items()))
+            page_paths = dict(files)
+        
+        def report_progress(done, total, name):
+            if progress is not None:
+                progress.advance(1, os.path.getsize(page_paths[name]))
+        
+        if progress is not None:
+            progress.start(len(jpg_files))
+        
+        if format_type == "cb7":
+            # Pack as CB7 with LZMA2 Ultra
+            print("Using 7z LZMA2 Ultra compression")
+            
+            # Create CB7 file with optimal settings; 32MB is usually sufficient for
+            # manga, and the dictionary shrinks further to fit a memory cap
+            dict_size, max_buffered = plan_lzma2_pack(max_memory, 32 * 1024 * 1024, DEFAULT_BUFFER_SIZE)
+            optimal_filters = [
+                {
+                    'id': py7zr.FILTER_LZMA2,
+                    'preset': 9,
+                    'dict_size': dict_size
+                }
+            ]
+            
+            write_7z_archive(output_file, list(page_paths.items()), optimal_filters,
+                             max_buffered=max_buffered, progress_callback=report_progress, profiler=profiler)
+            
+        else:
+            # Pack as CBZ, storing pages that are already compressed (e.g. JPEG)
+            print("Using standard ZIP compression")
+            policy = CompressionPolicy(baseline=DEFLATE)
+            
+            # Pages are compressed on worker threads and written in order
+            max_buffered = buffer_size(max_memory, BASE_MEMORY, DEFAULT_BUFFER_SIZE)
+            write_zip_archive(output_file, list(page_paths.items()), policy, max_buffered=max_buffered,
+                              progress_callback=report_progress, profiler=profiler)
+            
+            policy.print_report()
+        
+        print(f"Successfully created '{output_file}' with {len(jpg_files)} images")
+        print_peak_memory()
+        if profiler is not None:
+            save_profile(profiler, output_file)
+        status = 'done'
+        
+    except OperationCancelled:
+        status = 'cancelled'
+        # The archive is written to a temporary file, so nothing is left behind
+        print(f"Packing cancelled, '{output_file}' was not written")
+    except Exception as e:
+        print(f"Error packing manga: {str(e)}")
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if progress is not None:
+            progress.finish(status)
+    return status
+
+def unpack_worker(source_file, output_dir, max_memory=None, profiler=None, progress=None):
+    """
+    Extract the pages of a CBZ or CB7 file, telling the two apart by their contents,
+    the way the GUI does.
+
+    Args:
+        source_file: Path of the CBZ/CB7 file
+        output_dir: Directory for the pages (optional, named after source_file)
+        max_memory: Memory cap in bytes (optional)
+        profiler: StageProfiler timing the stages (optional)
+        progress: ProgressReporter receiving the progress events (optional)
+
+    Returns:
+        'done', 'cancelled' or 'failed'
+    """
+    status = 'failed'
+    stages = profiler or NO_PROFILER
+    try:
+        print(f"Unpacking manga from {source_file}...")
+        
+        # Validate input file
+        if not os.path.isfile(source_file):
+            print(f"Error: '{source_file}' is not a valid file")
+            return status
+        
+        # Check if file is a CBZ or CB7 by its contents; 7z-compressed CBZs are unpacked as CB7
+        archive_type = detect_archive_type(source_file)
+        if archive_type not in ('cbz', 'cb7'):
+            print(f"Error: '{source_file}' is not a CBZ or CB7 file")
+            return status
+        
+        # Determine output directory if not provided
+        if not output_dir:
+            output_dir = os.path.splitext(source_file)[0]
+        
+        # Create output directory if it doesn't exist
+        os.makedirs(output_dir, exist_ok=True)
+        
+        if archive_type == 'cbz':
+            print(f"Extracting CBZ archive: {source_file}")
+            with zipfile.ZipFile(source_file, 'r') as zipf:
+                # Get list of image files
+                with stages.stage('scan'):
+                    image_files = [f for f in zipf.namelist() 
+                                   if is_image_file(f)]
+                
+                # Check if there are directories in the archive
+                directories = set()
+                for path in image_files:
+                    if '/' in path or '\\' in path:
+                        dir_path = os.path.dirname(path)
+                        directories.add(dir_path)
+                
+                # Report directory structure if found
+                if directories:
+                    print(f"Found {len(directories)} directories in the archive:")
+                    for dir_path in sorted(directories):
+                        print(f" - {dir_path}")
+                    print("All files will be extracted to the root output directory.")
+                
+                # Sort images naturally (considering filenames only, not paths)
+                with stages.stage('sort'):
+                    image_files.sort(key=lambda x: natural_sort_key(os.path.basename(x)))
+                print(f"Found {len(image_files)} images to extract")
+                
+            # Extract on several threads at once - flatten directory structure. Images
+            # whose flattened names collide are written once, so total can be lower
+            def report_progress(done, total, filename):
+                if progress is not None:
+                    if done == 1:
+                        progress.start(total)
+                    progress.advance(1, os.path.getsize(os.path.join(output_dir, filename)))
+            
+            count = extract_cbz_members(source_file,
+                                        [(image, os.path.join(output_dir, os.path.basename(image)))
+                                         for image in image_files],
+                                        progress_callback=report_progress, profiler=profiler)
+            
+            print(f"Extracted {count} images to '{output_dir}'")
+        
+        elif archive_type == 'cb7':
+            print(f"Extracting CB7 archive: {source_file}")
+            # Decode the solid stream once and write each page to its flattened name
+            def report_progress(done, total, filename):
+                if progress is not None:
+                    if done == 1:
+                        progress.start(total)
+                    progress.advance(1, os.path.getsize(os.path.join(output_dir, filename)))
+                if done == total or done % 25 == 0:
+                    print(f"Extracted {done}/{total} images")
+            
+            # Decoding and writing pages happen together inside py7zr
+            with stages.stage('decode'):
+                count = extract_archive_pages(source_file, output_dir, 'cb7', progress_callback=report_progress,
+                                              max_memory=max_memory)
+            print(f"Extracted {count} images to '{output_dir}'")
+        
+        print(f"Successfully extracted all images to '{output_dir}'")
+        print_peak_memory()
+        if profiler is not None:
+            save_profile(profiler, output_dir)
+        status = 'done'
+        
+    except OperationCancelled:
+        status = 'cancelled'
+        print(f"Unpacking cancelled, pages extracted so far are in '{output_dir}'")
+    except Exception as e:
+        print(f"Error unpacking manga: {str(e)}")
+        # Print more detailed error for debugging
+        import traceback
+        print(traceback.format_exc())
+    finally:
+        if progress is not None:
+            progress.finish(status)
+    return status
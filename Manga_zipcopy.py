@@ -0,0 +1,89 @@
+import struct
+import zipfile
+
+_LOCAL_HEADER_SIZE = 30
+_MASK_USE_DATA_DESCRIPTOR = 0x08
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+def _member_data_offset(source, info):
+    """Return the offset of a member's compressed data in the source ZIP file."""
+    source.fp.seek(info.header_offset)
+    header = source.fp.read(_LOCAL_HEADER_SIZE)
+    if len(header) != _LOCAL_HEADER_SIZE or header[:4] != b'PK\x03\x04':
+        raise zipfile.BadZipFile(f"Bad local header for '{info.filename}'")
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    return info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length
+
+def copy_member_raw(source, info, target, arcname=None, date_time=None):
+    """
+    Copy one member from an open ZIP into another without decompressing it.
+
+    The compressed bytes and stored CRC are written as they are, under a fresh local
+    header and central directory entry, so the copy runs at disk speed.
+
+    Args:
+        source: zipfile.ZipFile opened for reading
+        info: ZipInfo of the member to copy
+        target: zipfile.ZipFile opened for writing or appending
+        arcname: Name of the member in the target (optional, defaults to the source name)
+        date_time: Timestamp tuple for the copy (optional, defaults to the source one)
+    """
+    if info.flag_bits & 0x01:
+        raise ValueError(f"'{info.filename}' is encrypted and cannot be copied raw")
+
+    new = zipfile.ZipInfo(arcname or info.filename, date_time or info.date_time)
+    new.compress_type = info.compress_type
+    new.CRC = info.CRC
+    new.compress_size = info.compress_size
+    new.file_size = info.file_size
+    new.external_attr = info.external_attr
+    new.create_system = info.create_system
+    # Sizes go into the local header, so no data descriptor follows the data
+    new.flag_bits = info.flag_bits & ~_MASK_USE_DATA_DESCRIPTOR
+
+    offset = _member_data_offset(source, info)
+
+    def read_chunks():
+        source.fp.seek(offset)
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = source.fp.read(min(_COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated data for '{info.filename}'")
+            yield chunk
+            remaining -= len(chunk)
+
+    return _write_raw(target, new, read_chunks())
+
+def write_member_raw(target, zinfo, compressed):
+    """
+    Add a member whose data was already compressed, e.g. in a worker thread.
+
+    Args:
+        target: zipfile.ZipFile opened for writing or appending
+        zinfo: ZipInfo with filename, date_time, compress_type, CRC, file_size and
+            compress_size filled in
+        compressed: Compressed bytes of the member
+    """
+    if zinfo.compress_type == zipfile.ZIP_LZMA:
+        # Compressed data includes an end-of-stream marker, as zipfile writes it
+        zinfo.flag_bits |= 0x02
+    return _write_raw(target, zinfo, [compressed])
+
+def _write_raw(target, zinfo, chunks):
+    """Write a local header followed by already-compressed chunks and register the member."""
+    with target._lock:
+        if target._writing:
+            raise ValueError("Can't copy into the ZIP file while another write handle is open on it")
+        if target._seekable:
+            target.fp.seek(target.start_dir)
+        zinfo.header_offset = target.fp.tell()
+        target._writecheck(zinfo)
+        target._didModify = True
+        target.fp.write(zinfo.FileHeader())
+        for chunk in chunks:
+            target.fp.write(chunk)
+        target.start_dir = target.fp.tell()
+        target.filelist.append(zinfo)
+        target.NameToInfo[zinfo.filename] = zinfo
+    return zinfo
@@ -0,0 +1,47 @@
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Manga_incremental import pack_incremental
+
+class SwappedArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def make_chapter(self, name, marker):
+        directory = os.path.join(self.root, name)
+        os.makedirs(directory)
+        for i in range(3):
+            with open(os.path.join(directory, f"{i:03d}.jpg"), 'wb') as f:
+                f.write(b'\xff\xd8' + f"{marker} page {i}".encode() * 50 + b'\xff\xd9')
+        return directory
+
+    def test_replaced_archive_is_rebuilt(self):
+        chapter = self.make_chapter('chapter1', 'one')
+        other = self.make_chapter('chapter2', 'two')
+        output_file = os.path.join(self.root, 'chapter1.cbz')
+        other_file = os.path.join(self.root, 'chapter2.cbz')
+        self.assertEqual(pack_incremental(chapter, output_file), 'packed')
+        self.assertEqual(pack_incremental(other, other_file), 'packed')
+
+        # Another chapter's archive with the same page names takes the place of ours,
+        # and a page is added so the manifest no longer matches
+        shutil.copyfile(other_file, output_file)
+        with open(os.path.join(chapter, '003.jpg'), 'wb') as f:
+            f.write(b'\xff\xd8one page 3\xff\xd9')
+        self.assertEqual(pack_incremental(chapter, output_file), 'updated')
+
+        with zipfile.ZipFile(output_file) as zipf:
+            self.assertEqual(sorted(zipf.namelist()), ['000.jpg', '001.jpg', '002.jpg', '003.jpg'])
+            for name in zipf.namelist():
+                with open(os.path.join(chapter, name), 'rb') as f:
+                    self.assertEqual(zipf.read(name), f.read())
+
+if __name__ == '__main__':
+    unittest.main()